@@ -0,0 +1,59 @@
+"""Compare the zone attribute decoding with the library accessors.
+
+Run from the repository root: python -m benchmarks.decode_benchmark
+"""
+import contextlib
+from enum import Enum
+import io
+import random
+import struct
+import timeit
+from unittest import mock
+
+from airzone.innobus import Zone
+
+from custom_components.airzone.const import AVAILABLE_ATTRIBUTES_ZONE
+from custom_components.airzone.decode import INNOBUS_ZONE_LAYOUT
+
+ZONES = 500
+
+
+def _zones(states):
+    zones = []
+    for state in states:
+        machine = mock.MagicMock()
+        machine.read_registers.return_value = state
+        zones.append(Zone(machine, 1))
+    return zones
+
+
+def library(zones):
+    for zone in zones:
+        values = {}
+        for key, attribute in AVAILABLE_ATTRIBUTES_ZONE.items():
+            value = getattr(zone, attribute)()
+            values[key] = value.value if isinstance(value, Enum) else value
+
+
+def layout(states):
+    for state in states:
+        INNOBUS_ZONE_LAYOUT.decode(state)._asdict()
+
+
+def main():
+    rand = random.Random(0)
+    states = [[rand.randrange(0x10000) for _ in range(13)] for _ in range(ZONES)]
+    buffers = [struct.pack('>13H', *state) for state in states]
+    zones = _zones(states)
+    for name, func, arg in (
+            ("library accessors", library, zones),
+            ("layout, registers", layout, states),
+            ("layout, raw buffer", layout, buffers)):
+        # The library warns on every call of its deprecated accessors
+        with contextlib.redirect_stderr(io.StringIO()):
+            best = min(timeit.repeat(lambda: func(arg), number=10, repeat=5)) / 10
+        print(f"{name:20} {best * 1000:8.2f} ms per cycle of {ZONES} zones")
+
+
+if __name__ == '__main__':
+    main()
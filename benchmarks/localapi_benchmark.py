@@ -0,0 +1,48 @@
+"""Compare the LocalAPI response decoding with the library accessors.
+
+Run from the repository root: python -m benchmarks.localapi_benchmark
+"""
+import json
+import random
+import timeit
+
+from custom_components.airzone.decode import LOCALAPI_ZONE_LAYOUT, loads
+
+ZONES = 500
+
+
+def _response(rand):
+    data = [
+        {'systemID': 1, 'zoneID': zone_id, 'name': f"Zone {zone_id}",
+         'on': rand.randrange(2), 'setpoint': rand.randrange(150, 300) / 10,
+         'roomTemp': rand.randrange(150, 300) / 10, 'maxTemp': 30, 'minTemp': 15,
+         'mode': rand.randrange(1, 8), 'units': 0, 'humidity': rand.randrange(100),
+         'air_demand': rand.randrange(2), 'floor_demand': 0, 'speed': 0,
+         'modes': [1, 2, 3, 4, 5], 'errors': []}
+        for zone_id in range(1, ZONES + 1)]
+    return json.dumps({'data': data}).encode()
+
+
+def library(content):
+    # Parsed by requests then read key by key, as the library accessors do
+    for zone in json.loads(content)['data']:
+        (zone['zoneID'], zone.get('name'), zone['on'], zone['setpoint'], zone['roomTemp'],
+         zone['maxTemp'], zone['minTemp'], zone['humidity'], zone['air_demand'],
+         zone['floor_demand'], zone['units'], zone['mode'], zone['speed'])
+
+
+def layout(content):
+    for zone in loads(content)['data']:
+        LOCALAPI_ZONE_LAYOUT.decode(zone)
+
+
+def main():
+    content = _response(random.Random(0))
+    print(f"response of {ZONES} zones, {len(content)} bytes, parsed with {loads.__module__}")
+    for name, func in (("library accessors", library), ("layout", layout)):
+        best = min(timeit.repeat(lambda: func(content), number=10, repeat=5)) / 10
+        print(f"{name:20} {best * 1000:8.2f} ms per cycle, {best * 1e6 / ZONES:6.2f} us per zone")
+
+
+if __name__ == '__main__':
+    main()
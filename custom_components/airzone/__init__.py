@@ -1,7 +1,12 @@
 """Airzone Custom Component."""
 from homeassistant import config_entries, core
+from homeassistant.exceptions import ConfigEntryNotReady
 
 from .const import DOMAIN, PLATFORMS
+from .profiler import async_setup_profiler
+from .schedule import async_setup_schedules
+from .session import async_acquire_session, async_release_session, get_session
+from .websocket import async_setup_websocket
 
 
 async def async_setup_entry(
@@ -10,14 +15,49 @@ async def async_setup_entry(
 ) -> bool:
     """Set up platform from a ConfigEntry."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    hass.data[DOMAIN][entry.entry_id] = {**entry.data, **entry.options}
 
-    # Forward the setup to the climate platform.
-    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    # Entries pointing at the same controller share one session.
+    try:
+        await async_acquire_session(hass, hass.data[DOMAIN][entry.entry_id], entry.entry_id)
+    except Exception as err:
+        raise ConfigEntryNotReady(f"Cannot connect with airzone: {err}") from err
+
+    # Forward the setup to the platforms one by one, the sensors are built
+    # from the climate devices.
+    for platform in PLATFORMS:
+        await hass.config_entries.async_forward_entry_setups(entry, [platform])
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
     
     return True
 
+
+async def async_update_options(
+    hass: core.HomeAssistant,
+    entry: config_entries.ConfigEntry
+) -> None:
+    """Apply the new options to the running session, without a reload."""
+    config = {**entry.data, **entry.options}
+    hass.data[DOMAIN][entry.entry_id] = config
+    await get_session(hass, config).async_apply_options(config)
+
+
+async def async_unload_entry(
+    hass: core.HomeAssistant,
+    entry: config_entries.ConfigEntry
+) -> bool:
+    """Unload a ConfigEntry."""
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        config = hass.data[DOMAIN].pop(entry.entry_id)
+        await async_release_session(hass, config, entry.entry_id)
+    return unload_ok
+
+
 async def async_setup(hass: core.HomeAssistant, config: dict) -> bool:
     """Set up the GitHub Custom component from yaml configuration."""
     hass.data.setdefault(DOMAIN, {})
+    await async_setup_schedules(hass)
+    async_setup_websocket(hass)
+    async_setup_profiler(hass)
     return True
@@ -1,29 +1,54 @@
 import logging
 from typing import List, Optional
 
-from homeassistant.components.climate import FAN_AUTO, ClimateEntity, HVACMode
-from homeassistant.const import ATTR_TEMPERATURE, UnitOfTemperature
+from airzone import airzone_factory
+from airzone.aido import Aido
+from homeassistant.components.climate import FAN_AUTO, HVACMode
+from homeassistant.const import (
+    ATTR_TEMPERATURE,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TIMEOUT,
+    UnitOfTemperature,
+)
 
+from .backends import AirzoneBackend, register_backend
 from .const import (
+    AIDOO_BLOCKS,
     AIDO_HVAC_MODE_MAP,
     AIDO_HVAC_MODES,
     AIDO_MODE_TO_HVAC_MAP,
     AIDO_SUPPORT_FLAGS,
+    CONF_ENDPOINTS,
+    CONF_LAST_DEVICE_ID,
+    CONF_SPEED_PERCENTAGE,
+    CONF_TRANSPORT,
+    CONF_WORKER,
+    DEFAULT_TIMEOUT,
+    FLEET_PROBE_TIMEOUT,
+    TRANSPORT_SERIAL,
 )
+from .entity import AirzoneEntity
+from .scheduler import throttle
+from .session import configure_client, discovery_abandoned, modbus_gateway
 
 _LOGGER = logging.getLogger(__name__)
 
-class Aidoo(ClimateEntity):
+class Aidoo(AirzoneEntity):
     """Representation of a Aidoo Machine."""
 
-    def __init__(self, airzone_aidoo):
-        super().__init__()
+    def __init__(self, airzone_aidoo, scheduler=None):
+        super().__init__(scheduler, AIDOO_BLOCKS)
         """Initialize the device."""
         self._name = "Aidoo "  + str(airzone_aidoo._machineId)
         _LOGGER.info("Airzone configure machine " + self._name)
         self._airzone_aidoo = airzone_aidoo
+        # Built from the gateway description, the same for the unit lifetime
+        self._unique_id = airzone_aidoo.unique_id()
         
         #TODO: the fan available modes must be configured by the setup
+        # The speed steps are static, so they are only read here.
         self._fan_modes = [FAN_AUTO] + [str(n) for n in range(1, airzone_aidoo.get_speed_steps() + 1)]        
         self._min_temp = 17
         self._max_temp = 35
@@ -46,11 +71,11 @@ class Aidoo(ClimateEntity):
 
     def turn_on(self):
         """Turn on."""
-        self._airzone_aidoo.turn_on()
+        self._command(self._airzone_aidoo.turn_on)
 
     def turn_off(self):
         """Turn off."""
-        self._airzone_aidoo.turn_off()
+        self._command(self._airzone_aidoo.turn_off)
 
     @property
     def hvac_mode(self) -> HVACMode:
@@ -77,12 +102,12 @@ class Aidoo(ClimateEntity):
             self.turn_off()
             return
 
-        self._airzone_aidoo.set_operation_mode(AIDO_HVAC_MODE_MAP[hvac_mode])       
+        self._command(self._airzone_aidoo.set_operation_mode, AIDO_HVAC_MODE_MAP[hvac_mode])       
     
     @property
     def current_temperature(self):
         """Return the current temperature."""
-        return self._airzone_aidoo.get_local_temperature()
+        return self._temperature_filter.update(self._airzone_aidoo.get_local_temperature())
 
     @property
     def target_temperature(self):
@@ -93,7 +118,8 @@ class Aidoo(ClimateEntity):
         temperature = kwargs.get(ATTR_TEMPERATURE)
         if temperature is None:
             return None
-        self._airzone_aidoo.set_signal_temperature_value(round(float(temperature), 1))
+        self._command(self._airzone_aidoo.set_signal_temperature_value,
+                      round(float(temperature), 1))
 
     @property
     def fan_mode(self) -> Optional[str]:
@@ -107,9 +133,9 @@ class Aidoo(ClimateEntity):
     def set_fan_mode(self, fan_mode: str) -> None:
         """Set new target fan mode."""
         if fan_mode == FAN_AUTO:
-            self._airzone_aidoo.set_speed('AUTO')
+            self._command(self._airzone_aidoo.set_speed, 'AUTO')
             return
-        self._airzone_aidoo.set_speed(f'SPEED_{fan_mode}')
+        self._command(self._airzone_aidoo.set_speed, f'SPEED_{fan_mode}')
 
     @property
     def fan_modes(self) -> Optional[List[str]]:
@@ -127,9 +153,125 @@ class Aidoo(ClimateEntity):
 
     @property
     def unique_id(self):
-        return self._airzone_aidoo.unique_id()
+        return self._unique_id
 
 
     async def async_update(self):
-        self._airzone_aidoo._retrieve_machine_state()
+        state, _ = await self.hass.async_add_executor_job(
+            self._refresh, self._airzone_aidoo._read_registers,
+            self._airzone_aidoo.machine_state)
+        if state is not None:
+            self._airzone_aidoo._machine_state = state
         _LOGGER.debug(str(self._airzone_aidoo))
+
+    def _register_base(self):
+        return self._airzone_aidoo._machineId, 0
+
+
+class AidooFleet:
+    """Aidoo units found behind one gateway, sharing its connection."""
+
+    def __init__(self, gateway, units):
+        self._gateway = gateway
+        self.units = units
+
+    @property
+    def machine_state(self):
+        return [unit.machine_state for unit in self.units]
+
+    def __str__(self):
+        return "Aidoo fleet " + str([unit._machineId for unit in self.units])
+
+
+def _answers(client, device_id):
+    try:
+        response = client.read_input_registers(address=0, count=1, device_id=device_id)
+    except Exception:
+        return False
+    # pymodbus returns the exception responses, the serial client raises them
+    return not (hasattr(response, 'isError') and response.isError())
+
+
+def _scan(config, gateway):
+    """Return the slave ids of the range with a unit answering.
+
+    The ids are probed one at a time over the shared connection, within
+    the discovery transaction, each probe counted against the gateway
+    rate limit. The scan stops once the discovery was abandoned.
+    """
+    device_ids = range(config[CONF_DEVICE_ID], config[CONF_LAST_DEVICE_ID] + 1)
+    client = gateway.client
+    if hasattr(client, "read_many"):
+        # Through the worker, every probe in one exchange
+        values = client.read_many([(device_id, 0, 1) for device_id in device_ids])
+        return [device_id for device_id, value in zip(device_ids, values) if value is not None]
+    serial = config.get(CONF_TRANSPORT) == TRANSPORT_SERIAL
+    if serial:
+        timeout = client.timeout
+        client.set_timeout(FLEET_PROBE_TIMEOUT)
+    else:
+        configure_client(client, FLEET_PROBE_TIMEOUT)
+    found = []
+    try:
+        for index, device_id in enumerate(device_ids):
+            if discovery_abandoned():
+                raise TimeoutError("Airzone fleet scan abandoned at id " + str(device_id))
+            if index:
+                throttle()
+            if _answers(client, device_id):
+                found.append(device_id)
+    finally:
+        if serial:
+            client.set_timeout(timeout)
+        else:
+            configure_client(client, config.get(CONF_TIMEOUT, DEFAULT_TIMEOUT))
+    return found
+
+
+def _connect_fleet(config):
+    if config.get(CONF_TRANSPORT) == TRANSPORT_SERIAL:
+        from .rtu import serial_gateway
+
+        gateway = serial_gateway(config)
+    else:
+        gateway = modbus_gateway(config)
+    device_ids = _scan(config, gateway)
+    _LOGGER.info("Airzone Aidoo fleet units " + str(device_ids))
+    units = [Aido(gateway, device_id, speed_as_per=config[CONF_SPEED_PERCENTAGE])
+             for device_id in device_ids]
+    return AidooFleet(gateway, units)
+
+
+def _connect(config):
+    if config.get(CONF_LAST_DEVICE_ID):
+        return _connect_fleet(config)
+    if config.get(CONF_TRANSPORT) == TRANSPORT_SERIAL:
+        from .rtu import serial_gateway
+
+        return Aido(serial_gateway(config), config[CONF_DEVICE_ID],
+                    speed_as_per=config[CONF_SPEED_PERCENTAGE])
+    if config.get(CONF_WORKER) or config.get(CONF_ENDPOINTS):
+        return Aido(modbus_gateway(config), config[CONF_DEVICE_ID],
+                    speed_as_per=config[CONF_SPEED_PERCENTAGE])
+    return airzone_factory(
+        config[CONF_HOST], config[CONF_PORT], config[CONF_DEVICE_ID], 'aido',
+        speed_as_per=config[CONF_SPEED_PERCENTAGE])
+
+
+def _create_entities(session):
+    if isinstance(session.machine, AidooFleet):
+        return [Aidoo(unit, session.scheduler) for unit in session.machine.units]
+    return [Aidoo(session.machine, session.scheduler)]
+
+
+register_backend(AirzoneBackend(
+    name='aidoo',
+    factory=_connect,
+    create_entities=_create_entities,
+    entity_classes=[Aidoo],
+    mappings={
+        'hvac_to_mode': AIDO_HVAC_MODE_MAP,
+        'mode_to_hvac': AIDO_MODE_TO_HVAC_MAP,
+    },
+    aliases=['aido'],
+))
@@ -0,0 +1,69 @@
+"""Registry of the Airzone system backends.
+
+Each system type lives in its own module, which registers an AirzoneBackend
+when it is imported. Modules are only imported when an entry of their type
+is set up, so unused backends and their libraries are never loaded.
+"""
+from dataclasses import dataclass, field
+import importlib
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class AirzoneBackend:
+    """What a system type provides to the integration.
+
+    factory builds the library object from the configuration and is run on
+    the executor, create_entities builds the entities of a connected session.
+    indicator, run on the executor too, reads a cheap summary of a session's
+    controller that changes with its state, None when it did not answer.
+    """
+
+    name: str
+    factory: Callable[[Dict[str, Any]], Any]
+    create_entities: Callable[[Any], List[Any]]
+    indicator: Optional[Callable[[Any], Any]] = None
+    entity_classes: List[type] = field(default_factory=list)
+    mappings: Dict[str, Dict] = field(default_factory=dict)
+    aliases: List[str] = field(default_factory=list)
+
+
+# System type -> module registering its backend
+_BACKEND_MODULES = {
+    "innobus": ".innobus",
+    "aidoo": ".aidoo",
+    # python-airzone names the Aidoo system "aido"
+    "aido": ".aidoo",
+    "localapi": ".localapi",
+}
+_BACKENDS: Dict[str, AirzoneBackend] = {}
+
+
+def register_backend_module(name, module):
+    """Declare the module providing the backend of a system type."""
+    _BACKEND_MODULES[name] = module
+
+
+def register_backend(backend):
+    """Register a backend, called by the backend module at import time."""
+    for name in [backend.name] + backend.aliases:
+        _BACKENDS[name] = backend
+
+
+def get_loaded_backend(name):
+    """Return a backend whose module is already imported."""
+    return _BACKENDS[name]
+
+
+async def async_get_backend(hass, name):
+    """Return the backend of a system type, importing its module if needed."""
+    if name not in _BACKENDS:
+        if name not in _BACKEND_MODULES:
+            raise ValueError(f"Unknown Airzone system type {name}")
+        _LOGGER.debug("Airzone loading backend " + name)
+        await hass.async_add_executor_job(
+            importlib.import_module, _BACKEND_MODULES[name], __package__)
+    return _BACKENDS[name]
@@ -0,0 +1,80 @@
+"""Controller snapshots shared by the readers of the same data."""
+import threading
+import time
+
+from .const import DEFAULT_SNAPSHOT_TTL
+
+
+class SnapshotCache:
+    """Last snapshot returned by fetch, refreshed by a single reader at a time.
+
+    get() returns the snapshot while it is younger than ttl and otherwise
+    fetches a new one. While a fetch is in flight the other readers get the
+    last snapshot right away instead of fetching again, only the first read
+    of an empty cache waits. A forced get waits for the fetch in flight, it
+    may have started before a command, and then fetches again.
+    """
+
+    def __init__(self, fetch, ttl=DEFAULT_SNAPSHOT_TTL, clock=time.monotonic):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._in_flight = False
+        self._snapshot = None
+        self._updated = None
+        self.fetches = 0
+        self.collapsed = 0
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def age(self):
+        """Return the seconds since the last fetch, None if never fetched."""
+        if self._updated is None:
+            return None
+        return self._clock() - self._updated
+
+    def invalidate(self):
+        """Fetch on the next get whatever the age of the snapshot."""
+        with self._lock:
+            self._updated = None
+
+    def get(self, *args, force=False):
+        """Return the snapshot, fetching it with args when it is stale."""
+        with self._lock:
+            if not force:
+                age = self.age()
+                if age is not None and age < self.ttl:
+                    return self._snapshot
+                if self._in_flight and self._updated is not None:
+                    self.collapsed += 1
+                    return self._snapshot
+            while self._in_flight:
+                self._done.wait()
+                if not force and self._updated is not None:
+                    return self._snapshot
+            self._in_flight = True
+        try:
+            snapshot = self._fetch(*args)
+        except Exception:
+            with self._lock:
+                self._in_flight = False
+                self._done.notify_all()
+            raise
+        with self._lock:
+            self._snapshot = snapshot
+            self._updated = self._clock()
+            self.fetches += 1
+            self._in_flight = False
+            self._done.notify_all()
+        return snapshot
+
+    def diagnostics(self):
+        return {
+            "age": self.age(),
+            "fetches": self.fetches,
+            "collapsed": self.collapsed,
+        }
@@ -2,18 +2,14 @@ import logging
 from typing import Any, Dict, Optional
 
 from homeassistant import config_entries, core
-from homeassistant.const import CONF_DEVICE_CLASS, CONF_DEVICE_ID, CONF_HOST, CONF_PORT
+from homeassistant.const import CONF_DEVICE_CLASS, CONF_HOST, CONF_PORT
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 
-from .const import (
-    CONF_SPEED_PERCENTAGE,
-    DEFAULT_DEVICE_CLASS,
-    DEFAULT_DEVICE_ID,
-    DEFAULT_SPEED_AS_PER,
-    DOMAIN,
-    SYSTEM_TYPES,
-)
+from .backends import async_get_backend
+from .const import CONF_POLL_BUDGET, DOMAIN
+from .schema import CONTROLLER_DEFAULTS, TUNING_DEFAULTS, option_fields
+from .session import close_machine, poll_budget, session_key
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -21,35 +17,48 @@ AIRZONE_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_HOST): cv.string,
         vol.Required(CONF_PORT, default=7000): vol.Coerce(int),
-        vol.Optional(CONF_DEVICE_ID, default=DEFAULT_DEVICE_ID): int,
-        vol.Optional(CONF_DEVICE_CLASS, default=DEFAULT_DEVICE_CLASS): vol.In(SYSTEM_TYPES),
-        vol.Optional(CONF_SPEED_PERCENTAGE, default=DEFAULT_SPEED_AS_PER): cv.boolean        
-
+        **option_fields(CONTROLLER_DEFAULTS),
     }
 )
 
+
+def options_schema(config):
+    """Return the schema of the options, defaulting to the values in use."""
+    defaults = {key: config.get(key, default) for key, default in TUNING_DEFAULTS.items()}
+    defaults[CONF_POLL_BUDGET] = poll_budget(config)
+    return vol.Schema(option_fields(defaults))
+
+
 class AirzoneConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Github Custom config flow."""
 
     data: Optional[Dict[str, Any]]
 
+    @staticmethod
+    @core.callback
+    def async_get_options_flow(config_entry):
+        return AirzoneOptionsFlow(config_entry)
+
     async def async_step_user(self, user_input: Optional[Dict[str, Any]] = None):
         """Invoked when a user initiates a flow via the user interface."""
         errors: Dict[str, str] = {}
         if user_input is not None:
+            # One entry per controller, duplicates would poll it twice
+            await self.async_set_unique_id(session_key(user_input))
+            self._abort_if_unique_id_configured()
 
-            from airzone import airzone_factory
-            port = user_input[CONF_PORT]
-            host = user_input[CONF_HOST]
-            machine_id = user_input[CONF_DEVICE_ID]
-            system_class = user_input[CONF_DEVICE_CLASS]
-            aidoo_args = {"speed_as_per": user_input[CONF_SPEED_PERCENTAGE]}    
+            m = None
             try:
-                m = await self.hass.async_add_executor_job(lambda: airzone_factory(host, port, machine_id, system_class, **aidoo_args))
+                backend = await async_get_backend(self.hass, user_input[CONF_DEVICE_CLASS])
+                m = await self.hass.async_add_executor_job(backend.factory, user_input)
                 if not m.machine_state:
                     errors["base"] = "connection"
             except:
                 errors["base"] = "connection"
+            finally:
+                # Only built to validate, the entry connects on its own
+                if m is not None:
+                    await self.hass.async_add_executor_job(close_machine, m)
             if not errors:
                 self.data = user_input
 
@@ -58,3 +67,17 @@ class AirzoneConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         return self.async_show_form(
             step_id="user", data_schema=AIRZONE_SCHEMA, errors=errors
         )
+
+
+class AirzoneOptionsFlow(config_entries.OptionsFlow):
+    """Tune a running entry, the changes apply without reconnecting."""
+
+    def __init__(self, config_entry):
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input: Optional[Dict[str, Any]] = None):
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        config = {**self.config_entry.data, **self.config_entry.options}
+        return self.async_show_form(step_id="init", data_schema=options_schema(config))
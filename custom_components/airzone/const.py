@@ -2,8 +2,36 @@ DOMAIN = "airzone"
 DEFAULT_DEVICE_ID = 1
 DEFAULT_DEVICE_CLASS = 'innobus'
 DEFAULT_SPEED_AS_PER = False
+DEFAULT_RATE_LIMIT = 10
+DEFAULT_RATE_BURST = 10
+DEFAULT_FRAME_GAP = 20
+# The reporting filters are off unless configured
+DEFAULT_TEMPERATURE_DEADBAND = 0
+DEFAULT_TEMPERATURE_STEP = 0
+DEFAULT_HUMIDITY_DEADBAND = 0
+DEFAULT_HUMIDITY_STEP = 0
+DEFAULT_REPORT_MAX_AGE = 900
+DEFAULT_MAX_CONCURRENT_REFRESH = 4
+DEFAULT_SNAPSHOT_TTL = 2
+DEFAULT_TRANSPORT = 'tcp'
+DEFAULT_BAUDRATE = 0
+DEFAULT_TIMEOUT = 3
+DEFAULT_RETRIES = 0
 SYSTEM_TYPES = ["innobus", "aidoo", "localapi"]
-from airzone.localapi import OperationMode
+TRANSPORT_SERIAL = 'serial'
+TRANSPORTS = [DEFAULT_TRANSPORT, TRANSPORT_SERIAL]
+DATA_SCHEDULERS = "schedulers"
+DATA_SESSIONS = "sessions"
+DATA_SESSION_LOCKS = "session_locks"
+DATA_DISCOVERY = "discovery"
+DATA_POLLER = "poller"
+DATA_ZONE_STORE = "zone_store"
+DATA_SCHEDULE = "schedule"
+DATA_BUILDING = "building_state"
+DATA_PROFILES = "profiles"
+BUILDING = "building"
+from datetime import timedelta
+
 from homeassistant.components.climate import (
     FAN_AUTO,
     FAN_HIGH,
@@ -15,7 +43,49 @@ from homeassistant.components.climate import (
 )
 from homeassistant.const import Platform
 
-PLATFORMS = [Platform.CLIMATE]
+PLATFORMS = [Platform.CLIMATE, Platform.SENSOR]
+
+SCAN_INTERVAL = timedelta(seconds=10)
+
+# Refresh tiers: fast-changing values are read every cycle, setpoints and
+# modes less often and limits / topology only hourly or on demand.
+TIER_FAST = 'fast'
+TIER_MEDIUM = 'medium'
+TIER_SLOW = 'slow'
+DEFAULT_TIER_INTERVALS = {TIER_FAST: 0, TIER_MEDIUM: 60, TIER_SLOW: 3600}
+
+# Runtime accounting: samples further apart than the max gap (s) are not
+# credited, the duty cycle is averaged over the window (s).
+RUNTIME_STORAGE_VERSION = 1
+RUNTIME_SAVE_DELAY = 60
+RUNTIME_MAX_GAP = 300
+DUTY_CYCLE_WINDOW = 3600
+
+# Schedules: transitions due within the batch window (s) are written
+# together, one batch per controller.
+SCHEDULE_STORAGE_VERSION = 1
+SCHEDULE_BATCH_WINDOW = 1
+SERVICE_SET_SCHEDULE = "set_schedule"
+SERVICE_CLEAR_SCHEDULE = "clear_schedule"
+ATTR_TRANSITIONS = "transitions"
+ATTR_AT = "at"
+ATTR_WEEKDAYS = "weekdays"
+
+# Register blocks (start, count) read for each tier.
+INNOBUS_MACHINE_BLOCKS = {
+    TIER_FAST: [(0, 1)],    # operation mode
+    TIER_SLOW: [(0, 21)],
+}
+INNOBUS_ZONE_BLOCKS = {
+    TIER_FAST: [(9, 2)],    # zone state flags, local temperature
+    TIER_MEDIUM: [(0, 4)],  # zone mode, limits, setpoint
+    TIER_SLOW: [(0, 13)],
+}
+AIDOO_BLOCKS = {
+    TIER_FAST: [(2, 1)],    # local temperature
+    TIER_MEDIUM: [(0, 6)],  # on/off, setpoint, mode, speed, louvres
+    TIER_SLOW: [(0, 7)],
+}
 
 
 ### Innobus Extra Attributes
@@ -51,6 +121,44 @@ AVAILABLE_ATTRIBUTES_ZONE = {
     ATTR_DIF_CURRENT_TEMP: 'get_dif_current_temp'
 }
 
+# (register, first bit, bits) of the zone attributes in the 13 registers
+# zone block, decoded straight from the block by decode.RegisterLayout.
+INNOBUS_ZONE_FIELDS = {
+    ATTR_IS_ZONE_GRID_OPENED: (9, 0, 1),
+    ATTR_IS_GRID_MOTOR_ACTIVE: (9, 1, 1),
+    ATTR_IS_GRID_MOTOR_REQUESTED: (9, 2, 1),
+    ATTR_IS_FLOOR_ACTIVE: (9, 5, 1),
+    ATTR_LOCAL_MODULE_FANCOIL: (9, 6, 1),
+    ATTR_IS_REQUESTING_AIR: (9, 7, 1),
+    ATTR_IS_OCCUPIED: (9, 8, 1),
+    ATTR_IS_WINDOWS_OPENED: (9, 9, 1),
+    ATTR_FANCOIL_SPEED: (9, 10, 2),
+    ATTR_PROPORTIONAL_APERTURE: (9, 12, 2),
+    ATTR_TACTO_CONNECTED: (9, 14, 1),
+    ATTR_IS_AUTOMATIC_MODE: (0, 1, 1),
+    ATTR_IS_TACTO_ON: (0, 2, 1),
+}
+INNOBUS_ZONE_REGISTERS = 13
+
+# (key, default when missing or null) of the LocalAPI zone objects decoded
+# by decode.JsonLayout. The system fields (mode, speed, units) come in every
+# zone object, the first one stands for the machine.
+LOCALAPI_ZONE_FIELDS = {
+    'zone_id': ('zoneID', 0),
+    'name': ('name', None),
+    'on': ('on', 0),
+    'setpoint': ('setpoint', None),
+    'room_temp': ('roomTemp', None),
+    'max_temp': ('maxTemp', None),
+    'min_temp': ('minTemp', None),
+    'humidity': ('humidity', None),
+    'air_demand': ('air_demand', 0),
+    'floor_demand': ('floor_demand', 0),
+    'units': ('units', 0),
+    'mode': ('mode', 1),
+    'speed': ('speed', 0),
+}
+
 ZONE_HVAC_MODES = [HVACMode.AUTO, HVACMode.HEAT_COOL,  HVACMode.OFF]
 PRESET_SLEEP = 'SLEEP'
 ZONE_PRESET_MODES = [PRESET_NONE, PRESET_SLEEP]
@@ -80,15 +188,6 @@ LOCALAPI_MACHINE_HVAC_MODES = [ HVACMode.OFF,
                             HVACMode.AUTO] 
 
 
-LOCALAPI_HVAC_MODE_MAP = {
-    HVACMode.OFF: OperationMode.STOP,
-    HVACMode.COOL: OperationMode.COOLING,
-    HVACMode.HEAT: OperationMode.HEATING,
-    HVACMode.FAN_ONLY: OperationMode.FAN,
-    HVACMode.DRY: OperationMode.DRY,
-    HVACMode.AUTO: OperationMode.AUTO
-}
-
 LOCALAPI_MODE_TO_HVAC_MAP = {
     'STOP':  HVACMode.OFF,
     'COOLING':  HVACMode.COOL,
@@ -104,6 +203,125 @@ LOCALAPI_MODE_TO_HVAC_MAP = {
 
 CONF_SPEED_PERCENTAGE = "speed_as_percentage"
 
+# Gateway rate limiting: transactions per second, burst and the minimum gap
+# in milliseconds between two transactions.
+CONF_RATE_LIMIT = "rate_limit"
+CONF_RATE_BURST = "rate_burst"
+CONF_FRAME_GAP = "frame_gap"
+
+# Modbus transport: through a TCP gateway or RTU on a serial port given as
+# host. A baud rate of 0 is detected when connecting.
+CONF_TRANSPORT = "transport"
+CONF_BAUDRATE = "baudrate"
+
+# Reporting filters: changes of the current temperature / humidity below the
+# deadband are held back until they accumulate or max_age seconds pass.
+CONF_TEMPERATURE_DEADBAND = "temperature_deadband"
+CONF_TEMPERATURE_STEP = "temperature_step"
+CONF_HUMIDITY_DEADBAND = "humidity_deadband"
+CONF_HUMIDITY_STEP = "humidity_step"
+CONF_REPORT_MAX_AGE = "report_max_age"
+
+# Floor the zones of the controller are aggregated in, the controller
+# itself when not set.
+CONF_FLOOR = "floor"
+
+# Options applied live to a running entry: poll interval, transport timeout
+# and retries of a failed read (scan_interval and timeout are the core keys),
+# refreshes running at once and the medium / slow tier intervals.
+CONF_RETRIES = "retries"
+CONF_MAX_CONCURRENT_REFRESH = "max_concurrent_refresh"
+CONF_MEDIUM_INTERVAL = "medium_interval"
+CONF_SLOW_INTERVAL = "slow_interval"
+
+# Entities of a controller failing in a row before the rest of the refresh
+# pass is skipped and marked unavailable, so an unreachable controller costs
+# the same few timeouts whatever its number of zones.
+OUTAGE_THRESHOLD = 2
+
+# Retries of the entities failing a refresh pass (CONF_RETRIES) wait
+# RETRY_BACKOFF seconds, twice as long on each retry up to RETRY_BACKOFF_MAX.
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 4
+
+# Aidoo fleet: every slave id from device_id to last_device_id is probed in
+# turn over the connection the units found then share. A poll refreshes at
+# most poll_budget units round-robin, 0 refreshes them all.
+CONF_LAST_DEVICE_ID = "last_device_id"
+CONF_POLL_BUDGET = "poll_budget"
+DEFAULT_FLEET_POLL_BUDGET = 10
+FLEET_PROBE_TIMEOUT = 0.5
+
+# Startup: controllers discovered at once across every entry, and the time
+# (s) a discovery may take before its entry is retried later. A fleet scan
+# gets the time of its probes on top.
+MAX_CONCURRENT_DISCOVERY = 8
+DISCOVERY_TIMEOUT = 30
+
+# Change indicator: each poll first reads a summary of the controller, the
+# entities are only refreshed when it changed or after max_staleness seconds
+# (0, the default, refreshes them every poll). On Innobus it is the operation
+# mode and the zone demand relays of the machine block, read in one request,
+# so a room temperature or setpoint change alone waits for max_staleness.
+CONF_MAX_STALENESS = "max_staleness"
+DEFAULT_MAX_STALENESS = 0
+INNOBUS_INDICATOR_BLOCK = (0, 14)
+INNOBUS_INDICATOR_REGISTERS = (0, 13)
+
+# Modbus TCP transport in a worker subprocess (see worker.py), the register
+# blocks of a refresh pass are read in one exchange with it.
+CONF_WORKER = "worker"
+
+# Other paths to the same controller (see failover.py), a comma separated
+# list of host[:port] of Modbus TCP gateways or LocalAPI webservers. The
+# latency of an endpoint is the EWMA of its requests, a failed one is left
+# out for ENDPOINT_COOLDOWN seconds, doubling up to ENDPOINT_MAX_COOLDOWN,
+# and a standby one is used every ENDPOINT_PROBE_INTERVAL seconds.
+CONF_ENDPOINTS = "endpoints"
+ENDPOINT_EWMA_ALPHA = 0.3
+ENDPOINT_COOLDOWN = 10
+ENDPOINT_MAX_COOLDOWN = 300
+ENDPOINT_PROBE_INTERVAL = 60
+
+# Sent by a session after each refresh, the websocket subscribers get the
+# changes of its entities in one message.
+SIGNAL_REFRESHED = f"{DOMAIN}_refreshed"
+WS_TYPE_SNAPSHOT = f"{DOMAIN}/snapshot"
+WS_TYPE_SUBSCRIBE = f"{DOMAIN}/subscribe"
+
+# Telemetry log, opt-in: the snapshot of every refresh is appended to
+# delta-encoded files of up to TELEMETRY_FILE_SIZE bytes under
+# TELEMETRY_DIR. The oldest files go past max_size (MB) or max_age (days).
+# Snapshots are written every TELEMETRY_FLUSH_INTERVAL seconds or
+# TELEMETRY_FLUSH_RECORDS records, at most TELEMETRY_MAX_BUFFER are kept
+# when the disk is slower than the polls.
+CONF_TELEMETRY = "telemetry"
+CONF_TELEMETRY_MAX_SIZE = "telemetry_max_size"
+CONF_TELEMETRY_MAX_AGE = "telemetry_max_age"
+DEFAULT_TELEMETRY_MAX_SIZE = 50
+DEFAULT_TELEMETRY_MAX_AGE = 30
+TELEMETRY_DIR = "airzone_telemetry"
+TELEMETRY_FILE_SIZE = 1024 * 1024
+TELEMETRY_FLUSH_INTERVAL = 60
+TELEMETRY_FLUSH_RECORDS = 100
+TELEMETRY_MAX_BUFFER = 10000
+
+# Profiling service: the threads working for a controller are sampled every
+# PROFILE_INTERVAL seconds over its next cycles refreshes, written under
+# PROFILE_DIR. A profile ends after PROFILE_CYCLE_TIMEOUT seconds per cycle
+# on top of the scan interval even if the refreshes did not come. The file
+# suffix of each output format.
+SERVICE_PROFILE = "profile"
+ATTR_CONFIG_ENTRY = "config_entry"
+ATTR_CYCLES = "cycles"
+ATTR_FORMAT = "format"
+PROFILE_FORMATS = {"collapsed": ".folded", "pstats": ".prof"}
+DEFAULT_PROFILE_CYCLES = 5
+MAX_PROFILE_CYCLES = 100
+PROFILE_INTERVAL = 0.005
+PROFILE_CYCLE_TIMEOUT = 60
+PROFILE_DIR = "airzone_profiles"
+
 AIDO_HVAC_MODES = [HVACMode.AUTO, 
                    HVACMode.FAN_ONLY, 
                    HVACMode.HEAT, 
@@ -0,0 +1,84 @@
+"""Decoding of Modbus register blocks and LocalAPI responses into typed records."""
+from collections import namedtuple
+import struct
+
+from .const import (
+    ATTR_DIF_CURRENT_TEMP,
+    INNOBUS_ZONE_FIELDS,
+    INNOBUS_ZONE_REGISTERS,
+    LOCALAPI_ZONE_FIELDS,
+)
+
+try:
+    # Shipped with Home Assistant, json is only the fallback
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+loads = _json.loads
+
+
+class RegisterLayout:
+    """Precompiled bit fields of a register block.
+
+    fields maps each record field to its (register, first bit, bits) and
+    derived to a function of the registers. decode() accepts the registers
+    or the raw big endian response buffer, which is unpacked in place, and
+    extracts every field with a shift and a mask instead of a call per flag.
+    """
+
+    def __init__(self, name, fields, registers, derived=None):
+        derived = derived or {}
+        self.record = namedtuple(name, list(fields) + list(derived))
+        self._fields = tuple(
+            (register, shift, (1 << bits) - 1) for register, shift, bits in fields.values())
+        self._derived = tuple(derived.values())
+        self._struct = struct.Struct('>%dH' % registers)
+
+    def registers(self, buffer):
+        """Return the registers of a raw buffer, sequences are used as they are."""
+        if isinstance(buffer, (bytes, bytearray, memoryview)):
+            return self._struct.unpack_from(buffer)
+        return buffer
+
+    def decode(self, buffer):
+        """Return the record of a register block, None for a missing block."""
+        if buffer is None:
+            return None
+        regs = self.registers(buffer)
+        values = [(regs[register] >> shift) & mask for register, shift, mask in self._fields]
+        values.extend(func(regs) for func in self._derived)
+        return self.record._make(values)
+
+
+class JsonLayout:
+    """Precompiled fields of a JSON object.
+
+    fields maps each record field to its (key, default). decode() looks up
+    only those keys, unknown keys are ignored and a missing or null one
+    gets its default, so older firmwares decode like the current ones.
+    """
+
+    def __init__(self, name, fields):
+        self.record = namedtuple(name, list(fields))
+        self._fields = tuple(fields.values())
+
+    def decode(self, obj):
+        """Return the record of an object, None for a missing object."""
+        if obj is None:
+            return None
+        get = obj.get
+        return self.record._make([
+            default if (value := get(key)) is None else value for key, default in self._fields])
+
+
+def _dif_current_temp(regs):
+    # Setpoint minus local temperature, both in tenths of degree
+    return (regs[3] - regs[10]) / 10
+
+
+INNOBUS_ZONE_LAYOUT = RegisterLayout(
+    'InnobusZoneRecord', INNOBUS_ZONE_FIELDS, INNOBUS_ZONE_REGISTERS,
+    derived={ATTR_DIF_CURRENT_TEMP: _dif_current_temp})
+
+LOCALAPI_ZONE_LAYOUT = JsonLayout('LocalAPIZoneRecord', LOCALAPI_ZONE_FIELDS)
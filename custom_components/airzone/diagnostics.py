@@ -0,0 +1,21 @@
+"""Diagnostics support for Airzone."""
+from homeassistant import config_entries, core
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.const import CONF_HOST
+
+from .const import DOMAIN
+from .session import get_session
+
+TO_REDACT = {CONF_HOST}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: core.HomeAssistant,
+    entry: config_entries.ConfigEntry
+) -> dict:
+    """Return diagnostics for a config entry."""
+    config = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "config": async_redact_data(dict(config), TO_REDACT),
+        "session": get_session(hass, config).diagnostics(),
+    }
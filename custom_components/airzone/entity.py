@@ -0,0 +1,175 @@
+"""Base entity for the Airzone integration."""
+from homeassistant.components.climate import ClimateEntity, ClimateEntityFeature
+from homeassistant.core import callback
+
+from .const import (
+    CONF_HUMIDITY_DEADBAND,
+    CONF_HUMIDITY_STEP,
+    CONF_MEDIUM_INTERVAL,
+    CONF_REPORT_MAX_AGE,
+    CONF_SLOW_INTERVAL,
+    CONF_TEMPERATURE_DEADBAND,
+    CONF_TEMPERATURE_STEP,
+    DEFAULT_HUMIDITY_DEADBAND,
+    DEFAULT_HUMIDITY_STEP,
+    DEFAULT_REPORT_MAX_AGE,
+    DEFAULT_TEMPERATURE_DEADBAND,
+    DEFAULT_TEMPERATURE_STEP,
+    DEFAULT_TIER_INTERVALS,
+    TIER_FAST,
+    TIER_MEDIUM,
+    TIER_SLOW,
+)
+from .cache import SnapshotCache
+from .filters import ReportFilter
+from .scheduler import (
+    PRIORITY_COMMAND,
+    PRIORITY_CONFIRM,
+    PRIORITY_POLL,
+    RequestScheduler,
+)
+from .tiers import TierTracker, merge_block
+
+
+class AirzoneEntity(ClimateEntity):
+    """Climate entity whose controller I/O goes through a RequestScheduler.
+
+    blocks is the tiered register map read by the entity, see TierTracker.
+    Its reads go through a SnapshotCache so overlapping updates, a manual
+    update_entity during a poll, only read the controller once.
+    Entities are refreshed by the refresh loop of their AirzoneSession.
+    """
+
+    _attr_should_poll = False
+
+    def __init__(self, scheduler=None, blocks=None):
+        self._scheduler = scheduler or RequestScheduler()
+        self._tiers = TierTracker(blocks or {TIER_SLOW: []})
+        self._confirm_pending = False
+        self._snapshot = SnapshotCache(self._refresh_blocks)
+        self._temperature_filter = ReportFilter(
+            DEFAULT_TEMPERATURE_DEADBAND, DEFAULT_TEMPERATURE_STEP, DEFAULT_REPORT_MAX_AGE)
+        self._humidity_filter = ReportFilter(
+            DEFAULT_HUMIDITY_DEADBAND, DEFAULT_HUMIDITY_STEP, DEFAULT_REPORT_MAX_AGE)
+
+    def configure_reporting(self, config):
+        """Apply the reporting filters of the entry configuration."""
+        max_age = config.get(CONF_REPORT_MAX_AGE, DEFAULT_REPORT_MAX_AGE)
+        self._temperature_filter.configure(
+            config.get(CONF_TEMPERATURE_DEADBAND, DEFAULT_TEMPERATURE_DEADBAND),
+            config.get(CONF_TEMPERATURE_STEP, DEFAULT_TEMPERATURE_STEP),
+            max_age)
+        self._humidity_filter.configure(
+            config.get(CONF_HUMIDITY_DEADBAND, DEFAULT_HUMIDITY_DEADBAND),
+            config.get(CONF_HUMIDITY_STEP, DEFAULT_HUMIDITY_STEP),
+            max_age)
+
+    def configure_refresh(self, config):
+        """Apply the tier intervals of the entry options."""
+        self._tiers.set_intervals({
+            TIER_MEDIUM: config.get(CONF_MEDIUM_INTERVAL, DEFAULT_TIER_INTERVALS[TIER_MEDIUM]),
+            TIER_SLOW: config.get(CONF_SLOW_INTERVAL, DEFAULT_TIER_INTERVALS[TIER_SLOW]),
+        })
+
+    def _command(self, func, *args, **kwargs):
+        """Send a user command ahead of any pending poll."""
+        result = self._scheduler.run(PRIORITY_COMMAND, func, *args, **kwargs)
+        if not self._confirm_pending and self.entity_id is not None:
+            # Nothing polls the entity after a service call, read it back now
+            self.schedule_update_ha_state(True)
+        self._confirm_pending = True
+        self._tiers.invalidate(TIER_FAST, TIER_MEDIUM)
+        return result
+
+    def _confirm(self, func, *args, **kwargs):
+        """Read back the state affected by a command."""
+        return self._scheduler.run(PRIORITY_CONFIRM, func, *args, **kwargs)
+
+    def _poll_priority(self):
+        """Return the priority of the next update.
+
+        The update that follows a command is its confirmation read.
+        """
+        if self._confirm_pending:
+            self._confirm_pending = False
+            return PRIORITY_CONFIRM
+        return PRIORITY_POLL
+
+    def _get_snapshot(self, cache, *args):
+        """Return the snapshot of cache, forcing a fetch to confirm a command."""
+        priority = self._poll_priority()
+        return cache.get(priority, *args, force=priority == PRIORITY_CONFIRM)
+
+    def _refresh(self, read, state):
+        """Refresh the due register blocks through the entity snapshot."""
+        return self._get_snapshot(self._snapshot, read, state)
+
+    def _refresh_blocks(self, priority, read, state):
+        """Read the register blocks that are due, one transaction each.
+
+        Returns the merged state and the tiers that were refreshed. A failed
+        block makes the entity unavailable, the tiers read before it are
+        kept and only the others are read again by the retry of the session.
+        """
+        tiers, blocks = self._tiers.plan()
+        done = set()
+        for start, count in blocks:
+            values = self._scheduler.run(priority, read, start, count)
+            # The library returns no registers for an exception response,
+            # a gateway whose zone module did not answer
+            if not values:
+                break
+            state = merge_block(state, start, values)
+            done.add((start, count))
+        tiers = self._tiers.covered(tiers, done)
+        self._tiers.mark_done(tiers)
+        self._attr_available = len(done) == len(blocks)
+        return state, tiers
+
+    def expire(self):
+        """Read the controller on the next update, to retry a failed one."""
+        self._snapshot.invalidate()
+
+    def _register_base(self):
+        """Return the unit and first register of the blocks, None if not read by blocks."""
+        return None
+
+    def register_reads(self):
+        """Return the (unit, address, count) input register reads of the next refresh."""
+        base = self._register_base()
+        if base is None:
+            return []
+        unit, first = base
+        _, blocks = self._tiers.plan()
+        return [(unit, first + start, count) for start, count in blocks]
+
+    def telemetry(self):
+        """Return the values of the last refresh, unfiltered, for the telemetry log."""
+        values = {
+            "available": self.available,
+            "hvac_mode": self.hvac_mode,
+            "hvac_action": self.hvac_action,
+            "temperature": self._temperature_filter.raw,
+            "humidity": self._humidity_filter.raw,
+            "target_temperature": self.target_temperature,
+        }
+        # As in the state attributes, only read when supported
+        if self.supported_features & ClimateEntityFeature.FAN_MODE:
+            values["fan_mode"] = self.fan_mode
+        if self.supported_features & ClimateEntityFeature.PRESET_MODE:
+            values["preset_mode"] = self.preset_mode
+        return values
+
+    @callback
+    def async_mark_unavailable(self):
+        """Mark the entity unavailable without reading the controller."""
+        self._attr_available = False
+        self.async_write_ha_state()
+
+    def _metadata_due(self):
+        """Return True when names, units and limits should be read again."""
+        tiers, _ = self._tiers.plan()
+        if TIER_SLOW not in tiers:
+            return False
+        self._tiers.mark_done(tiers)
+        return True
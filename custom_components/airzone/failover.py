@@ -0,0 +1,179 @@
+"""Failover between several endpoints reaching the same controller."""
+import logging
+import time
+
+import voluptuous as vol
+
+from .const import (
+    ENDPOINT_COOLDOWN,
+    ENDPOINT_EWMA_ALPHA,
+    ENDPOINT_MAX_COOLDOWN,
+    ENDPOINT_PROBE_INTERVAL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Modbus exception code of a gateway without a path to the bus, the other
+# gateways may have one. A unit not answering (0x0B) is not the gateway's.
+GATEWAY_PATH_UNAVAILABLE = 0x0A
+
+
+def parse_endpoints(value, port):
+    """Return the (host, port) of a comma separated list of host[:port]."""
+    endpoints = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, item_port = item.partition(":")
+        endpoints.append((host, int(item_port) if item_port else port))
+    return endpoints
+
+
+def valid_endpoints(value):
+    """Validate a list of endpoints of the configuration."""
+    try:
+        endpoints = parse_endpoints(value, 0)
+    except ValueError as err:
+        raise vol.Invalid("Invalid endpoints " + str(value)) from err
+    if any(not host or not 0 <= port < 65536 for host, port in endpoints):
+        raise vol.Invalid("Invalid endpoints " + str(value))
+    return value
+
+
+class Endpoint:
+    """Health and latency of one path to the controller."""
+
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self.latency = None
+        self.used_at = None
+        self.failures = 0
+        self.retry_at = 0
+        self.requests = 0
+
+
+class EndpointRouter:
+    """Send each request to the fastest healthy endpoint, failing over.
+
+    The latency of an endpoint is the exponentially weighted moving
+    average of its requests. A failed endpoint is left out for
+    ENDPOINT_COOLDOWN seconds, twice as long after each failure in a row
+    up to ENDPOINT_MAX_COOLDOWN, and the request goes to the next one.
+    With every endpoint down the first one back is tried alone. A standby
+    endpoint gets a request every ENDPOINT_PROBE_INTERVAL seconds, so its
+    latency stays current.
+    """
+
+    def __init__(self, names, clock=time.monotonic):
+        self.endpoints = [Endpoint(index, name) for index, name in enumerate(names)]
+        self._clock = clock
+        self.failovers = 0
+
+    def order(self, now):
+        """Return the endpoints to try for a request, in order."""
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.retry_at <= now]
+        if not healthy:
+            return [min(self.endpoints, key=lambda endpoint: endpoint.retry_at)]
+
+        def rank(endpoint):
+            # Not measured yet or due a probe first, then the fastest
+            if endpoint.latency is None or now - endpoint.used_at >= ENDPOINT_PROBE_INTERVAL:
+                return (0, 0)
+            return (1, endpoint.latency)
+
+        return sorted(healthy, key=rank)
+
+    def run(self, request):
+        """Return request(index) through the best endpoint that answers it."""
+        error = None
+        for attempt, endpoint in enumerate(self.order(self._clock())):
+            start = self._clock()
+            endpoint.requests += 1
+            endpoint.used_at = start
+            try:
+                result = request(endpoint.index)
+            except Exception as err:
+                self._failed(endpoint, start)
+                _LOGGER.debug("Airzone endpoint " + endpoint.name + " failed: " + str(err))
+                error = err
+                continue
+            elapsed = self._clock() - start
+            endpoint.latency = elapsed if endpoint.latency is None else \
+                ENDPOINT_EWMA_ALPHA * elapsed + (1 - ENDPOINT_EWMA_ALPHA) * endpoint.latency
+            endpoint.failures = 0
+            if attempt:
+                self.failovers += 1
+                _LOGGER.info("Airzone failed over to endpoint " + endpoint.name)
+            return result
+        raise error
+
+    def _failed(self, endpoint, now):
+        endpoint.failures += 1
+        endpoint.retry_at = now + min(
+            ENDPOINT_COOLDOWN * 2 ** (endpoint.failures - 1), ENDPOINT_MAX_COOLDOWN)
+
+    def diagnostics(self):
+        now = self._clock()
+        return {
+            "failovers": self.failovers,
+            "endpoints": [{
+                "name": endpoint.name,
+                "healthy": endpoint.retry_at <= now,
+                "latency": endpoint.latency,
+                "failures": endpoint.failures,
+                "requests": endpoint.requests,
+            } for endpoint in self.endpoints],
+        }
+
+
+class FailoverModbusClient:
+    """Modbus client sending each request through the best of several clients.
+
+    Exceptions, and the answers of a gateway without a path to the bus,
+    fail the request over to the next client, see EndpointRouter.
+    """
+
+    def __init__(self, clients, names):
+        self.clients = clients
+        self.router = EndpointRouter(names)
+
+    def connect(self):
+        connected = False
+        for client in self.clients:
+            try:
+                connected = bool(client.connect()) or connected
+            except Exception as err:
+                _LOGGER.debug("Airzone cannot connect " + str(client) + ": " + str(err))
+        return connected
+
+    def _request(self, method, **kwargs):
+        def request(index):
+            response = getattr(self.clients[index], method)(**kwargs)
+            if getattr(response, "exception_code", None) == GATEWAY_PATH_UNAVAILABLE:
+                raise ConnectionError("Gateway path unavailable")
+            return response
+
+        return self.router.run(request)
+
+    def read_input_registers(self, address, count=1, device_id=1):
+        return self._request(
+            "read_input_registers", address=address, count=count, device_id=device_id)
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        return self._request(
+            "read_holding_registers", address=address, count=count, device_id=device_id)
+
+    def write_register(self, address, value, device_id=1):
+        return self._request(
+            "write_register", address=address, value=value, device_id=device_id)
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+    def __str__(self):
+        # The library builds the unique ids of the entities from it, they
+        # stay the ones of the configured gateway whatever the endpoints
+        return str(self.clients[0])
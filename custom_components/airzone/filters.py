@@ -0,0 +1,49 @@
+"""Reporting filters for noisy sensor values."""
+import time
+
+# Float tolerance when comparing a change with the deadband
+_EPSILON = 1e-6
+
+
+class ReportFilter:
+    """Quantize a value and hold back changes smaller than a deadband.
+
+    Changes below the deadband are held until they accumulate past it or
+    the reported value is older than max_age seconds. The filter compares
+    against the last reported value, so reading the same raw value again
+    is idempotent and it can be applied from a property.
+    """
+
+    def __init__(self, deadband=0, step=0, max_age=900, clock=time.monotonic):
+        self._clock = clock
+        self.configure(deadband, step, max_age)
+        self._reported = None
+        self._reported_at = None
+        self.raw = None
+
+    def configure(self, deadband, step, max_age):
+        """Change the filter settings."""
+        self.deadband = float(deadband)
+        self.step = float(step)
+        self.max_age = float(max_age)
+
+    def quantize(self, value):
+        """Round value to the filter step."""
+        if not self.step:
+            return value
+        return round(round(value / self.step) * self.step, 6)
+
+    def update(self, value):
+        """Return the value to report for a new raw value."""
+        self.raw = value
+        if value is None:
+            return None
+        value = self.quantize(value)
+        now = self._clock()
+        if (self._reported is None
+                or abs(value - self._reported) + _EPSILON >= self.deadband
+                or now - self._reported_at >= self.max_age):
+            if value != self._reported or self._reported_at is None:
+                self._reported_at = now
+            self._reported = value
+        return self._reported
@@ -1,18 +1,27 @@
-from enum import Enum
 import logging
 from typing import List, Optional
 
+from airzone.innobus import Machine, OperationMode
 from homeassistant.components.climate import (
     PRESET_NONE,
-    ClimateEntity,
     ClimateEntityFeature,
     HVACAction,
     HVACMode,
 )
-from homeassistant.const import ATTR_TEMPERATURE, UnitOfTemperature
+from homeassistant.const import (
+    ATTR_TEMPERATURE,
+    CONF_DEVICE_ID,
+    UnitOfTemperature,
+)
 
+from .backends import AirzoneBackend, register_backend
 from .const import (
     AVAILABLE_ATTRIBUTES_ZONE,
+    CONF_TRANSPORT,
+    INNOBUS_INDICATOR_BLOCK,
+    INNOBUS_INDICATOR_REGISTERS,
+    INNOBUS_MACHINE_BLOCKS,
+    INNOBUS_ZONE_BLOCKS,
     MACHINE_HVAC_MODES,
     MACHINE_PRESET_MODES,
     MACHINE_SUPPORT_FLAGS,
@@ -20,22 +29,28 @@ from .const import (
     PRESET_COMBINED_MODE,
     PRESET_FLOOR_MODE,
     PRESET_SLEEP,
+    TIER_SLOW,
+    TRANSPORT_SERIAL,
     ZONE_FAN_MODES,
     ZONE_FAN_MODES_R,
     ZONE_HVAC_MODES,
     ZONE_PRESET_MODES,
     ZONE_SUPPORT_FLAGS,
 )
+from .decode import INNOBUS_ZONE_LAYOUT
+from .entity import AirzoneEntity
+from .session import modbus_gateway
 
 _LOGGER = logging.getLogger(__name__)
 
 
 
-class InnobusZone(ClimateEntity):
+class InnobusZone(AirzoneEntity):
     """Representation of a Innobus Zone."""
 
-    def __init__(self, airzone_zone):
+    def __init__(self, airzone_zone, scheduler=None):
         """Initialize the device."""
+        super().__init__(scheduler, INNOBUS_ZONE_BLOCKS)
         self._name = "Airzone Zone "  + str(airzone_zone._zone_id)
         _LOGGER.info("Airzone configure zone " + self._name)
         self._airzone_zone = airzone_zone
@@ -67,11 +82,11 @@ class InnobusZone(ClimateEntity):
 
     def turn_on(self):
         """Turn on."""
-        self._airzone_zone.turn_on()
+        self._command(self._airzone_zone.turn_on)
 
     def turn_off(self):
         """Turn off."""
-        self._airzone_zone.turn_off()
+        self._command(self._airzone_zone.turn_off)
 
     @property
     def hvac_mode(self) -> HVACMode:
@@ -97,17 +112,17 @@ class InnobusZone(ClimateEntity):
     def set_hvac_mode(self, hvac_mode: HVACMode) -> None:
         """Set new target hvac mode."""
         if hvac_mode == HVACMode.OFF:
-            self._airzone_zone.turnoff_tacto()
+            self._command(self._airzone_zone.turnoff_tacto)
 
         elif hvac_mode == HVACMode.HEAT_COOL:
-            self._airzone_zone.turnoff_automatic_mode()
-            self._airzone_zone.retrieve_zone_state()
-            self._airzone_zone.turnon_tacto()
+            self._command(self._airzone_zone.turnoff_automatic_mode)
+            self._confirm(self._airzone_zone.retrieve_zone_state)
+            self._command(self._airzone_zone.turnon_tacto)
 
         elif hvac_mode == HVACMode.AUTO:
-            self._airzone_zone.turnon_automatic_mode()
-            self._airzone_zone.retrieve_zone_state()
-            self._airzone_zone.turnon_tacto()
+            self._command(self._airzone_zone.turnon_automatic_mode)
+            self._confirm(self._airzone_zone.retrieve_zone_state)
+            self._command(self._airzone_zone.turnon_tacto)
 
     @property
     def hvac_action(self) -> HVACAction | None:
@@ -130,7 +145,7 @@ class InnobusZone(ClimateEntity):
     @property
     def current_temperature(self):
         """Return the current temperature."""
-        return self._airzone_zone.local_temperature
+        return self._temperature_filter.update(self._airzone_zone.local_temperature)
 
     @property
     def target_temperature(self):
@@ -141,7 +156,8 @@ class InnobusZone(ClimateEntity):
         temperature = kwargs.get(ATTR_TEMPERATURE)
         if temperature is None:
             return None
-        self._airzone_zone.set_signal_temperature_value(round(float(temperature), 1))
+        self._command(self._airzone_zone.set_signal_temperature_value,
+                      round(float(temperature), 1))
 
     @property
     def preset_mode(self) -> Optional[str]:
@@ -162,9 +178,9 @@ class InnobusZone(ClimateEntity):
     def set_preset_mode(self, preset_mode: str) -> None:
         """Set new preset mode."""
         if preset_mode == PRESET_NONE:
-            self._airzone_zone.turnoff_sleep()
+            self._command(self._airzone_zone.turnoff_sleep)
         else:
-            self._airzone_zone.turnon_sleep()
+            self._command(self._airzone_zone.turnon_sleep)
 
     @property
     def fan_mode(self) -> Optional[str]:
@@ -182,7 +198,7 @@ class InnobusZone(ClimateEntity):
 
     def set_fan_mode(self, fan_mode: str) -> None:
         """Set new target fan mode."""
-        self._airzone_zone.set_speed_selection(ZONE_FAN_MODES[fan_mode])
+        self._command(self._airzone_zone.set_speed_selection, ZONE_FAN_MODES[fan_mode])
 
     @property
     def unique_id(self):
@@ -190,28 +206,35 @@ class InnobusZone(ClimateEntity):
 
 
     def update(self):
-        self._airzone_zone.retrieve_zone_state()
-        self._state_attrs.update(
-                {key: self._extract_value_from_attribute(self._airzone_zone, value) for
-                 key, value in self._available_attributes.items()})
-        self._attr_max_temp = self._airzone_zone.max_temp
-        self._attr_min_temp = self._airzone_zone.min_temp
+        state, tiers = self._refresh(
+            self._read_zone_registers, self._airzone_zone.zone_state)
+        self._airzone_zone.zone_state = state
+        record = INNOBUS_ZONE_LAYOUT.decode(state)
+        if record is not None:
+            self._state_attrs.update(record._asdict())
+        if TIER_SLOW in tiers:
+            self._attr_max_temp = self._airzone_zone.max_temp
+            self._attr_min_temp = self._airzone_zone.min_temp
         _LOGGER.debug(str(self._airzone_zone))
 
-    @staticmethod
-    def _extract_value_from_attribute(state, attribute):
-        func = getattr(state, attribute)
-        value = func()
-        if isinstance(value, Enum):
-            return value.value
-        return value
+    def telemetry(self):
+        # Every decoded zone attribute as well
+        return {**super().telemetry(), **self._state_attrs}
+
+    def _register_base(self):
+        return self._airzone_zone._machine._machineId, self._airzone_zone.base_zone
 
+    def _read_zone_registers(self, address, num_registers):
+        return self._airzone_zone._machine.read_registers(
+            self._airzone_zone.base_zone + address, num_registers)
 
-class InnobusMachine(ClimateEntity):
+
+class InnobusMachine(AirzoneEntity):
     """Representation of a Innobus Machine."""
 
-    def __init__(self, airzone_machine):
+    def __init__(self, airzone_machine, scheduler=None):
         """Initialize the device."""
+        super().__init__(scheduler, INNOBUS_MACHINE_BLOCKS)
         self._name = "Airzone Machine "  + str(airzone_machine._machineId)
         _LOGGER.info("Airzone configure machine " + self._name)
         self._airzone_machine = airzone_machine
@@ -236,7 +259,6 @@ class InnobusMachine(ClimateEntity):
         """Return hvac operation ie. heat, cool mode.
         Need to be one of HVAC_MODE_*.
         """
-        from airzone.innobus import OperationMode
         current_op = self._airzone_machine.operation_mode
         if current_op in [OperationMode.HOT, OperationMode.HOT_AIR, OperationMode.HOTPLUS]:
             return HVACMode.HEAT
@@ -257,23 +279,23 @@ class InnobusMachine(ClimateEntity):
     def set_hvac_mode(self, hvac_mode: HVACMode) -> None:
         """Set new target hvac mode."""
         if hvac_mode == HVACMode.OFF:
-            self._airzone_machine.operation_mode = 'STOP'
+            self._set_operation_mode('STOP')
             return
         if hvac_mode == HVACMode.COOL:
-            self._airzone_machine.operation_mode = 'COLD'
+            self._set_operation_mode('COLD')
             return
         if hvac_mode == HVACMode.FAN_ONLY:
-            self._airzone_machine.operation_mode = 'AIR'
+            self._set_operation_mode('AIR')
             return
         if hvac_mode == HVACMode.HEAT:
             if self.preset_mode == PRESET_COMBINED_MODE:
-                self._airzone_machine.operation_mode = 'HOTPLUS'
+                self._set_operation_mode('HOTPLUS')
                 return
             if self.preset_mode == PRESET_AIR_MODE:
-                self._airzone_machine.operation_mode = 'HOT_AIR'
+                self._set_operation_mode('HOT_AIR')
                 return
             if self.preset_mode == PRESET_FLOOR_MODE:
-                self._airzone_machine.operation_mode = 'HOT'
+                self._set_operation_mode('HOT')
                 return
 
 
@@ -301,19 +323,80 @@ class InnobusMachine(ClimateEntity):
         """Set new preset mode."""
         if self.hvac_mode == HVACMode.HEAT:
             if preset_mode == PRESET_FLOOR_MODE:
-                self._airzone_machine.operation_mode = 'HOT'
+                self._set_operation_mode('HOT')
                 return
             if preset_mode == PRESET_AIR_MODE:
-                self._airzone_machine.operation_mode = 'HOT_AIR'
+                self._set_operation_mode('HOT_AIR')
                 return
             if preset_mode == PRESET_COMBINED_MODE:
-                self._airzone_machine.operation_mode = 'HOTPLUS'
+                self._set_operation_mode('HOTPLUS')
+
+    def _set_operation_mode(self, operation_mode):
+        self._command(setattr, self._airzone_machine, 'operation_mode', operation_mode)
 
     @property
     def unique_id(self):
         return self._airzone_machine.unique_id
 
+    def _register_base(self):
+        return self._airzone_machine._machineId, 0
 
     async def async_update(self):
-        self._airzone_machine._retrieve_machine_state()
+        # Each zone entity reads its own block, so only the machine block is
+        # read here and a command never waits behind a whole system refresh.
+        state, _ = await self.hass.async_add_executor_job(
+            self._refresh, self._airzone_machine.read_registers,
+            self._airzone_machine.machine_state)
+        if state is not None:
+            self._airzone_machine._machine_state = state
         _LOGGER.debug(str(self._airzone_machine))
+
+
+class _Machine(Machine):
+    """Innobus machine reading each zone once when discovering them.
+
+    The library reads every zone again right after creating it, doubling
+    the requests of the startup.
+    """
+
+    def update_zones(self):
+        if not self._zones:
+            # Each zone reads its state when created
+            self.discover_zones()
+            return
+        super().update_zones()
+
+
+def _connect(config):
+    if config.get(CONF_TRANSPORT) == TRANSPORT_SERIAL:
+        from .rtu import serial_gateway
+
+        return _Machine(serial_gateway(config), config[CONF_DEVICE_ID])
+    return _Machine(modbus_gateway(config), config[CONF_DEVICE_ID])
+
+
+def _create_entities(session):
+    machine = session.machine
+    return [InnobusMachine(machine, session.scheduler)] + \
+        [InnobusZone(z, session.scheduler) for z in machine.zones]
+
+
+def _indicator(session):
+    state = session.machine.read_registers(*INNOBUS_INDICATOR_BLOCK)
+    if not state or len(state) < INNOBUS_INDICATOR_BLOCK[1]:
+        return None
+    # The clock in the block changes every minute, only these are compared
+    return tuple(state[register] for register in INNOBUS_INDICATOR_REGISTERS)
+
+
+register_backend(AirzoneBackend(
+    name='innobus',
+    factory=_connect,
+    create_entities=_create_entities,
+    indicator=_indicator,
+    entity_classes=[InnobusMachine, InnobusZone],
+    mappings={
+        'fan_modes': ZONE_FAN_MODES,
+        'fan_modes_r': ZONE_FAN_MODES_R,
+    },
+))
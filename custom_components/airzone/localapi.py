@@ -1,31 +1,148 @@
+from functools import partial
+import hashlib
 import logging
 from typing import List, Optional
 
-from homeassistant.components.climate import (
-    FAN_AUTO,
-    ClimateEntity,
-    HVACAction,
-    HVACMode,
+from airzone.localapi import API, Machine, OperationMode, Speed, TempUnits
+from homeassistant.components.climate import FAN_AUTO, HVACAction, HVACMode
+from homeassistant.const import (
+    ATTR_TEMPERATURE,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TIMEOUT,
+    UnitOfTemperature,
 )
-from homeassistant.const import ATTR_TEMPERATURE, UnitOfTemperature
+import requests
 
+from .backends import AirzoneBackend, register_backend
+from .cache import SnapshotCache
 from .const import (
-    LOCALAPI_HVAC_MODE_MAP,
+    CONF_ENDPOINTS,
+    DEFAULT_TIMEOUT,
     LOCALAPI_MACHINE_HVAC_MODES,
     LOCALAPI_MACHINE_SUPPORT_FLAGS,
     LOCALAPI_MODE_TO_HVAC_MAP,
     LOCALAPI_ZONE_HVAC_MODES,
     LOCALAPI_ZONE_SUPPORT_FLAGS,
 )
+from .decode import LOCALAPI_ZONE_LAYOUT, loads
+from .entity import AirzoneEntity
+from .failover import EndpointRouter, parse_endpoints
 
 _LOGGER = logging.getLogger(__name__)
 
-
-class LocalAPIZone(ClimateEntity):
+LOCALAPI_HVAC_MODE_MAP = {
+    HVACMode.OFF: OperationMode.STOP,
+    HVACMode.COOL: OperationMode.COOLING,
+    HVACMode.HEAT: OperationMode.HEATING,
+    HVACMode.FAN_ONLY: OperationMode.FAN,
+    HVACMode.DRY: OperationMode.DRY,
+    HVACMode.AUTO: OperationMode.AUTO
+}
+
+
+class LocalAPIClient(API):
+    """LocalAPI client with a request timeout, reusing its HTTP connection.
+
+    The library client waits forever on a silent controller and returns
+    None on errors, leaving the last state in place. Here a failed request
+    raises, so a refresh can tell an unreachable controller from an
+    unchanged one.
+
+    The system response is parsed once and decoded into records, see
+    decode.JsonLayout, that the entities read instead of the library
+    accessors. An unchanged response is neither parsed nor decoded again.
+
+    endpoints are other (host, port) webservers of the same system, each
+    request goes to the best one, see EndpointRouter.
+    """
+
+    def __init__(self, machine_ipaddr, port=3000, timeout=DEFAULT_TIMEOUT, endpoints=()):
+        super().__init__(machine_ipaddr, port)
+        self.timeout = timeout
+        self._session = requests.Session()
+        endpoints = [(machine_ipaddr, port)] + list(endpoints)
+        self._urls = [f"http://{host}:{port}/api/v1/hvac" for host, port in endpoints]
+        self.router = EndpointRouter([f"{host}:{port}" for host, port in endpoints])
+        self._system_state = None
+        self._data = None
+        self.digest = None
+        self.records = {}
+        self.system_record = None
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def discover(self, system_id):
+        """Return the machine of the system, in a single request.
+
+        The library reads each zone on its own when creating it, here the
+        zones come from the system state read first.
+        """
+        self._system_state = []
+        try:
+            return Machine(self, system_id)
+        finally:
+            self._system_state = None
+
+    def retrieve_state(self, system_id, zone_id):
+        if zone_id and self._system_state:
+            return [zone for zone in self._system_state if zone['zoneID'] == zone_id]
+        response = self.router.run(
+            partial(self._request, 'post', {'SystemID': system_id, 'ZoneID': zone_id}))
+        if zone_id:
+            return loads(response.content)['data']
+        digest = hashlib.sha1(response.content).digest()
+        if digest != self.digest:
+            data = loads(response.content)['data']
+            records = [LOCALAPI_ZONE_LAYOUT.decode(zone) for zone in data]
+            self._data = data
+            self.records = {record.zone_id: record for record in records}
+            # The system fields of the machine are the ones of its first zone
+            self.system_record = records[0] if records else None
+            self.digest = digest
+        if self._system_state is not None:
+            self._system_state = self._data
+        return self._data
+
+    def set_zone_parameter_value(self, machine_id, zone_id, parameter, value):
+        data = {'systemID': machine_id, 'zoneID': zone_id, parameter: value}
+        self.router.run(partial(self._request, 'put', data))
+        return value
+
+    def _request(self, method, data, index):
+        response = self._session.request(
+            method, url=self._urls[index], json=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def close(self):
+        self._session.close()
+
+
+def _fetch_state(machine, scheduler, priority):
+    # The whole system comes in a single request, zones included
+    try:
+        scheduler.run(priority, machine.retrieve_machine_state, True)
+    except (requests.RequestException, ValueError, KeyError) as err:
+        _LOGGER.debug("Airzone LocalAPI refresh failed: " + str(err))
+        return None
+    return machine.machine_state
+
+
+def _machine_cache(machine, scheduler):
+    """Return the snapshot cache shared by the entities of a system."""
+    return SnapshotCache(partial(_fetch_state, machine, scheduler))
+
+
+class LocalAPIZone(AirzoneEntity):
     """Representation of a LocalAPI Zone."""
 
-    def __init__(self, airzone_zone):        
-        """Initialize the device."""        
+    def __init__(self, airzone_zone, scheduler=None, cache=None):
+        """Initialize the device."""
+        super().__init__(scheduler)
+        self._cache = cache or _machine_cache(airzone_zone.machine, self._scheduler)
         self.airzone_zone = airzone_zone        
         _LOGGER.info("Airzone configure zone " + self._name)
         
@@ -37,11 +154,21 @@ class LocalAPIZone(ClimateEntity):
     @airzone_zone.setter
     def airzone_zone(self, value):
         self._airzone_zone = value
-        self._name = value.name
-        from airzone.localapi import TempUnits
-        self._units = UnitOfTemperature.CELSIUS 
-        if value.units == TempUnits.FAHRENHEIT:
-            self._units = UnitOfTemperature.FAHRENHEIT        
+        self._refresh_metadata()
+
+    @property
+    def _record(self):
+        return self._airzone_zone._api.records.get(self._airzone_zone._zone_id)
+
+    def _refresh_metadata(self):
+        # Name and units only change when the system is reconfigured
+        record = self._record
+        self._name = self._airzone_zone.name
+        if record is not None and record.name is not None:
+            self._name = record.name
+        self._units = UnitOfTemperature.CELSIUS
+        if record is not None and record.units == TempUnits.FAHRENHEIT:
+            self._units = UnitOfTemperature.FAHRENHEIT
 
     @property
     def name(self):
@@ -60,18 +187,21 @@ class LocalAPIZone(ClimateEntity):
 
     def turn_on(self):
         """Turn on."""
-        self.airzone_zone.turn_on()
+        self._command(self.airzone_zone.turn_on)
 
     def turn_off(self):
         """Turn off."""
-        self.airzone_zone.turn_off()
+        self._command(self.airzone_zone.turn_off)
 
     @property
     def hvac_mode(self) -> HVACMode:
         """Return hvac operation ie. heat, cool mode.
         Need to be one of HVAC_MODE_*.
         """
-        if self.airzone_zone.is_on():            
+        record = self._record
+        if record is None:
+            return None
+        if record.on:
             return HVACMode.HEAT_COOL  
         else:
             return HVACMode.OFF
@@ -86,17 +216,21 @@ class LocalAPIZone(ClimateEntity):
     def set_hvac_mode(self, hvac_mode: HVACMode) -> None:
         """Set new target hvac mode."""
         if hvac_mode == HVACMode.OFF:
-            self.airzone_zone.turn_off()
+            self._command(self.airzone_zone.turn_off)
 
         elif hvac_mode == HVACMode.HEAT_COOL:
-            self.airzone_zone.turn_on()
+            self._command(self.airzone_zone.turn_on)
             
     @property
     def hvac_action(self) -> Optional[HVACAction]:
         """Return the current running hvac operation."""    
-        op_mode = self.airzone_zone.machine.operation_mode.name
+        record = self._record
+        system_record = self._airzone_zone._api.system_record
+        if record is None or system_record is None:
+            return None
+        op_mode = OperationMode(system_record.mode).name
          
-        if self.airzone_zone.floor_demand == 1 or self.airzone_zone.air_demand == 1:
+        if record.floor_demand == 1 or record.air_demand == 1:
             if op_mode == 'HEATING':
                 return HVACAction.HEATING
             if op_mode == 'COOLING':
@@ -110,48 +244,66 @@ class LocalAPIZone(ClimateEntity):
     @property
     def current_temperature(self):
         """Return the current temperature."""
-        return self.airzone_zone.local_temperature
+        record = self._record
+        return self._temperature_filter.update(None if record is None else record.room_temp)
 
     @property
     def target_temperature(self):
-        return self.airzone_zone.signal_temperature_value
+        record = self._record
+        return None if record is None else record.setpoint
 
     def set_temperature(self, **kwargs):
         """Set new target temperature."""
         temperature = kwargs.get(ATTR_TEMPERATURE)
         if temperature is None:
             return None
-        self.airzone_zone.signal_temperature_value = round(float(temperature), 1)
+        self._command(setattr, self.airzone_zone, 'signal_temperature_value',
+                      round(float(temperature), 1))
 
         
     @property
     def min_temp(self):
-        return self.airzone_zone.min_temp
+        record = self._record
+        if record is None or record.min_temp is None:
+            return super().min_temp
+        return record.min_temp
 
     @property
     def max_temp(self):
-        return self.airzone_zone.max_temp
+        record = self._record
+        if record is None or record.max_temp is None:
+            return super().max_temp
+        return record.max_temp
     
     @property
     def current_humidity(self):
-        return self.airzone_zone.room_humidity
+        record = self._record
+        return self._humidity_filter.update(None if record is None else record.humidity)
 
     @property
     def unique_id(self):
         return self.airzone_zone.unique_id
     
+    def expire(self):
+        self._cache.invalidate()
+
     def update(self):
-        # The update has already being done by the machine
-        pass
-        #self.airzone_zone.retrieve_zone_state()
+        # The system snapshot is shared with the machine, a zone only
+        # fetches it when it is stale or to confirm a command.
+        self._attr_available = self._get_snapshot(self._cache) is not None \
+            and self._record is not None
+        if self._metadata_due():
+            self._refresh_metadata()
 
             
 
-class LocalAPIMachine(ClimateEntity):
+class LocalAPIMachine(AirzoneEntity):
     """Representation of a LocalAPI Machine."""
 
-    def __init__(self, airzone_machine):
-        """Initialize the device."""        
+    def __init__(self, airzone_machine, scheduler=None, cache=None):
+        """Initialize the device."""
+        super().__init__(scheduler)
+        self._cache = cache or _machine_cache(airzone_machine, self._scheduler)
         self._name = "Airzone Machine "  + str(airzone_machine._machine_id)
         self._fan_modes = [FAN_AUTO] + [str(n) for n in range(1, 8)]
         _LOGGER.info("Airzone configure machine " + self._name)
@@ -163,13 +315,20 @@ class LocalAPIMachine(ClimateEntity):
     
     @airzone_machine.setter
     def airzone_machine(self, value):
-        self._airzone_machine = value        
-        from airzone.localapi import TempUnits
-        self._units = UnitOfTemperature.CELSIUS 
-        if value.units == TempUnits.FAHRENHEIT:
+        self._airzone_machine = value
+        self._refresh_metadata()
+
+    @property
+    def _record(self):
+        return self._airzone_machine._api.system_record
+
+    def _refresh_metadata(self):
+        # Units only change when the system is reconfigured
+        self._units = UnitOfTemperature.CELSIUS
+        if self._record is not None and self._record.units == TempUnits.FAHRENHEIT:
             self._units = UnitOfTemperature.FAHRENHEIT
 
-    
+
     @property
     def supported_features(self):
         """Return the list of supported features."""
@@ -196,7 +355,9 @@ class LocalAPIMachine(ClimateEntity):
     def fan_mode(self) -> Optional[str]:
         """Return the fan setting.        
         """        
-        fan_mode = self.airzone_machine.speed.value
+        if self._record is None:
+            return None
+        fan_mode = Speed(self._record.speed).value
         if fan_mode == 0:
             return FAN_AUTO
         return str(fan_mode)
@@ -204,9 +365,9 @@ class LocalAPIMachine(ClimateEntity):
     def set_fan_mode(self, fan_mode: str) -> None:
         """Set new target fan mode."""
         if fan_mode == FAN_AUTO:
-            self.airzone_machine.speed = 0
+            self._command(setattr, self.airzone_machine, 'speed', 0)
             return
-        self.airzone_machine.speed = int(fan_mode)
+        self._command(setattr, self.airzone_machine, 'speed', int(fan_mode))
 
     @property
     def fan_modes(self) -> Optional[List[str]]:
@@ -220,7 +381,9 @@ class LocalAPIMachine(ClimateEntity):
         """Return hvac operation ie. heat, cool mode.
         Need to be one of HVAC_MODE_*.
         """        
-        current_op = self.airzone_machine.operation_mode.name
+        if self._record is None:
+            return None
+        current_op = OperationMode(self._record.mode).name
         return LOCALAPI_MODE_TO_HVAC_MAP[current_op]        
 
     @property
@@ -232,22 +395,30 @@ class LocalAPIMachine(ClimateEntity):
 
     def set_hvac_mode(self, hvac_mode: HVACMode) -> None:
         """Set new target hvac mode."""
-        new_op = LOCALAPI_HVAC_MODE_MAP[hvac_mode]     
-        self.airzone_machine.operation_mode = new_op            
+        new_op = LOCALAPI_HVAC_MODE_MAP[hvac_mode]
+        self._command(setattr, self.airzone_machine, 'operation_mode', new_op)            
 
     @property
     def unique_id(self):
         return self.airzone_machine.unique_id
 
-    def update(self):                
-        self.airzone_machine.retrieve_machine_state(True)
+    def expire(self):
+        self._cache.invalidate()
+
+    def update(self):
+        # The LocalAPI returns the whole system in a single request, the
+        # slow tier only decides when the metadata is derived again.
+        self._attr_available = self._get_snapshot(self._cache) is not None
+        if self._metadata_due():
+            self._refresh_metadata()
 
 
-class LocalAPIOneZone(ClimateEntity):
+class LocalAPIOneZone(AirzoneEntity):
     """Representation of a LocalApi Machine with only one zone."""
 
-    def __init__(self, airzone_machine):
-        super().__init__()
+    def __init__(self, airzone_machine, scheduler=None, cache=None):
+        super().__init__(scheduler)
+        self._cache = cache or _machine_cache(airzone_machine, self._scheduler)
         self._name = "Airzone Machine "  + str(airzone_machine._machine_id)
         self._fan_modes = [FAN_AUTO] + [str(n) for n in range(1, 8)]                        
         self.airzone_machine = airzone_machine          
@@ -260,11 +431,7 @@ class LocalAPIOneZone(ClimateEntity):
     
     @airzone_machine.setter
     def airzone_machine(self, value):
-        self._airzone_machine = value        
-        from airzone.localapi import TempUnits
-        self._units = UnitOfTemperature.CELSIUS 
-        if value.units == TempUnits.FAHRENHEIT:
-            self._units = UnitOfTemperature.FAHRENHEIT
+        self._airzone_machine = value
         # We can access directly to the only zone available        
         temp_z = [z for z in value.zones]       
         self.airzone_zone = temp_z[0]
@@ -279,7 +446,26 @@ class LocalAPIOneZone(ClimateEntity):
     @airzone_zone.setter
     def airzone_zone(self, value):        
         self._airzone_zone = value
-        self._name = value.name       
+        self._refresh_metadata()
+
+    @property
+    def _record(self):
+        return self._airzone_machine._api.records.get(self._airzone_zone._zone_id)
+
+    @property
+    def _system_record(self):
+        return self._airzone_machine._api.system_record
+
+    def _refresh_metadata(self):
+        # Name and units only change when the system is reconfigured
+        record = self._record
+        self._name = self._airzone_zone.name
+        if record is not None and record.name is not None:
+            self._name = record.name
+        self._units = UnitOfTemperature.CELSIUS
+        if self._system_record is not None and \
+                self._system_record.units == TempUnits.FAHRENHEIT:
+            self._units = UnitOfTemperature.FAHRENHEIT
 
     @property
     def name(self):
@@ -299,21 +485,23 @@ class LocalAPIOneZone(ClimateEntity):
 
     def turn_on(self):
         """Turn on."""
-        self._airzone_zone.turn_on()
+        self._command(self._airzone_zone.turn_on)
 
     def turn_off(self):
         """Turn off."""
-        self._airzone_zone.turn_off()
+        self._command(self._airzone_zone.turn_off)
 
     @property
     def hvac_mode(self) -> HVACMode:
         """Return hvac operation ie. heat, cool mode.
         Need to be one of HVAC_MODE_*.
         """
-        if not self.airzone_zone.is_on():
+        if self._record is None or self._system_record is None:
+            return None
+        if not self._record.on:
             return HVACMode.OFF
                     
-        current_op = self.airzone_machine.operation_mode.name
+        current_op = OperationMode(self._system_record.mode).name
         return LOCALAPI_MODE_TO_HVAC_MAP[current_op]         
 
 
@@ -329,17 +517,20 @@ class LocalAPIOneZone(ClimateEntity):
         if hvac_mode == HVACMode.OFF:
             self.turn_off()
             return
-        if not self.airzone_zone.is_on():
+        if self._record is None or not self._record.on:
             self.turn_on()
-        new_op = LOCALAPI_HVAC_MODE_MAP[hvac_mode]     
-        self.airzone_machine.operation_mode = new_op
+        new_op = LOCALAPI_HVAC_MODE_MAP[hvac_mode]
+        self._command(setattr, self.airzone_machine, 'operation_mode', new_op)
 
     @property
     def hvac_action(self) -> Optional[HVACAction]:
         """Return the current running hvac operation."""    
-        op_mode = self.airzone_machine.operation_mode.name
+        record = self._record
+        if record is None or self._system_record is None:
+            return None
+        op_mode = OperationMode(self._system_record.mode).name
          
-        if self.airzone_zone.floor_demand == 1 or self.airzone_zone.air_demand == 1:
+        if record.floor_demand == 1 or record.air_demand == 1:
             if op_mode == 'HEATING':
                 return HVACAction.HEATING
             if op_mode == 'COOLING':
@@ -353,24 +544,29 @@ class LocalAPIOneZone(ClimateEntity):
     @property
     def current_temperature(self):
         """Return the current temperature."""
-        return self.airzone_zone.local_temperature
+        record = self._record
+        return self._temperature_filter.update(None if record is None else record.room_temp)
 
     @property
     def target_temperature(self):
-        return self.airzone_zone.signal_temperature_value
+        record = self._record
+        return None if record is None else record.setpoint
 
     def set_temperature(self, **kwargs):
         """Set new target temperature."""
         temperature = kwargs.get(ATTR_TEMPERATURE)
         if temperature is None:
             return None
-        self.airzone_zone.signal_temperature_value = round(float(temperature), 1)
+        self._command(setattr, self.airzone_zone, 'signal_temperature_value',
+                      round(float(temperature), 1))
 
     @property
     def fan_mode(self) -> Optional[str]:
         """Return the fan setting.        
         """        
-        fan_mode = self.airzone_machine.speed.value
+        if self._system_record is None:
+            return None
+        fan_mode = Speed(self._system_record.speed).value
         if fan_mode == 0:
             return FAN_AUTO
         return str(fan_mode)
@@ -378,9 +574,9 @@ class LocalAPIOneZone(ClimateEntity):
     def set_fan_mode(self, fan_mode: str) -> None:
         """Set new target fan mode."""
         if fan_mode == FAN_AUTO:
-            self.airzone_machine.speed = 0
+            self._command(setattr, self.airzone_machine, 'speed', 0)
             return
-        self.airzone_machine.speed = int(fan_mode)
+        self._command(setattr, self.airzone_machine, 'speed', int(fan_mode))
 
     @property
     def fan_modes(self) -> Optional[List[str]]:
@@ -389,23 +585,64 @@ class LocalAPIOneZone(ClimateEntity):
         return self._fan_modes
     
     @property
-    def min_temp(self):        
-        return self.airzone_zone.min_temp
+    def min_temp(self):
+        record = self._record
+        if record is None or record.min_temp is None:
+            return super().min_temp
+        return record.min_temp
 
     @property
-    def max_temp(self):        
-        return self.airzone_zone.max_temp
+    def max_temp(self):
+        record = self._record
+        if record is None or record.max_temp is None:
+            return super().max_temp
+        return record.max_temp
     
     @property
     def current_humidity(self):
-        return self.airzone_zone.room_humidity
+        record = self._record
+        return self._humidity_filter.update(None if record is None else record.humidity)
 
     @property
     def unique_id(self):
         return self.airzone_zone.unique_id
 
 
+    def expire(self):
+        self._cache.invalidate()
+
     def update(self):
         # TODO: review if only one update is needed
-        self.airzone_machine.retrieve_machine_state(True)        
+        self._attr_available = self._get_snapshot(self._cache) is not None \
+            and self._record is not None
+        if self._metadata_due():
+            self._refresh_metadata()
         #self.airzone_zone.retrieve_zone_state()
+
+
+def _connect(config):
+    api = LocalAPIClient(config[CONF_HOST], config[CONF_PORT],
+                         config.get(CONF_TIMEOUT, DEFAULT_TIMEOUT),
+                         parse_endpoints(config.get(CONF_ENDPOINTS), config[CONF_PORT]))
+    return api.discover(config[CONF_DEVICE_ID])
+
+
+def _create_entities(session):
+    machine = session.machine
+    cache = _machine_cache(machine, session.scheduler)
+    if len(machine.zones) == 1:
+        return [LocalAPIOneZone(machine, session.scheduler, cache)]
+    return [LocalAPIMachine(machine, session.scheduler, cache)] + \
+        [LocalAPIZone(z, session.scheduler, cache) for z in machine.zones]
+
+
+register_backend(AirzoneBackend(
+    name='localapi',
+    factory=_connect,
+    create_entities=_create_entities,
+    entity_classes=[LocalAPIMachine, LocalAPIZone, LocalAPIOneZone],
+    mappings={
+        'hvac_to_mode': LOCALAPI_HVAC_MODE_MAP,
+        'mode_to_hvac': LOCALAPI_MODE_TO_HVAC_MAP,
+    },
+))
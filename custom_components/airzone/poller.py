@@ -0,0 +1,97 @@
+"""Domain wide scheduling of the controller refreshes."""
+import asyncio
+from functools import partial
+import logging
+import time
+import zlib
+
+from homeassistant.core import HassJob
+from homeassistant.helpers.event import async_call_later
+
+from .const import DATA_POLLER, DEFAULT_MAX_CONCURRENT_REFRESH, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """Spread the refreshes of every controller over their interval.
+
+    Controllers are ranked by a hash of their key and given evenly spaced
+    phases within the interval. Phases are aligned to the wall clock, so a
+    controller refreshes at the same offset after a restart instead of all
+    of them starting together. At most max_concurrent refreshes run at once.
+    """
+
+    def __init__(self, hass, max_concurrent=DEFAULT_MAX_CONCURRENT_REFRESH):
+        self.hass = hass
+        self._refreshes = {}
+        self._intervals = {}
+        self._phases = {}
+        self._timers = {}
+        self._running = set()
+        self.max_concurrent = max_concurrent
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def set_max_concurrent(self, max_concurrent):
+        """Change how many refreshes may run at the same time."""
+        if max_concurrent != self.max_concurrent:
+            self.max_concurrent = max_concurrent
+            self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def phase(self, key):
+        """Return the offset in seconds of a controller within its interval."""
+        return self._phases[key]
+
+    def async_register(self, key, refresh, interval):
+        """Refresh a controller every interval seconds, returns the unregister."""
+        self._refreshes[key] = refresh
+        self._intervals[key] = interval
+        self._async_rebalance()
+        return partial(self._async_unregister, key)
+
+    def _async_unregister(self, key):
+        self._refreshes.pop(key, None)
+        self._intervals.pop(key, None)
+        self._async_rebalance()
+
+    def _async_rebalance(self):
+        for cancel in self._timers.values():
+            cancel()
+        self._timers = {}
+        keys = sorted(self._refreshes, key=lambda k: (zlib.crc32(k.encode()), k))
+        self._phases = {
+            key: self._intervals[key] * rank / len(keys)
+            for rank, key in enumerate(keys)
+        }
+        for key in keys:
+            self._async_schedule(key)
+
+    def _async_schedule(self, key):
+        interval = self._intervals[key]
+        delay = (self._phases[key] - time.time()) % interval
+        self._timers[key] = async_call_later(
+            self.hass, delay or interval,
+            HassJob(partial(self._async_fire, key),
+                    f"Airzone refresh {key}", cancel_on_shutdown=True))
+
+    async def _async_fire(self, key, now=None):
+        if key not in self._refreshes:
+            return
+        self._async_schedule(key)
+        if key in self._running:
+            _LOGGER.debug("Airzone refresh " + key + " still running, skipping")
+            return
+        self._running.add(key)
+        try:
+            async with self._semaphore:
+                await self._refreshes[key]()
+        finally:
+            self._running.discard(key)
+
+
+def get_poll_scheduler(hass):
+    """Return the poll scheduler of the integration."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_POLLER not in data:
+        data[DATA_POLLER] = PollScheduler(hass)
+    return data[DATA_POLLER]
@@ -0,0 +1,260 @@
+"""On-demand profiling of the refresh and command cycles of a controller."""
+import asyncio
+from collections import Counter
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+from homeassistant.core import SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.util import slugify
+import voluptuous as vol
+
+from .const import (
+    ATTR_CONFIG_ENTRY,
+    ATTR_CYCLES,
+    ATTR_FORMAT,
+    DATA_PROFILES,
+    DEFAULT_PROFILE_CYCLES,
+    DOMAIN,
+    MAX_PROFILE_CYCLES,
+    PROFILE_CYCLE_TIMEOUT,
+    PROFILE_DIR,
+    PROFILE_FORMATS,
+    PROFILE_INTERVAL,
+    SERVICE_PROFILE,
+    SIGNAL_REFRESHED,
+)
+from .session import get_session
+
+_LOGGER = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(__file__)
+
+PROFILE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_CONFIG_ENTRY): cv.string,
+    vol.Optional(ATTR_CYCLES, default=DEFAULT_PROFILE_CYCLES):
+        vol.All(vol.Coerce(int), vol.Range(min=1, max=MAX_PROFILE_CYCLES)),
+    vol.Optional(ATTR_FORMAT, default="collapsed"): vol.In(PROFILE_FORMATS),
+})
+
+# Sections of a profile, by the function a frame of the controller runs
+SECTIONS = {
+    "_async_changed": "[indicator]",
+    "_indicator": "[indicator]",
+    "_async_prefetch": "[prefetch]",
+    "prefetch": "[prefetch]",
+    "update": "[update]",
+    "_command": "[command]",
+    "__async_calculate_state": "[properties]",
+}
+STATE_WRITE = "[state write]"
+IO_WAIT = "[io wait]"
+# Functions of Home Assistant run for an entity
+ENTITY_FUNCTIONS = frozenset({
+    "async_update_ha_state", "async_device_update", "async_write_ha_state",
+    "_async_write_ha_state", "__async_calculate_state",
+})
+# Leaves of a thread blocked on the network
+IO_MODULES = frozenset({"socket.py", "selectors.py", "ssl.py"})
+IO_FUNCTIONS = frozenset({"recv", "send", "_exchange"})
+
+
+def _label(name):
+    # Built-in style entry, pstats shows it as {name}
+    return ("~", 0, name)
+
+
+class Profiler:
+    """Sampling profiler of the threads working for the integration.
+
+    Every interval the stacks of all threads are sampled. A stack is kept
+    when one of its frames runs code of the integration or an entity
+    function of Home Assistant, and labeled with the sections of SECTIONS,
+    so the update of the entities, the evaluation of their properties and
+    the state writes read apart in the profile. Frames are told apart by
+    their code only, never by their locals, so the controllers refreshing
+    at the same time share a profile.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="airzone_profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = self.stack(frame)
+                if stack is not None:
+                    self.samples[stack] += 1
+
+    @staticmethod
+    def _runs_for(code):
+        return code.co_filename.startswith(PACKAGE_DIR) or code.co_name in ENTITY_FUNCTIONS
+
+    def stack(self, frame):
+        """Return the labeled stack of a frame, None when it is not the integration's."""
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        owned = False
+        stack = []
+        for frame in reversed(frames):
+            code = frame.f_code
+            section = None
+            if self._runs_for(code):
+                owned = True
+                section = SECTIONS.get(code.co_name)
+            elif owned and code.co_name == "async_set" and \
+                    code.co_filename.endswith(os.path.join("homeassistant", "core.py")):
+                section = STATE_WRITE
+            if section is not None:
+                stack.append(_label(section))
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        if not owned:
+            return None
+        filename, _, name = stack[-1]
+        if os.path.basename(filename) in IO_MODULES or name in IO_FUNCTIONS:
+            stack.append(_label(IO_WAIT))
+        return tuple(stack)
+
+    def save(self, path, output_format):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if output_format == "pstats":
+            pstats.Stats(SampleStats(self.samples, self.interval)).dump_stats(path)
+            return
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(collapsed(self.samples))
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapsed(samples):
+    """Return the samples in the collapsed stack format of flamegraph.pl."""
+    lines = sorted(
+        ";".join(_frame_name(func) for func in stack) + " " + str(count)
+        for stack, count in samples.items())
+    return "".join(line + "\n" for line in lines)
+
+
+class SampleStats:
+    """Samples in the shape of a cProfile profile, for pstats.Stats.
+
+    Call counts are sample counts and times are the samples times the
+    interval, a function is credited once per sample however deep it
+    recurses.
+    """
+
+    def __init__(self, samples, interval):
+        self.samples = samples
+        self.interval = interval
+        self.stats = {}
+
+    def create_stats(self):
+        stats = {}
+        for stack, count in self.samples.items():
+            elapsed = count * self.interval
+            seen = set()
+            caller = None
+            for func in stack:
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                if func not in seen:
+                    seen.add(func)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += elapsed
+                if caller is not None:
+                    edge = entry[4].setdefault(caller, [0, 0, 0.0, 0.0])
+                    edge[0] += count
+                    edge[1] += count
+                    edge[3] += elapsed
+                    if func == stack[-1]:
+                        edge[2] += elapsed
+                caller = func
+            stats[stack[-1]][2] += elapsed
+        self.stats = {
+            func: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.items()})
+            for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+async def async_profile(hass, session, cycles, output_format):
+    """Profile the next refreshes of a session, return the file written."""
+    running = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_PROFILES, set())
+    if session.key in running:
+        raise HomeAssistantError("A profile of " + session.key + " is already running")
+    running.add(session.key)
+    profiler = Profiler(PROFILE_INTERVAL)
+    done = asyncio.Event()
+    refreshes = 0
+
+    @callback
+    def async_refreshed(refreshed):
+        nonlocal refreshes
+        if refreshed is session:
+            refreshes += 1
+            if refreshes >= cycles:
+                done.set()
+
+    unsub = async_dispatcher_connect(hass, SIGNAL_REFRESHED, async_refreshed)
+    profiler.start()
+    try:
+        async with asyncio.timeout(cycles * (session.scan_interval + PROFILE_CYCLE_TIMEOUT)):
+            await done.wait()
+    except TimeoutError:
+        _LOGGER.warning("Airzone profile of " + session.key + " ended after " +
+                        str(refreshes) + " of " + str(cycles) + " refreshes")
+    finally:
+        unsub()
+        await hass.async_add_executor_job(profiler.stop)
+        running.discard(session.key)
+    path = hass.config.path(
+        PROFILE_DIR,
+        slugify(session.key) + time.strftime("-%Y%m%d-%H%M%S") + PROFILE_FORMATS[output_format])
+    await hass.async_add_executor_job(profiler.save, path, output_format)
+    _LOGGER.info("Airzone profile of " + session.key + " written to " + path)
+    return path, sum(profiler.samples.values())
+
+
+@callback
+def async_setup_profiler(hass):
+    """Register the profile service."""
+
+    async def async_handle_profile(call):
+        entry_id = call.data[ATTR_CONFIG_ENTRY]
+        entry = hass.config_entries.async_get_entry(entry_id)
+        if entry is None or entry.domain != DOMAIN or entry_id not in hass.data.get(DOMAIN, {}):
+            raise HomeAssistantError("Airzone entry " + entry_id + " is not loaded")
+        session = get_session(hass, hass.data[DOMAIN][entry_id])
+        path, samples = await async_profile(
+            hass, session, call.data[ATTR_CYCLES], call.data[ATTR_FORMAT])
+        return {"path": path, "samples": samples}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, async_handle_profile, schema=PROFILE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL)
@@ -0,0 +1,48 @@
+"""Token bucket rate limiting for Airzone gateways."""
+import time
+
+
+class TokenBucket:
+    """Limit the transactions per second sent to a gateway.
+
+    rate tokens are added every second up to burst, every transaction takes
+    one and consecutive transactions are at least min_gap seconds apart.
+    A rate of 0 disables the bucket, only the gap is then enforced.
+    """
+
+    def __init__(self, rate=0, burst=1, min_gap=0, clock=time.monotonic):
+        self._clock = clock
+        self.configure(rate, burst, min_gap)
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._last = None
+
+    def configure(self, rate, burst, min_gap):
+        """Change the limits, the tokens already in the bucket are kept."""
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.min_gap = float(min_gap)
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """Return how many seconds the next transaction has to wait."""
+        now = self._clock()
+        self._refill(now)
+        wait = 0.0
+        if self.rate > 0 and self._tokens < 1:
+            wait = (1 - self._tokens) / self.rate
+        if self._last is not None:
+            wait = max(wait, self._last + self.min_gap - now)
+        return wait
+
+    def consume(self):
+        """Take the token of a transaction that is about to be sent."""
+        now = self._clock()
+        self._refill(now)
+        if self.rate > 0:
+            self._tokens = max(0.0, self._tokens - 1)
+        self._last = now
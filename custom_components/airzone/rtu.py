@@ -0,0 +1,202 @@
+"""Modbus RTU transport for controllers wired to the RS-485 bus."""
+from collections import namedtuple
+import logging
+import struct
+from threading import Lock
+import time
+
+from airzone.protocol import Gateway
+from homeassistant.const import CONF_DEVICE_ID, CONF_HOST
+
+from .const import CONF_BAUDRATE, DEFAULT_BAUDRATE
+
+_LOGGER = logging.getLogger(__name__)
+
+# Tried in order when the baud rate is not configured, 19200 is the factory
+# setting of the Airzone buses.
+BAUDRATES = [19200, 9600, 38400, 57600, 115200, 4800]
+
+READ_HOLDING_REGISTERS = 0x03
+READ_INPUT_REGISTERS = 0x04
+WRITE_SINGLE_REGISTER = 0x06
+
+# The spec times a character as 11 bits whatever the framing used
+BITS_PER_CHAR = 11
+
+RtuResponse = namedtuple('RtuResponse', ['registers'])
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data):
+    """Return the Modbus CRC of data."""
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def frame(device_id, pdu):
+    """Return the RTU frame carrying pdu for device_id."""
+    adu = bytes([device_id]) + pdu
+    return adu + struct.pack('<H', crc16(adu))
+
+
+def frame_timing(baudrate):
+    """Return the inter character (1.5) and inter frame (3.5) silences.
+
+    Above 19200 baud the spec fixes them at 750us and 1.75ms.
+    """
+    if baudrate > 19200:
+        return 0.00075, 0.00175
+    char = BITS_PER_CHAR / baudrate
+    return 1.5 * char, 3.5 * char
+
+
+class ModbusRtuError(Exception):
+    """Raised when a RTU transaction fails."""
+
+
+class SerialModbusClient:
+    """Minimal Modbus RTU master over a serial port.
+
+    Responses are read by their expected length instead of waiting for the
+    line to go silent, so a transaction returns as soon as its last byte
+    arrives and the next one only waits for whatever is left of the 3.5
+    character inter frame silence.
+    """
+
+    def __init__(self, port, baudrate=DEFAULT_BAUDRATE, probe_id=1, timeout=0.5):
+        self.port = port
+        self.baudrate = baudrate
+        self.probe_id = probe_id
+        self.timeout = timeout
+        self._serial = None
+        self._inter_frame = 0
+        self._last_activity = 0
+
+    def connect(self):
+        """Open the port, detecting the baud rate if it is not configured."""
+        import serial
+
+        self._serial = serial.Serial(
+            self.port, baudrate=self.baudrate or BAUDRATES[0],
+            bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE, timeout=self.timeout)
+        if self.baudrate:
+            self._set_baudrate(self.baudrate)
+        else:
+            self._set_baudrate(self._detect_baudrate())
+        return True
+
+    def close(self):
+        if self._serial is not None:
+            self._serial.close()
+            self._serial = None
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+        if self._serial is not None:
+            self._serial.timeout = timeout
+
+    def _set_baudrate(self, baudrate):
+        self.baudrate = baudrate
+        self._serial.baudrate = baudrate
+        _, self._inter_frame = frame_timing(baudrate)
+
+    def _detect_baudrate(self):
+        for baudrate in BAUDRATES:
+            self._set_baudrate(baudrate)
+            try:
+                self.read_input_registers(0, 1, self.probe_id)
+            except ModbusRtuError:
+                continue
+            _LOGGER.info("Airzone bus on " + self.port + " detected at " + str(baudrate) + " baud")
+            return baudrate
+        raise ModbusRtuError("No answer from device " + str(self.probe_id) + " on " + self.port)
+
+    def _read(self, size):
+        data = self._serial.read(size)
+        if len(data) != size:
+            raise ModbusRtuError("Timeout waiting for the response")
+        return data
+
+    def _transact(self, device_id, pdu, size):
+        """Send pdu and return the payload of a response of size bytes."""
+        if self._serial is None:
+            raise ModbusRtuError("Port " + self.port + " is not open")
+        silence = self._last_activity + self._inter_frame - time.monotonic()
+        if silence > 0:
+            time.sleep(silence)
+        self._serial.reset_input_buffer()
+        self._serial.write(frame(device_id, pdu))
+        self._serial.flush()
+        try:
+            header = self._read(2)
+            if header[1] & 0x80:
+                # Exception response: code and CRC
+                rest = self._read(3)
+            else:
+                rest = self._read(size - 2)
+        finally:
+            self._last_activity = time.monotonic()
+        adu = header + rest
+        if crc16(adu[:-2]) != struct.unpack('<H', adu[-2:])[0]:
+            raise ModbusRtuError("CRC error in the response")
+        if adu[0] != device_id or adu[1] & 0x7F != pdu[0]:
+            raise ModbusRtuError("Unexpected response " + adu.hex())
+        if adu[1] & 0x80:
+            raise ModbusRtuError("Exception code " + str(adu[2]))
+        return adu[2:-2]
+
+    def _read_registers(self, function, address, count, device_id):
+        payload = self._transact(
+            device_id, struct.pack('>BHH', function, address, count), 5 + 2 * count)
+        if payload[0] != 2 * count:
+            raise ModbusRtuError("Unexpected byte count " + str(payload[0]))
+        return RtuResponse(list(struct.unpack('>%dH' % count, payload[1:])))
+
+    def read_input_registers(self, address, count=1, device_id=1):
+        return self._read_registers(READ_INPUT_REGISTERS, address, count, device_id)
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        return self._read_registers(READ_HOLDING_REGISTERS, address, count, device_id)
+
+    def write_register(self, address, value, device_id=1):
+        self._transact(
+            device_id, struct.pack('>BHH', WRITE_SINGLE_REGISTER, address, value), 8)
+        return RtuResponse([value])
+
+    def __str__(self):
+        return "SerialModbusClient " + self.port + " at " + str(self.baudrate) + " baud"
+
+
+class SerialGateway(Gateway):
+    """Gateway talking RTU straight to the bus.
+
+    There is no TCP gateway to settle, so the connection is used right away.
+    """
+
+    def __init__(self, modbus_client):
+        self._lock = Lock()
+        self.client = modbus_client
+        with self._lock:
+            self.client.connect()
+
+
+def serial_gateway(config):
+    """Return a gateway on the serial port given as host."""
+    return SerialGateway(SerialModbusClient(
+        config[CONF_HOST], config.get(CONF_BAUDRATE, DEFAULT_BAUDRATE),
+        probe_id=config[CONF_DEVICE_ID]))
@@ -0,0 +1,137 @@
+"""Heating and cooling runtime accounting of the Airzone zones."""
+import math
+import time
+
+from homeassistant.components.climate import HVACAction
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import slugify
+
+from .const import (
+    DOMAIN,
+    DUTY_CYCLE_WINDOW,
+    RUNTIME_MAX_GAP,
+    RUNTIME_SAVE_DELAY,
+    RUNTIME_STORAGE_VERSION,
+)
+
+ACTIVE_ACTIONS = (HVACAction.HEATING, HVACAction.COOLING)
+
+
+class RuntimeAccumulator:
+    """Runtime totals and running duty cycle of one zone or machine.
+
+    Each sample credits the time since the previous one to the action seen
+    then, so a poll costs O(1) whatever the history. Gaps longer than
+    max_gap, a restart or a lost controller, are not credited.
+    """
+
+    def __init__(self, data=None, window=DUTY_CYCLE_WINDOW, max_gap=RUNTIME_MAX_GAP):
+        data = data or {}
+        self.window = window
+        self.max_gap = max_gap
+        self.runtime = {
+            action: data.get(action, 0.0) for action in ACTIVE_ACTIONS}
+        self.duty_cycle = data.get('duty_cycle', 0.0)
+        self._action = None
+        self._sampled = None
+
+    def sample(self, action, now):
+        if self._sampled is not None:
+            elapsed = now - self._sampled
+            if 0 < elapsed <= self.max_gap:
+                active = self._action in ACTIVE_ACTIONS
+                if active:
+                    self.runtime[self._action] += elapsed
+                # Exponentially weighted over the window, in percent
+                alpha = 1 - math.exp(-elapsed / self.window)
+                self.duty_cycle += alpha * ((100.0 if active else 0.0) - self.duty_cycle)
+        self._action = action
+        self._sampled = now
+
+    def reset(self):
+        """Forget the last sample, the time until the next one is not credited."""
+        self._action = None
+        self._sampled = None
+
+    def as_dict(self):
+        data = dict(self.runtime)
+        data['duty_cycle'] = self.duty_cycle
+        return data
+
+
+class RuntimeTracker:
+    """Runtime accumulators of a controller, persisted across restarts.
+
+    Zones are keyed by the unique id of their entity, the machine is
+    active whenever one of its zones is.
+    """
+
+    def __init__(self, hass, key, clock=time.monotonic):
+        self.hass = hass
+        self.machine_key = key
+        self._clock = clock
+        self._store = Store(hass, RUNTIME_STORAGE_VERSION, f"{DOMAIN}.runtime.{slugify(key)}")
+        self._stored = {}
+        self.accumulators = {}
+        self._listeners = []
+
+    async def async_load(self):
+        self._stored = await self._store.async_load() or {}
+
+    async def async_save(self):
+        await self._store.async_save(self._data())
+
+    def _data(self):
+        data = dict(self._stored)
+        data.update({key: acc.as_dict() for key, acc in self.accumulators.items()})
+        return data
+
+    def get(self, key):
+        """Return the accumulator of key, restoring its stored totals."""
+        if key not in self.accumulators:
+            self.accumulators[key] = RuntimeAccumulator(self._stored.get(key))
+        return self.accumulators[key]
+
+    def _reset(self, key):
+        if key in self.accumulators:
+            self.accumulators[key].reset()
+
+    @callback
+    def async_add_listener(self, listener):
+        """Call listener after every sample, returns the remove callable."""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    @callback
+    def async_sample(self, devices):
+        """Account the current action of every device of the controller.
+
+        An unavailable device only shows its last known action, it is not
+        sampled and the time until it reports again is not credited.
+        """
+        now = self._clock()
+        actions = []
+        for device in devices:
+            if device.unique_id is None:
+                continue
+            if not device.available:
+                self._reset(device.unique_id)
+                continue
+            action = device.hvac_action
+            if action is None:
+                continue
+            self.get(device.unique_id).sample(action, now)
+            actions.append(action)
+        if not actions:
+            self._reset(self.machine_key)
+            return
+        machine_action = HVACAction.IDLE
+        for action in ACTIVE_ACTIONS:
+            if action in actions:
+                machine_action = action
+                break
+        self.get(self.machine_key).sample(machine_action, now)
+        self._store.async_delay_save(self._data, RUNTIME_SAVE_DELAY)
+        for listener in list(self._listeners):
+            listener()
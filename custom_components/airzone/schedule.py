@@ -0,0 +1,256 @@
+"""Setpoint and mode schedules of the Airzone zones."""
+from collections import namedtuple
+from datetime import timedelta
+import heapq
+import itertools
+import logging
+
+from homeassistant.components.climate import ATTR_HVAC_MODE, HVACMode
+from homeassistant.const import ATTR_ENTITY_ID, ATTR_TEMPERATURE, WEEKDAYS
+from homeassistant.core import HassJob, callback
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.helpers.storage import Store
+import homeassistant.util.dt as dt_util
+import voluptuous as vol
+
+from .const import (
+    ATTR_AT,
+    ATTR_TRANSITIONS,
+    ATTR_WEEKDAYS,
+    DATA_SCHEDULE,
+    DATA_SESSIONS,
+    DOMAIN,
+    SCHEDULE_BATCH_WINDOW,
+    SCHEDULE_STORAGE_VERSION,
+    SERVICE_CLEAR_SCHEDULE,
+    SERVICE_SET_SCHEDULE,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+TRANSITION_SCHEMA = vol.Schema({
+    vol.Required(ATTR_AT): cv.time,
+    vol.Optional(ATTR_WEEKDAYS, default=list(WEEKDAYS)): vol.All(cv.ensure_list, [vol.In(WEEKDAYS)]),
+    vol.Optional(ATTR_TEMPERATURE): vol.Coerce(float),
+    vol.Optional(ATTR_HVAC_MODE): vol.Coerce(HVACMode),
+})
+
+SET_SCHEDULE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    vol.Required(ATTR_TRANSITIONS): vol.All(cv.ensure_list, [TRANSITION_SCHEMA]),
+})
+
+CLEAR_SCHEDULE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+})
+
+Transition = namedtuple('Transition', ['hour', 'minute', 'weekdays', 'temperature', 'hvac_mode'])
+
+
+def transition_from_dict(data):
+    hour, minute = (int(part) for part in data[ATTR_AT].split(':')[:2])
+    weekdays = frozenset(WEEKDAYS.index(day) for day in data[ATTR_WEEKDAYS])
+    hvac_mode = data.get(ATTR_HVAC_MODE)
+    return Transition(hour, minute, weekdays, data.get(ATTR_TEMPERATURE),
+                      None if hvac_mode is None else HVACMode(hvac_mode))
+
+
+def transition_to_dict(transition):
+    data = {
+        ATTR_AT: f"{transition.hour:02d}:{transition.minute:02d}",
+        ATTR_WEEKDAYS: [WEEKDAYS[day] for day in sorted(transition.weekdays)],
+    }
+    if transition.temperature is not None:
+        data[ATTR_TEMPERATURE] = transition.temperature
+    if transition.hvac_mode is not None:
+        data[ATTR_HVAC_MODE] = str(transition.hvac_mode)
+    return data
+
+
+def _occurrence(transition, now, days):
+    day = now + timedelta(days=days)
+    return day.replace(hour=transition.hour, minute=transition.minute, second=0, microsecond=0)
+
+
+def next_occurrence(transition, now):
+    """Return the first local time after now the transition applies."""
+    for days in range(8):
+        when = _occurrence(transition, now, days)
+        if when > now and when.weekday() in transition.weekdays:
+            return when
+    return None
+
+
+def previous_occurrence(transition, now):
+    """Return the last local time up to now the transition applied."""
+    for days in range(0, -8, -1):
+        when = _occurrence(transition, now, days)
+        if when <= now and when.weekday() in transition.weekdays:
+            return when
+    return None
+
+
+def _apply(batch):
+    # Runs outside of any transaction: every command of the entities is one
+    # of its own, so it is rate limited and user commands can go in between
+    for device, transition in batch:
+        try:
+            if transition.hvac_mode is not None:
+                device.set_hvac_mode(transition.hvac_mode)
+            if transition.temperature is not None:
+                device.set_temperature(**{ATTR_TEMPERATURE: transition.temperature})
+        except Exception:
+            # The other zones still get theirs
+            _LOGGER.exception("Airzone error applying the schedule of " + str(device.entity_id))
+
+
+class ScheduleEngine:
+    """Timeline of the scheduled transitions of every zone.
+
+    The next occurrence of every transition is kept in a heap and a single
+    timer waits for the earliest one. Transitions falling within the batch
+    window are written together, one batch per controller, and the
+    transitions in force are written again when a controller connects.
+    """
+
+    def __init__(self, hass):
+        self.hass = hass
+        self._store = Store(hass, SCHEDULE_STORAGE_VERSION, f"{DOMAIN}.schedule")
+        self.schedules = {}
+        self._timeline = []
+        self._sequence = itertools.count()
+        self._unsub_timer = None
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        self.schedules = {
+            entity_id: [transition_from_dict(item) for item in transitions]
+            for entity_id, transitions in data.items()}
+        self._async_rebuild()
+
+    def _data(self):
+        return {
+            entity_id: [transition_to_dict(transition) for transition in transitions]
+            for entity_id, transitions in self.schedules.items()}
+
+    @callback
+    def async_set_schedule(self, entity_id, transitions):
+        """Replace the transitions of an entity, an empty list clears them."""
+        if transitions:
+            self.schedules[entity_id] = list(transitions)
+        else:
+            self.schedules.pop(entity_id, None)
+        self._store.async_delay_save(self._data)
+        self._async_rebuild()
+
+    @callback
+    def _async_rebuild(self):
+        now = dt_util.now()
+        self._timeline = []
+        for entity_id, transitions in self.schedules.items():
+            for index, transition in enumerate(transitions):
+                self._push(entity_id, index, now)
+        self._async_arm()
+
+    def _push(self, entity_id, index, now):
+        when = next_occurrence(self.schedules[entity_id][index], now)
+        if when is not None:
+            heapq.heappush(self._timeline, (when, next(self._sequence), entity_id, index))
+
+    @callback
+    def _async_arm(self):
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        if self._timeline:
+            self._unsub_timer = async_track_point_in_utc_time(
+                self.hass,
+                HassJob(self._async_fire, "Airzone schedule", cancel_on_shutdown=True),
+                dt_util.as_utc(self._timeline[0][0]))
+
+    async def _async_fire(self, now=None):
+        self._unsub_timer = None
+        now = dt_util.now()
+        due = {}
+        horizon = now + timedelta(seconds=SCHEDULE_BATCH_WINDOW)
+        while self._timeline and self._timeline[0][0] <= horizon:
+            _, _, entity_id, index = heapq.heappop(self._timeline)
+            transitions = self.schedules.get(entity_id)
+            if transitions is None or index >= len(transitions):
+                continue
+            # The last transition of an entity in the same moment wins
+            due[entity_id] = transitions[index]
+            self._push(entity_id, index, horizon)
+        self._async_arm()
+        await self._async_write(due)
+
+    def transitions_in_force(self, entity_ids, now=None):
+        """Return the last transition applied to each entity up to now."""
+        now = now or dt_util.now()
+        in_force = {}
+        for entity_id in entity_ids:
+            latest = None
+            for transition in self.schedules.get(entity_id, []):
+                when = previous_occurrence(transition, now)
+                if when is not None and (latest is None or when >= latest[0]):
+                    latest = (when, transition)
+            if latest is not None:
+                in_force[entity_id] = latest[1]
+        return in_force
+
+    async def async_reapply(self, session):
+        """Write the transitions in force of a controller that connected."""
+        entity_ids = [device.entity_id for device in session.devices if device.entity_id]
+        due = self.transitions_in_force(entity_ids)
+        if due:
+            _LOGGER.info("Airzone applying " + str(len(due)) + " scheduled transitions to " + session.key)
+            await self._async_write(due)
+
+    def _batches(self, due):
+        """Group the due transitions by the session of their entity."""
+        batches = {}
+        sessions = self.hass.data.get(DOMAIN, {}).get(DATA_SESSIONS, {})
+        for session in sessions.values():
+            for device in session.devices:
+                transition = due.get(device.entity_id)
+                if transition is not None:
+                    batches.setdefault(session, []).append((device, transition))
+        return batches
+
+    async def _async_write(self, due):
+        for session, batch in self._batches(due).items():
+            try:
+                await self.hass.async_add_executor_job(_apply, batch)
+            except Exception:
+                _LOGGER.exception("Airzone error applying the schedule of " + session.key)
+
+
+def get_schedule_engine(hass):
+    """Return the schedule engine of the integration."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_SCHEDULE not in data:
+        data[DATA_SCHEDULE] = ScheduleEngine(hass)
+    return data[DATA_SCHEDULE]
+
+
+async def async_setup_schedules(hass):
+    """Load the schedules and register their services."""
+    engine = get_schedule_engine(hass)
+    await engine.async_load()
+
+    async def async_set_schedule(call):
+        transitions = [
+            transition_from_dict(dict(item, **{ATTR_AT: item[ATTR_AT].strftime('%H:%M')}))
+            for item in call.data[ATTR_TRANSITIONS]]
+        for entity_id in call.data[ATTR_ENTITY_ID]:
+            engine.async_set_schedule(entity_id, transitions)
+
+    async def async_clear_schedule(call):
+        for entity_id in call.data[ATTR_ENTITY_ID]:
+            engine.async_set_schedule(entity_id, [])
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_SCHEDULE, async_set_schedule, schema=SET_SCHEDULE_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, SERVICE_CLEAR_SCHEDULE, async_clear_schedule, schema=CLEAR_SCHEDULE_SCHEMA)
@@ -0,0 +1,119 @@
+"""Per-gateway request scheduling for the Airzone integration."""
+from functools import partial
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from .const import DATA_SCHEDULERS, DOMAIN
+from .ratelimit import TokenBucket
+
+_LOGGER = logging.getLogger(__name__)
+
+# Lower values are served first.
+PRIORITY_COMMAND = 0
+PRIORITY_CONFIRM = 1
+PRIORITY_POLL = 2
+PRIORITY_METADATA = 3
+
+# The scheduler whose transaction each thread is running
+_current = threading.local()
+
+
+class RequestScheduler:
+    """Serialize the transactions sent to one gateway by priority.
+
+    Every call to run() is a single transaction. Waiting transactions are
+    served by priority and in arrival order within the same priority, so a
+    user command only has to wait for the transaction already in flight.
+    Transactions over the gateway rate limit are queued, never failed.
+    A run() made from inside a transaction is part of it and runs at once,
+    so several commands can be batched into a single transaction.
+    """
+
+    def __init__(self, name="airzone", limiter=None):
+        self._name = name
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._busy = False
+        self._owner = None
+        self.limiter = limiter or TokenBucket()
+        self.throttled = 0
+
+    @property
+    def queue_depth(self):
+        """Return the number of transactions waiting for the gateway."""
+        with self._condition:
+            return len(self._waiting)
+
+    def run(self, priority, func, *args, **kwargs):
+        """Run func as one transaction once it is its turn."""
+        if self._owner == threading.get_ident():
+            return func(*args, **kwargs)
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while self._busy or self._waiting[0] != ticket:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._busy = True
+            self._owner = threading.get_ident()
+        _current.scheduler = self
+        try:
+            self._throttle()
+            return func(*args, **kwargs)
+        finally:
+            _current.scheduler = None
+            with self._condition:
+                self._busy = False
+                self._owner = None
+                self._condition.notify_all()
+
+    def _throttle(self):
+        delay = self.limiter.delay()
+        if delay > 0:
+            self.throttled += 1
+            _LOGGER.debug(f"{self._name} throttled {delay:.3f}s, queued: {self.queue_depth}")
+            time.sleep(delay)
+        self.limiter.consume()
+
+    def diagnostics(self):
+        """Return the scheduler state for the diagnostics."""
+        return {
+            "queue_depth": self.queue_depth,
+            "throttled": self.throttled,
+            "rate_limit": self.limiter.rate,
+            "rate_burst": self.limiter.burst,
+            "frame_gap": self.limiter.min_gap,
+        }
+
+    async def async_run(self, hass, priority, func, *args, **kwargs):
+        """Run func as one transaction from the event loop."""
+        return await hass.async_add_executor_job(
+            partial(self.run, priority, func, *args, **kwargs))
+
+    def __str__(self):
+        return f"RequestScheduler {self._name} queued: {self.queue_depth}"
+
+
+def throttle():
+    """Count one more request of the running transaction against the rate limit.
+
+    For the transactions sending several requests, waits like a transaction
+    of its own would. Does nothing outside of a transaction.
+    """
+    scheduler = getattr(_current, "scheduler", None)
+    if scheduler is not None:
+        scheduler._throttle()
+
+
+def get_scheduler(hass, host, port):
+    """Return the scheduler shared by everything talking to host:port."""
+    schedulers = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_SCHEDULERS, {})
+    key = f"{host}:{port}"
+    if key not in schedulers:
+        _LOGGER.debug("Airzone creating request scheduler for " + key)
+        schedulers[key] = RequestScheduler(key)
+    return schedulers[key]
@@ -0,0 +1,146 @@
+"""Validation of the Airzone options, shared by YAML, the config and options flows."""
+from homeassistant.const import CONF_DEVICE_CLASS, CONF_DEVICE_ID, CONF_SCAN_INTERVAL, CONF_TIMEOUT
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+
+from .const import (
+    CONF_BAUDRATE,
+    CONF_ENDPOINTS,
+    CONF_FLOOR,
+    CONF_FRAME_GAP,
+    CONF_HUMIDITY_DEADBAND,
+    CONF_HUMIDITY_STEP,
+    CONF_LAST_DEVICE_ID,
+    CONF_MAX_CONCURRENT_REFRESH,
+    CONF_MAX_STALENESS,
+    CONF_MEDIUM_INTERVAL,
+    CONF_POLL_BUDGET,
+    CONF_RATE_BURST,
+    CONF_RATE_LIMIT,
+    CONF_REPORT_MAX_AGE,
+    CONF_RETRIES,
+    CONF_SLOW_INTERVAL,
+    CONF_SPEED_PERCENTAGE,
+    CONF_TELEMETRY,
+    CONF_TELEMETRY_MAX_AGE,
+    CONF_TELEMETRY_MAX_SIZE,
+    CONF_TEMPERATURE_DEADBAND,
+    CONF_TEMPERATURE_STEP,
+    CONF_TRANSPORT,
+    CONF_WORKER,
+    DEFAULT_BAUDRATE,
+    DEFAULT_DEVICE_CLASS,
+    DEFAULT_DEVICE_ID,
+    DEFAULT_FRAME_GAP,
+    DEFAULT_HUMIDITY_DEADBAND,
+    DEFAULT_HUMIDITY_STEP,
+    DEFAULT_MAX_CONCURRENT_REFRESH,
+    DEFAULT_MAX_STALENESS,
+    DEFAULT_RATE_BURST,
+    DEFAULT_RATE_LIMIT,
+    DEFAULT_REPORT_MAX_AGE,
+    DEFAULT_RETRIES,
+    DEFAULT_SPEED_AS_PER,
+    DEFAULT_TELEMETRY_MAX_AGE,
+    DEFAULT_TELEMETRY_MAX_SIZE,
+    DEFAULT_TEMPERATURE_DEADBAND,
+    DEFAULT_TEMPERATURE_STEP,
+    DEFAULT_TIER_INTERVALS,
+    DEFAULT_TIMEOUT,
+    DEFAULT_TRANSPORT,
+    SCAN_INTERVAL,
+    SYSTEM_TYPES,
+    TIER_MEDIUM,
+    TIER_SLOW,
+    TRANSPORTS,
+)
+from .failover import valid_endpoints
+
+
+def _at_least(minimum, kind=int):
+    return vol.All(vol.Coerce(kind), vol.Range(min=minimum))
+
+
+VALIDATORS = {
+    CONF_DEVICE_ID: int,
+    CONF_DEVICE_CLASS: vol.In(SYSTEM_TYPES),
+    CONF_SPEED_PERCENTAGE: cv.boolean,
+    CONF_TRANSPORT: vol.In(TRANSPORTS),
+    CONF_BAUDRATE: _at_least(0),
+    CONF_WORKER: cv.boolean,
+    CONF_ENDPOINTS: vol.All(cv.string, valid_endpoints),
+    CONF_RATE_LIMIT: _at_least(0, float),
+    CONF_RATE_BURST: _at_least(1),
+    CONF_FRAME_GAP: _at_least(0),
+    CONF_TEMPERATURE_DEADBAND: _at_least(0, float),
+    CONF_TEMPERATURE_STEP: _at_least(0, float),
+    CONF_HUMIDITY_DEADBAND: _at_least(0, float),
+    CONF_HUMIDITY_STEP: _at_least(0, float),
+    CONF_REPORT_MAX_AGE: _at_least(0),
+    CONF_FLOOR: cv.string,
+    CONF_LAST_DEVICE_ID: vol.All(vol.Coerce(int), vol.Range(min=1, max=247)),
+    CONF_POLL_BUDGET: _at_least(0),
+    CONF_MAX_STALENESS: _at_least(0),
+    CONF_TELEMETRY: cv.boolean,
+    CONF_TELEMETRY_MAX_SIZE: _at_least(1),
+    CONF_TELEMETRY_MAX_AGE: _at_least(1),
+    CONF_SCAN_INTERVAL: _at_least(1, float),
+    CONF_TIMEOUT: _at_least(0.1, float),
+    CONF_RETRIES: vol.All(vol.Coerce(int), vol.Range(min=0, max=5)),
+    CONF_MAX_CONCURRENT_REFRESH: _at_least(1),
+    CONF_MEDIUM_INTERVAL: _at_least(0),
+    CONF_SLOW_INTERVAL: _at_least(0),
+}
+
+# Options of a controller besides its host and port, in the order of the
+# form, vol.UNDEFINED for the ones without a default
+CONTROLLER_DEFAULTS = {
+    CONF_DEVICE_ID: DEFAULT_DEVICE_ID,
+    CONF_DEVICE_CLASS: DEFAULT_DEVICE_CLASS,
+    CONF_SPEED_PERCENTAGE: DEFAULT_SPEED_AS_PER,
+    CONF_TRANSPORT: DEFAULT_TRANSPORT,
+    CONF_BAUDRATE: DEFAULT_BAUDRATE,
+    CONF_WORKER: False,
+    CONF_ENDPOINTS: vol.UNDEFINED,
+    CONF_RATE_LIMIT: DEFAULT_RATE_LIMIT,
+    CONF_RATE_BURST: DEFAULT_RATE_BURST,
+    CONF_FRAME_GAP: DEFAULT_FRAME_GAP,
+    CONF_TEMPERATURE_DEADBAND: DEFAULT_TEMPERATURE_DEADBAND,
+    CONF_TEMPERATURE_STEP: DEFAULT_TEMPERATURE_STEP,
+    CONF_HUMIDITY_DEADBAND: DEFAULT_HUMIDITY_DEADBAND,
+    CONF_HUMIDITY_STEP: DEFAULT_HUMIDITY_STEP,
+    CONF_REPORT_MAX_AGE: DEFAULT_REPORT_MAX_AGE,
+    CONF_FLOOR: vol.UNDEFINED,
+    CONF_LAST_DEVICE_ID: vol.UNDEFINED,
+    CONF_POLL_BUDGET: vol.UNDEFINED,
+    CONF_MAX_STALENESS: DEFAULT_MAX_STALENESS,
+    CONF_TELEMETRY: False,
+    CONF_TELEMETRY_MAX_SIZE: DEFAULT_TELEMETRY_MAX_SIZE,
+    CONF_TELEMETRY_MAX_AGE: DEFAULT_TELEMETRY_MAX_AGE,
+}
+
+# Options tuned live by the options flow, in the order of the form. A fleet
+# defaults to a poll budget of its own, see session.poll_budget.
+TUNING_DEFAULTS = {
+    CONF_SCAN_INTERVAL: SCAN_INTERVAL.total_seconds(),
+    CONF_TIMEOUT: DEFAULT_TIMEOUT,
+    CONF_RETRIES: DEFAULT_RETRIES,
+    CONF_MAX_CONCURRENT_REFRESH: DEFAULT_MAX_CONCURRENT_REFRESH,
+    CONF_MEDIUM_INTERVAL: DEFAULT_TIER_INTERVALS[TIER_MEDIUM],
+    CONF_SLOW_INTERVAL: DEFAULT_TIER_INTERVALS[TIER_SLOW],
+    CONF_POLL_BUDGET: 0,
+    CONF_MAX_STALENESS: DEFAULT_MAX_STALENESS,
+    CONF_RATE_LIMIT: DEFAULT_RATE_LIMIT,
+    CONF_RATE_BURST: DEFAULT_RATE_BURST,
+    CONF_FRAME_GAP: DEFAULT_FRAME_GAP,
+    CONF_TELEMETRY: False,
+    CONF_TELEMETRY_MAX_SIZE: DEFAULT_TELEMETRY_MAX_SIZE,
+    CONF_TELEMETRY_MAX_AGE: DEFAULT_TELEMETRY_MAX_AGE,
+}
+
+
+def option_fields(defaults):
+    """Return the schema fields of the options, with their defaults."""
+    return {
+        vol.Optional(key, default=default): VALIDATORS[key]
+        for key, default in defaults.items()}
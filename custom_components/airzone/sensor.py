@@ -0,0 +1,157 @@
+"""Runtime, duty cycle and floor aggregate sensors of the Airzone zones."""
+import logging
+
+from homeassistant import config_entries, core
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import PERCENTAGE, UnitOfTemperature, UnitOfTime
+
+from .const import BUILDING, DOMAIN
+from .runtime import ACTIVE_ACTIONS
+from .session import get_session
+from .store import get_zone_store
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AirzoneRuntimeSensor(SensorEntity):
+    """Hours a zone or machine has spent heating or cooling."""
+
+    _attr_should_poll = False
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = UnitOfTime.HOURS
+
+    def __init__(self, tracker, key, name, action):
+        self._tracker = tracker
+        self._key = key
+        self._action = action
+        self._attr_name = f"{name} {action} runtime"
+        self._attr_unique_id = f"{key}_{action}_runtime"
+
+    @property
+    def native_value(self):
+        return round(self._tracker.get(self._key).runtime[self._action] / 3600, 3)
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._tracker.async_add_listener(self.async_write_ha_state))
+
+
+class AirzoneDutyCycleSensor(SensorEntity):
+    """Share of the last hour a zone or machine has been active."""
+
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = PERCENTAGE
+
+    def __init__(self, tracker, key, name):
+        self._tracker = tracker
+        self._key = key
+        self._attr_name = f"{name} duty cycle"
+        self._attr_unique_id = f"{key}_duty_cycle"
+
+    @property
+    def native_value(self):
+        return round(self._tracker.get(self._key).duty_cycle, 1)
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._tracker.async_add_listener(self.async_write_ha_state))
+
+
+class AirzoneFloorSensor(SensorEntity):
+    """Aggregate of the zones of a floor or of the whole building."""
+
+    _attr_should_poll = False
+
+    def __init__(self, store, floor):
+        self._store = store
+        self._floor = floor
+        self._attr_name = "Airzone " + floor
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._store.async_add_listener(self._async_floors_updated))
+
+    async def async_will_remove_from_hass(self):
+        # Let the next entry set up create the sensors of the floor again
+        self._store.sensor_floors.discard(self._floor)
+
+    def _async_floors_updated(self, floors):
+        if self._floor in floors:
+            self.async_write_ha_state()
+
+
+class AirzoneFloorTemperatureSensor(AirzoneFloorSensor):
+    """Average current temperature of the zones of a floor."""
+
+    _attr_device_class = SensorDeviceClass.TEMPERATURE
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTemperature.CELSIUS
+
+    def __init__(self, store, floor):
+        super().__init__(store, floor)
+        self._attr_name += " average temperature"
+        self._attr_unique_id = f"{DOMAIN}_{floor}_average_temperature"
+
+    @property
+    def native_value(self):
+        temperature = self._store.average_temperature(self._floor)
+        return None if temperature is None else round(temperature, 1)
+
+
+class AirzoneFloorDemandSensor(AirzoneFloorSensor):
+    """Number of zones of a floor heating or cooling."""
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, store, floor):
+        super().__init__(store, floor)
+        self._attr_name += " zones demanding"
+        self._attr_unique_id = f"{DOMAIN}_{floor}_zones_demanding"
+
+    @property
+    def native_value(self):
+        return self._store.demanding(self._floor)
+
+    @property
+    def extra_state_attributes(self):
+        return {"zones": self._store.zones(self._floor)}
+
+
+def _floor_sensors(store, floor):
+    if floor in store.sensor_floors:
+        return []
+    store.sensor_floors.add(floor)
+    return [AirzoneFloorTemperatureSensor(store, floor), AirzoneFloorDemandSensor(store, floor)]
+
+
+def _sensors(tracker, key, name):
+    return [AirzoneRuntimeSensor(tracker, key, name, action) for action in ACTIVE_ACTIONS] + \
+        [AirzoneDutyCycleSensor(tracker, key, name)]
+
+
+async def async_setup_entry(
+    hass: core.HomeAssistant,
+    config_entry: config_entries.ConfigEntry,
+    async_add_entities,
+):
+    """Setup the runtime and floor sensors of the zones reporting their hvac action."""
+    session = get_session(hass, hass.data[DOMAIN][config_entry.entry_id])
+    if session.devices_owner != config_entry.entry_id:
+        # The sensors belong to the entry that created the climate devices
+        _LOGGER.info("Airzone runtime sensors for " + session.key + " are already set up")
+        return
+    tracker = session.runtime
+    sensors = []
+    for device in session.devices:
+        if device.unique_id is None or device.hvac_action is None:
+            continue
+        sensors += _sensors(tracker, device.unique_id, device.name)
+    if sensors:
+        sensors += _sensors(tracker, tracker.machine_key, "Airzone " + tracker.machine_key)
+        store = get_zone_store(hass)
+        sensors += _floor_sensors(store, session.floor) + _floor_sensors(store, BUILDING)
+    _LOGGER.info("Airzone runtime sensors " + str(len(sensors)))
+    async_add_entities(sensors)
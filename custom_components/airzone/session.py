@@ -0,0 +1,513 @@
+"""Shared controller sessions for the Airzone integration."""
+import asyncio
+import logging
+import threading
+import time
+
+from homeassistant.const import (
+    CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_SCAN_INTERVAL,
+    CONF_TIMEOUT,
+)
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+from .const import (
+    CONF_ENDPOINTS,
+    CONF_FLOOR,
+    CONF_FRAME_GAP,
+    CONF_LAST_DEVICE_ID,
+    CONF_MAX_CONCURRENT_REFRESH,
+    CONF_MAX_STALENESS,
+    CONF_POLL_BUDGET,
+    CONF_RATE_BURST,
+    CONF_RATE_LIMIT,
+    CONF_RETRIES,
+    CONF_TELEMETRY,
+    CONF_WORKER,
+    DATA_DISCOVERY,
+    DATA_SESSION_LOCKS,
+    DATA_SESSIONS,
+    DEFAULT_FLEET_POLL_BUDGET,
+    DEFAULT_FRAME_GAP,
+    DEFAULT_MAX_CONCURRENT_REFRESH,
+    DEFAULT_MAX_STALENESS,
+    DEFAULT_RATE_BURST,
+    DEFAULT_RATE_LIMIT,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT,
+    DISCOVERY_TIMEOUT,
+    DOMAIN,
+    FLEET_PROBE_TIMEOUT,
+    MAX_CONCURRENT_DISCOVERY,
+    OUTAGE_THRESHOLD,
+    RETRY_BACKOFF,
+    RETRY_BACKOFF_MAX,
+    SCAN_INTERVAL,
+    SIGNAL_REFRESHED,
+)
+from .backends import async_get_backend
+from .failover import FailoverModbusClient, parse_endpoints
+from .poller import get_poll_scheduler
+from .runtime import RuntimeTracker
+from .schedule import get_schedule_engine
+from .scheduler import PRIORITY_METADATA, PRIORITY_POLL, get_scheduler
+from .store import get_zone_store
+from .telemetry import TelemetryWriter
+from .worker import WorkerModbusClient
+
+_LOGGER = logging.getLogger(__name__)
+
+# The discovery each executor thread is running
+_discovery = threading.local()
+
+
+def _client(machine):
+    """Return the transport client of a library machine, None if unknown."""
+    gateway = getattr(machine, "_gateway", None)
+    if gateway is not None:
+        return gateway.client
+    return getattr(machine, "_api", None)
+
+
+def close_machine(machine):
+    """Close the transport client of a library machine, if it has one."""
+    client = _client(machine)
+    if client is not None and hasattr(client, "close"):
+        client.close()
+
+
+def _endpoints(machine):
+    """Return the health of the endpoints of a library machine, None if only one."""
+    router = getattr(_client(machine), "router", None)
+    if router is None or len(router.endpoints) < 2:
+        return None
+    return router.diagnostics()
+
+
+def configure_client(client, timeout):
+    """Set the response timeout of the client and disable its own retries.
+
+    Retries are the session's (CONF_RETRIES), pymodbus would otherwise send a
+    timed out request three more times before the entity sees the failure.
+    """
+    if isinstance(client, FailoverModbusClient):
+        for endpoint in client.clients:
+            configure_client(endpoint, timeout)
+        return
+    if hasattr(client, "set_timeout"):
+        if timeout is not None:
+            client.set_timeout(timeout)
+        return
+    # pymodbus keeps a copy of its parameters in the transaction manager
+    for owner in (client, getattr(client, "transaction", None)):
+        if owner is None:
+            continue
+        if hasattr(owner, "retries"):
+            owner.retries = 0
+        params = getattr(owner, "comm_params", None)
+        if params is not None and timeout is not None:
+            params.timeout_connect = timeout
+
+
+def modbus_gateway(config):
+    """Return the library gateway of a Modbus TCP configuration.
+
+    With CONF_WORKER its transport runs in a worker subprocess. With
+    CONF_ENDPOINTS the requests go through the best of the gateways.
+    """
+    from airzone.protocol import Gateway, modbus_factory
+
+    timeout = config.get(CONF_TIMEOUT, DEFAULT_TIMEOUT)
+    endpoints = [(config[CONF_HOST], config[CONF_PORT])] + \
+        parse_endpoints(config.get(CONF_ENDPOINTS), config[CONF_PORT])
+    if config.get(CONF_WORKER):
+        clients = [WorkerModbusClient(host, port, timeout) for host, port in endpoints]
+    else:
+        clients = [modbus_factory(host, port) for host, port in endpoints]
+    client = clients[0]
+    if len(clients) > 1:
+        client = FailoverModbusClient(clients, [f"{host}:{port}" for host, port in endpoints])
+    gateway = Gateway(client)
+    # Before the discovery, a silent controller fails within the timeout
+    configure_client(gateway.client, timeout)
+    return gateway
+
+
+def session_key(config):
+    """Return the identity of the controller a configuration points at."""
+    key = f"{config[CONF_HOST]}:{config[CONF_PORT]}:{config[CONF_DEVICE_ID]}"
+    if config.get(CONF_LAST_DEVICE_ID):
+        # A fleet, the whole slave id range
+        key += f"-{config[CONF_LAST_DEVICE_ID]}"
+    return key
+
+
+def poll_budget(config):
+    """Return the units refreshed per poll, 0 for all of them."""
+    default = DEFAULT_FLEET_POLL_BUDGET if config.get(CONF_LAST_DEVICE_ID) else 0
+    return config.get(CONF_POLL_BUDGET, default)
+
+
+class _Discovery:
+    """Hand-off of a machine built in the executor to the event loop.
+
+    Once the event loop gave up waiting, the factory is told to stop through
+    discovery_abandoned() and the machine it still returns is closed, so a
+    late discovery never leaks its connection.
+    """
+
+    def __init__(self, factory, config):
+        self._factory = factory
+        self._config = config
+        self._lock = threading.Lock()
+        self.abandoned = False
+        self.machine = None
+
+    def run(self):
+        _discovery.current = self
+        try:
+            machine = self._factory(self._config)
+        finally:
+            _discovery.current = None
+        with self._lock:
+            if not self.abandoned:
+                self.machine = machine
+                return machine
+        close_machine(machine)
+        raise TimeoutError("Airzone discovery abandoned")
+
+    def abandon(self):
+        """Give up on the discovery, return the machine it built meanwhile if any."""
+        with self._lock:
+            self.abandoned = True
+            return self.machine
+
+
+def discovery_abandoned():
+    """Return whether the discovery run by this thread was given up on."""
+    discovery = getattr(_discovery, "current", None)
+    return discovery is not None and discovery.abandoned
+
+
+class AirzoneSession:
+    """Connection and refresh loop shared by every owner of one controller.
+
+    Owners are config entries or YAML platforms. The session is connected
+    when the first owner acquires it and closed when the last one releases
+    it, so duplicated configurations never poll the controller twice.
+    """
+
+    def __init__(self, hass, config):
+        self.hass = hass
+        self.config = config
+        self.key = session_key(config)
+        self.floor = config.get(CONF_FLOOR) or self.key
+        self.scheduler = get_scheduler(hass, config[CONF_HOST], config[CONF_PORT])
+        self._configure_limiter()
+        self.backend = None
+        self.machine = None
+        self.devices = []
+        # The owner whose platforms created the entities of the controller
+        self.devices_owner = None
+        self.runtime = RuntimeTracker(hass, self.key)
+        self._owners = set()
+        self._unregister_poll = None
+        self._reapply_schedule = True
+        self._cursor = 0
+        self.telemetry = None
+        self._indicator = None
+        self._refreshed_at = None
+        self.skipped = 0
+        self.retried = 0
+
+    @property
+    def owners(self):
+        return frozenset(self._owners)
+
+    @property
+    def scan_interval(self):
+        return self.config.get(CONF_SCAN_INTERVAL, SCAN_INTERVAL.total_seconds())
+
+    @property
+    def discovery_timeout(self):
+        """Return how long the discovery may take, a fleet scan probes every id."""
+        timeout = DISCOVERY_TIMEOUT
+        last_device_id = self.config.get(CONF_LAST_DEVICE_ID)
+        if last_device_id:
+            limiter = self.scheduler.limiter
+            pace = max(limiter.min_gap, 1 / limiter.rate if limiter.rate else 0)
+            probes = last_device_id - self.config[CONF_DEVICE_ID] + 1
+            timeout += probes * (FLEET_PROBE_TIMEOUT + pace)
+        return timeout
+
+    def _configure_limiter(self):
+        # Every session of the gateway shares its limits, the last one set wins
+        self.scheduler.limiter.configure(
+            self.config.get(CONF_RATE_LIMIT, DEFAULT_RATE_LIMIT),
+            self.config.get(CONF_RATE_BURST, DEFAULT_RATE_BURST),
+            self.config.get(CONF_FRAME_GAP, DEFAULT_FRAME_GAP) / 1000)
+
+    async def _async_configure_timeout(self):
+        client = _client(self.machine)
+        if client is not None:
+            await self.hass.async_add_executor_job(
+                configure_client, client, self.config.get(CONF_TIMEOUT))
+
+    def diagnostics(self):
+        """Return the session state for the diagnostics."""
+        return {
+            "owners": len(self._owners),
+            "devices": [device.name for device in self.devices],
+            "skipped_refreshes": self.skipped,
+            "retried_refreshes": self.retried,
+            "scheduler": self.scheduler.diagnostics(),
+            "endpoints": _endpoints(self.machine),
+        }
+
+    async def async_connect(self):
+        """Build the library object for the controller.
+
+        Discoveries of different controllers run at once, up to
+        MAX_CONCURRENT_DISCOVERY, the gateway scheduler still serializes
+        the controllers sharing a gateway. One taking over its discovery
+        timeout fails, so a dead controller never holds back the others.
+        """
+        self.backend = await async_get_backend(self.hass, self.config[CONF_DEVICE_CLASS])
+        discovery = _Discovery(self.backend.factory, self.config)
+        async with get_discovery_limit(self.hass):
+            try:
+                async with asyncio.timeout(self.discovery_timeout):
+                    self.machine = await self.scheduler.async_run(
+                        self.hass, PRIORITY_METADATA, discovery.run)
+            except TimeoutError:
+                late = discovery.abandon()
+                if late is not None:
+                    await self.hass.async_add_executor_job(close_machine, late)
+                raise
+        try:
+            await self._async_configure_timeout()
+            await self.runtime.async_load()
+        except Exception:
+            # Never acquired, nobody would close it
+            await self.hass.async_add_executor_job(close_machine, self.machine)
+            raise
+
+    async def async_close(self):
+        """Stop the refresh loop and close the connection."""
+        if self._unregister_poll is not None:
+            self._unregister_poll()
+            self._unregister_poll = None
+        await self._async_stop_telemetry()
+        await self.runtime.async_save()
+        get_zone_store(self.hass).async_remove(self.floor, self.devices)
+        await self.hass.async_add_executor_job(close_machine, self.machine)
+
+    def async_start(self):
+        """Start the refresh loop of the controller."""
+        poller = get_poll_scheduler(self.hass)
+        poller.set_max_concurrent(
+            self.config.get(CONF_MAX_CONCURRENT_REFRESH, DEFAULT_MAX_CONCURRENT_REFRESH))
+        self._unregister_poll = poller.async_register(
+            self.key, self.async_refresh, self.scan_interval)
+        if self.config.get(CONF_TELEMETRY):
+            self._start_telemetry()
+
+    def _start_telemetry(self):
+        self.telemetry = TelemetryWriter(self.hass, self.key, self.config)
+        self.telemetry.async_start()
+
+    async def _async_stop_telemetry(self):
+        if self.telemetry is not None:
+            await self.telemetry.async_stop()
+            self.telemetry = None
+
+    async def async_apply_options(self, config):
+        """Apply changed options to the running connection and entities."""
+        interval = self.scan_interval
+        self.config = config
+        self._configure_limiter()
+        get_poll_scheduler(self.hass).set_max_concurrent(
+            config.get(CONF_MAX_CONCURRENT_REFRESH, DEFAULT_MAX_CONCURRENT_REFRESH))
+        if self._unregister_poll is not None and self.scan_interval != interval:
+            self._unregister_poll()
+            self._unregister_poll = get_poll_scheduler(self.hass).async_register(
+                self.key, self.async_refresh, self.scan_interval)
+        await self._async_configure_timeout()
+        for device in self.devices:
+            device.configure_refresh(config)
+        # Restarted so a new retention applies
+        await self._async_stop_telemetry()
+        if config.get(CONF_TELEMETRY):
+            self._start_telemetry()
+
+    def _due_devices(self):
+        """Return the devices to refresh, round-robin within the poll budget."""
+        budget = poll_budget(self.config)
+        if not budget or budget >= len(self.devices):
+            return self.devices
+        start = self._cursor % len(self.devices)
+        self._cursor = start + budget
+        return (self.devices[start:] + self.devices[:start])[:budget]
+
+    async def _async_changed(self):
+        """Read the change indicator, return whether the entities are due.
+
+        Returns None when the controller did not answer it.
+        """
+        max_staleness = self.config.get(CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS)
+        if self.backend.indicator is None or not max_staleness or not self.devices:
+            return True
+        try:
+            indicator = await self.scheduler.async_run(
+                self.hass, PRIORITY_POLL, self.backend.indicator, self)
+        except Exception:
+            _LOGGER.exception("Airzone error reading the change indicator of " + self.key)
+            indicator = None
+        if indicator is None:
+            self._indicator = None
+            return None
+        now = time.monotonic()
+        # Unavailable entities are retried on every poll
+        if indicator == self._indicator and now - self._refreshed_at < max_staleness \
+                and all(device.available for device in self.devices):
+            self.skipped += 1
+            return False
+        self._indicator = indicator
+        self._refreshed_at = now
+        return True
+
+    async def _async_prefetch(self, client, devices):
+        """Read the register blocks of the pass in one exchange with the worker."""
+        reads = [
+            read for device in devices if device.hass is not None
+            for read in device.register_reads()]
+        try:
+            await self.scheduler.async_run(
+                self.hass, PRIORITY_POLL, client.prefetch, reads, OUTAGE_THRESHOLD)
+        except Exception as err:
+            # The entities read their blocks one by one
+            _LOGGER.debug("Airzone prefetch of " + self.key + " failed: " + str(err))
+
+    async def _async_update(self, device):
+        try:
+            await device.async_update_ha_state(True)
+        except Exception:
+            _LOGGER.exception("Airzone error updating " + str(device.name))
+
+    async def _async_retry(self, devices):
+        """Update the entities that failed the pass again, with a backoff.
+
+        Each retry only reads the entities still failing, and of those the
+        tiers they did not read, so a flaky zone never costs a whole
+        system refresh. The entities sharing a snapshot expire together
+        and the first one fetches it for all.
+        """
+        delay = RETRY_BACKOFF
+        for _ in range(self.config.get(CONF_RETRIES, DEFAULT_RETRIES)):
+            devices = [device for device in devices if device.hass is not None]
+            if not devices:
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_BACKOFF_MAX)
+            for device in devices:
+                device.expire()
+            for device in devices:
+                await self._async_update(device)
+            self.retried += len(devices)
+            devices = [device for device in devices if not device.available]
+
+    async def async_refresh(self):
+        """Refresh the entities of the controller in a single pass.
+
+        The entities are only read when the change indicator of the
+        controller changed or they are older than max_staleness. After
+        OUTAGE_THRESHOLD entities in a row fail to read the controller the
+        others are marked unavailable without sending them a request,
+        otherwise the failed entities are retried, see _async_retry.
+        """
+        changed = await self._async_changed()
+        devices = [] if changed is False else self._due_devices()
+        # Not answering the indicator counts as an outage
+        failed = OUTAGE_THRESHOLD if changed is None else 0
+        client = _client(self.machine)
+        if failed < OUTAGE_THRESHOLD and hasattr(client, "prefetch"):
+            await self._async_prefetch(client, devices)
+        unavailable = []
+        for device in devices:
+            if device.hass is None:
+                continue
+            if failed >= OUTAGE_THRESHOLD:
+                device.async_mark_unavailable()
+                continue
+            await self._async_update(device)
+            failed = 0 if device.available else failed + 1
+            if not device.available:
+                unavailable.append(device)
+        if hasattr(client, "clear_prefetch"):
+            client.clear_prefetch()
+        outage = failed >= OUTAGE_THRESHOLD
+        if outage:
+            _LOGGER.info("Airzone controller " + self.key + " is not answering")
+            # It may have lost its state, written again once it is back
+            self._reapply_schedule = True
+        else:
+            await self._async_retry(unavailable)
+        self.runtime.async_sample(self.devices)
+        get_zone_store(self.hass).async_update(self.floor, self.devices)
+        if self.telemetry is not None:
+            self.telemetry.async_record(self.devices)
+        async_dispatcher_send(self.hass, SIGNAL_REFRESHED, self)
+        if self._reapply_schedule and not outage and \
+                any(device.entity_id and device.available for device in self.devices):
+            # First refresh since the controller connected or came back
+            self._reapply_schedule = False
+            await get_schedule_engine(self.hass).async_reapply(self)
+
+
+def get_discovery_limit(hass):
+    """Return the semaphore bounding the controllers discovered at once."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_DISCOVERY not in data:
+        data[DATA_DISCOVERY] = asyncio.Semaphore(MAX_CONCURRENT_DISCOVERY)
+    return data[DATA_DISCOVERY]
+
+
+async def async_acquire_session(hass, config, owner):
+    """Return the session of the controller, connecting it if needed."""
+    data = hass.data.setdefault(DOMAIN, {})
+    sessions = data.setdefault(DATA_SESSIONS, {})
+    key = session_key(config)
+    # Per controller, the others connect meanwhile
+    lock = data.setdefault(DATA_SESSION_LOCKS, {}).setdefault(key, asyncio.Lock())
+    async with lock:
+        session = sessions.get(key)
+        if session is None:
+            session = AirzoneSession(hass, config)
+            await session.async_connect()
+            session.async_start()
+            sessions[key] = session
+        else:
+            _LOGGER.info("Airzone sharing session " + key + " with " + str(session.owners))
+        session._owners.add(owner)
+    return session
+
+
+async def async_release_session(hass, config, owner):
+    """Drop an owner of the session and close it when nobody uses it."""
+    sessions = hass.data[DOMAIN].get(DATA_SESSIONS, {})
+    key = session_key(config)
+    session = sessions.get(key)
+    if session is None:
+        return
+    session._owners.discard(owner)
+    if not session._owners:
+        sessions.pop(key)
+        await session.async_close()
+
+
+def get_session(hass, config):
+    """Return the session already acquired for a configuration."""
+    return hass.data[DOMAIN][DATA_SESSIONS][session_key(config)]
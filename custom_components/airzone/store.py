@@ -0,0 +1,156 @@
+"""Latest values of every zone kept in columns for building aggregates."""
+from array import array
+import math
+
+from homeassistant.components.climate import HVACAction
+from homeassistant.const import UnitOfTemperature
+from homeassistant.core import callback
+from homeassistant.util.unit_conversion import TemperatureConverter
+
+from .const import BUILDING, DATA_ZONE_STORE, DOMAIN
+
+
+class ZoneStore:
+    """Temperature and demand of the zones of every controller.
+
+    Each zone owns a row of compact arrays and belongs to a floor. The sum
+    of temperatures and the count of zones and demanding zones of every
+    floor and of the whole building are kept up to date by removing the
+    old row from them and adding the new one, so an update is O(1) however
+    many zones there are. The row of a zone that stopped reporting is
+    marked invalid and left out of the aggregates until it reports again.
+    Temperatures are stored in Celsius whatever the unit of the zone.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._free = []
+        self.temperature = array('d')
+        self.demand = array('b')
+        self.floor = array('i')
+        self.valid = array('b')
+        self._floors = {}
+        self.floor_names = []
+        self._temperature_sum = array('d')
+        self._temperature_count = array('i')
+        self._demand_count = array('i')
+        self._zone_count = array('i')
+        self._listeners = []
+        self.sensor_floors = set()
+        self._floor_index(BUILDING)
+
+    def _floor_index(self, name):
+        if name not in self._floors:
+            self._floors[name] = len(self.floor_names)
+            self.floor_names.append(name)
+            self._temperature_sum.append(0.0)
+            self._temperature_count.append(0)
+            self._demand_count.append(0)
+            self._zone_count.append(0)
+        return self._floors[name]
+
+    def _apply(self, row, sign):
+        if not self.valid[row]:
+            return
+        temperature = self.temperature[row]
+        for index in {0, self.floor[row]}:
+            if not math.isnan(temperature):
+                self._temperature_sum[index] += sign * temperature
+                self._temperature_count[index] += sign
+            self._demand_count[index] += sign * self.demand[row]
+            self._zone_count[index] += sign
+
+    def set(self, key, floor, temperature, demanding):
+        """Store the values of a zone, None for an unknown temperature."""
+        row = self._rows.get(key)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self.temperature)
+                self.temperature.append(math.nan)
+                self.demand.append(0)
+                self.floor.append(0)
+                self.valid.append(0)
+            self._rows[key] = row
+        else:
+            self._apply(row, -1)
+        self.temperature[row] = math.nan if temperature is None else temperature
+        self.demand[row] = 1 if demanding else 0
+        self.floor[row] = self._floor_index(floor)
+        self.valid[row] = 1
+        self._apply(row, 1)
+
+    def invalidate(self, key):
+        """Leave a zone out of the aggregates until it is set again."""
+        row = self._rows.get(key)
+        if row is not None:
+            self._apply(row, -1)
+            self.temperature[row] = math.nan
+            self.demand[row] = 0
+            self.valid[row] = 0
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._apply(row, -1)
+            self.valid[row] = 0
+            self._free.append(row)
+
+    def zones(self, floor=BUILDING):
+        index = self._floors.get(floor)
+        return 0 if index is None else self._zone_count[index]
+
+    def demanding(self, floor=BUILDING):
+        index = self._floors.get(floor)
+        return 0 if index is None else self._demand_count[index]
+
+    def average_temperature(self, floor=BUILDING):
+        index = self._floors.get(floor)
+        if index is None or not self._temperature_count[index]:
+            return None
+        return self._temperature_sum[index] / self._temperature_count[index]
+
+    @callback
+    def async_add_listener(self, listener):
+        """Call listener with the floor names changed by every update."""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    @callback
+    def async_update(self, floor, devices):
+        """Store the zones of a controller after its refresh."""
+        for device in devices:
+            if device.unique_id is None:
+                continue
+            if not device.available:
+                self.invalidate(device.unique_id)
+                continue
+            action = device.hvac_action
+            if action is None:
+                continue
+            temperature = device.current_temperature
+            if temperature is not None and device.temperature_unit == UnitOfTemperature.FAHRENHEIT:
+                temperature = TemperatureConverter.convert(
+                    temperature, UnitOfTemperature.FAHRENHEIT, UnitOfTemperature.CELSIUS)
+            self.set(device.unique_id, floor, temperature,
+                     action in (HVACAction.HEATING, HVACAction.COOLING))
+        self._notify({BUILDING, floor})
+
+    @callback
+    def async_remove(self, floor, devices):
+        for device in devices:
+            self.remove(device.unique_id)
+        self._notify({BUILDING, floor})
+
+    def _notify(self, floors):
+        for listener in list(self._listeners):
+            listener(floors)
+
+
+def get_zone_store(hass):
+    """Return the zone store shared by every controller."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_ZONE_STORE not in data:
+        data[DATA_ZONE_STORE] = ZoneStore()
+    return data[DATA_ZONE_STORE]
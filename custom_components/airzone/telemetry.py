@@ -0,0 +1,174 @@
+"""Telemetry log of the raw snapshots of the Airzone controllers."""
+import asyncio
+from datetime import timedelta
+import json
+import logging
+import os
+import time
+
+from homeassistant.core import HassJob, callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import slugify
+
+from .const import (
+    CONF_TELEMETRY_MAX_AGE,
+    CONF_TELEMETRY_MAX_SIZE,
+    DEFAULT_TELEMETRY_MAX_AGE,
+    DEFAULT_TELEMETRY_MAX_SIZE,
+    TELEMETRY_DIR,
+    TELEMETRY_FILE_SIZE,
+    TELEMETRY_FLUSH_INTERVAL,
+    TELEMETRY_FLUSH_RECORDS,
+    TELEMETRY_MAX_BUFFER,
+)
+from .websocket import state_delta
+
+_LOGGER = logging.getLogger(__name__)
+
+SUFFIX = ".jsonl"
+
+
+def decode(lines):
+    """Yield (time, snapshot) for the lines of a telemetry file."""
+    snapshot = {}
+    for line in lines:
+        record = json.loads(line)
+        if record.get("k"):
+            snapshot = {}
+        for entity, fields in record["e"].items():
+            values = dict(snapshot.get(entity, {}))
+            values.update(fields)
+            snapshot[entity] = {field: value for field, value in values.items() if value is not None}
+        yield record["t"], {entity: dict(values) for entity, values in snapshot.items()}
+
+
+class TelemetryLog:
+    """Rotating, delta-encoded files of the snapshots of a controller.
+
+    Every line is a JSON object: t the time, e the fields of each entity.
+    The first line of a file is a keyframe (k) with every field, the others
+    only carry the fields changed since the line before, null for a field
+    no longer reported. Files decode on their own, so the oldest ones can
+    be deleted when the log goes over max_size bytes or max_age seconds.
+    Only used from the executor.
+    """
+
+    def __init__(self, path, max_size, max_age, file_size=TELEMETRY_FILE_SIZE, clock=time.time):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.file_size = file_size
+        self._clock = clock
+        self._file = None
+        self._last = None
+
+    def write(self, records):
+        """Append the (time, snapshot) records."""
+        if self._file is None or self._file.tell() >= self.file_size:
+            self._rotate(records[0][0])
+        for when, snapshot in records:
+            if self._last is None:
+                line = {"t": when, "k": 1, "e": snapshot}
+            else:
+                changed = {}
+                for entity, fields in snapshot.items():
+                    delta = state_delta(self._last.get(entity), fields)
+                    if delta:
+                        changed[entity] = delta
+                line = {"t": when, "e": changed}
+            self._file.write(json.dumps(line, separators=(",", ":"), default=str) + "\n")
+            self._last = snapshot
+        self._file.flush()
+
+    def _rotate(self, when):
+        self.close()
+        os.makedirs(self.path, exist_ok=True)
+        self._prune()
+        name = time.strftime("%Y%m%dT%H%M%S", time.gmtime(when)) + f"_{int(when * 1000) % 1000:03d}" + SUFFIX
+        # Buffered, the records of a flush go to disk in one write
+        self._file = open(os.path.join(self.path, name), "a", encoding="utf-8")
+        self._last = None
+
+    def files(self):
+        """Return the log files, oldest first."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            os.path.join(self.path, name) for name in os.listdir(self.path)
+            if name.endswith(SUFFIX))
+
+    def _prune(self):
+        files = self.files()
+        sizes = {path: os.path.getsize(path) for path in files}
+        total = sum(sizes.values())
+        now = self._clock()
+        for path in files:
+            if total <= self.max_size and now - os.path.getmtime(path) <= self.max_age:
+                break
+            os.remove(path)
+            total -= sizes[path]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TelemetryWriter:
+    """Buffer the snapshots of a session and write them from the executor.
+
+    Recording a snapshot only copies the entity values, the encoding and
+    the file I/O happen in a background job, one at a time. When the disk
+    does not keep up the oldest buffered snapshots are dropped, the polls
+    are never held back.
+    """
+
+    def __init__(self, hass, key, config):
+        self.hass = hass
+        self.log = TelemetryLog(
+            hass.config.path(TELEMETRY_DIR, slugify(key)),
+            config.get(CONF_TELEMETRY_MAX_SIZE, DEFAULT_TELEMETRY_MAX_SIZE) * 1024 * 1024,
+            config.get(CONF_TELEMETRY_MAX_AGE, DEFAULT_TELEMETRY_MAX_AGE) * 86400)
+        self._buffer = []
+        self._lock = asyncio.Lock()
+        self._unsub_timer = None
+        self.dropped = 0
+
+    @callback
+    def async_start(self):
+        self._unsub_timer = async_track_time_interval(
+            self.hass, HassJob(self._async_flush_job, "Airzone telemetry", cancel_on_shutdown=True),
+            timedelta(seconds=TELEMETRY_FLUSH_INTERVAL))
+
+    @callback
+    def async_record(self, devices):
+        """Buffer the snapshot of the devices after a refresh."""
+        snapshot = {
+            str(device.unique_id or device.name): device.telemetry() for device in devices}
+        self._buffer.append((round(time.time(), 3), snapshot))
+        if len(self._buffer) > TELEMETRY_MAX_BUFFER:
+            del self._buffer[0]
+            self.dropped += 1
+        if len(self._buffer) >= TELEMETRY_FLUSH_RECORDS and not self._lock.locked():
+            self.hass.async_create_background_task(self.async_flush(), "Airzone telemetry flush")
+
+    async def _async_flush_job(self, now=None):
+        await self.async_flush()
+
+    async def async_flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            records, self._buffer = self._buffer, []
+            try:
+                await self.hass.async_add_executor_job(self.log.write, records)
+            except OSError as err:
+                _LOGGER.warning("Airzone telemetry write failed: " + str(err))
+
+    async def async_stop(self):
+        """Write the buffered snapshots and close the log."""
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        await self.async_flush()
+        await self.hass.async_add_executor_job(self.log.close)
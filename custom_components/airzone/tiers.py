@@ -0,0 +1,63 @@
+"""Tiered refresh of controller register blocks."""
+import time
+
+from .const import DEFAULT_TIER_INTERVALS, TIER_FAST, TIER_MEDIUM, TIER_SLOW
+
+TIERS = (TIER_FAST, TIER_MEDIUM, TIER_SLOW)
+
+
+class TierTracker:
+    """Track which refresh tiers of a register map are due.
+
+    blocks maps each tier to the (start, count) register blocks holding its
+    fields. The slow tier is the whole map, so reading it refreshes every
+    tier at once.
+    """
+
+    def __init__(self, blocks, intervals=None):
+        self._blocks = blocks
+        self._intervals = dict(DEFAULT_TIER_INTERVALS)
+        self.set_intervals(intervals or {})
+        self._last = {}
+
+    def set_intervals(self, intervals):
+        """Change the refresh interval, in seconds, of some tiers."""
+        self._intervals.update(intervals)
+
+    def _is_due(self, tier, now):
+        last = self._last.get(tier)
+        return last is None or now - last >= self._intervals[tier]
+
+    def plan(self, now=None):
+        """Return the tiers that are due and the blocks to read for them."""
+        now = time.monotonic() if now is None else now
+        due = [tier for tier in TIERS if tier in self._blocks and self._is_due(tier, now)]
+        if TIER_SLOW in due:
+            return [tier for tier in TIERS if tier in self._blocks], list(self._blocks[TIER_SLOW])
+        return due, [block for tier in due for block in self._blocks[tier]]
+
+    def mark_done(self, tiers, now=None):
+        """Record that tiers have just been refreshed."""
+        now = time.monotonic() if now is None else now
+        for tier in tiers:
+            self._last[tier] = now
+
+    def covered(self, tiers, blocks):
+        """Return the tiers of a plan whose blocks are all among blocks."""
+        if TIER_SLOW in tiers:
+            return tiers if set(self._blocks[TIER_SLOW]) <= blocks else []
+        return [tier for tier in tiers if set(self._blocks[tier]) <= blocks]
+
+    def invalidate(self, *tiers):
+        """Make tiers due on the next refresh, all of them by default."""
+        for tier in tiers or TIERS:
+            self._last.pop(tier, None)
+
+
+def merge_block(state, start, values):
+    """Return a copy of state with values written from start."""
+    new_state = list(state or [])
+    if len(new_state) < start + len(values):
+        new_state.extend([0] * (start + len(values) - len(new_state)))
+    new_state[start:start + len(values)] = values
+    return new_state
@@ -0,0 +1,165 @@
+"""Websocket commands with the state of every Airzone controller at once."""
+import logging
+
+from homeassistant.components import websocket_api
+from homeassistant.components.climate import (
+    ATTR_CURRENT_HUMIDITY,
+    ATTR_CURRENT_TEMPERATURE,
+    ATTR_FAN_MODE,
+    ATTR_HVAC_ACTION,
+    ATTR_PRESET_MODE,
+)
+from homeassistant.const import ATTR_TEMPERATURE
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+import voluptuous as vol
+
+from .const import (
+    DATA_BUILDING,
+    DATA_SESSIONS,
+    DOMAIN,
+    SIGNAL_REFRESHED,
+    WS_TYPE_SNAPSHOT,
+    WS_TYPE_SUBSCRIBE,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Attributes of the climate states sent, besides the hvac mode (the state)
+ATTRIBUTES = (
+    ATTR_CURRENT_TEMPERATURE,
+    ATTR_TEMPERATURE,
+    ATTR_CURRENT_HUMIDITY,
+    ATTR_HVAC_ACTION,
+    ATTR_FAN_MODE,
+    ATTR_PRESET_MODE,
+)
+
+
+def entity_state(state):
+    """Return the compact form of a climate state, None values left out."""
+    if state is None:
+        return None
+    data = {"state": state.state}
+    for attribute in ATTRIBUTES:
+        value = state.attributes.get(attribute)
+        if value is not None:
+            data[attribute] = value
+    return data
+
+
+def state_delta(old, new):
+    """Return the fields of new that differ from old, None for the removed."""
+    if old is None or new is None:
+        return new
+    delta = {field: value for field, value in new.items() if old.get(field) != value}
+    delta.update({field: None for field in old if field not in new})
+    return delta
+
+
+class BuildingState:
+    """State of every controller, diffed once per refresh for all subscribers.
+
+    The states are read back from the state machine, so they are the values
+    the entities reported after the refresh, filters applied. After each
+    refresh of a controller the changed fields of its entities are sent to
+    every subscriber in a single message.
+    """
+
+    def __init__(self, hass):
+        self.hass = hass
+        self.controllers = {}
+        self._subscribers = {}
+
+    def _sessions(self):
+        return self.hass.data.get(DOMAIN, {}).get(DATA_SESSIONS, {})
+
+    def _controller_state(self, session):
+        return {
+            device.entity_id: entity_state(self.hass.states.get(device.entity_id))
+            for device in session.devices if device.entity_id}
+
+    @callback
+    def async_publish(self, session):
+        """Send the changes of a controller since its last publication."""
+        old = self.controllers.get(session.key, {})
+        new = self._controller_state(session)
+        self.controllers[session.key] = new
+        changed = {}
+        for entity_id, state in new.items():
+            delta = state_delta(old.get(entity_id), state)
+            if delta:
+                changed[entity_id] = delta
+        if changed:
+            message = {"controller": session.key, "changed": changed}
+            for send in list(self._subscribers.values()):
+                send(message)
+
+    @callback
+    def async_snapshot(self):
+        """Return the state of every controller.
+
+        Pending changes are published first, so the subscribers' deltas
+        always apply on top of the last snapshot.
+        """
+        sessions = self._sessions()
+        for session in sessions.values():
+            self.async_publish(session)
+        self.controllers = {key: self.controllers[key] for key in sessions}
+        return {
+            key: {"floor": session.floor, "entities": self.controllers[key]}
+            for key, session in sessions.items()}
+
+    @callback
+    def async_refreshed(self, session):
+        if self._subscribers:
+            self.async_publish(session)
+
+    @callback
+    def async_subscribe(self, key, send):
+        self._subscribers[key] = send
+
+        @callback
+        def unsubscribe():
+            self._subscribers.pop(key, None)
+
+        return unsubscribe
+
+
+def get_building_state(hass):
+    """Return the building state shared by the websocket connections."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_BUILDING not in data:
+        data[DATA_BUILDING] = BuildingState(hass)
+    return data[DATA_BUILDING]
+
+
+@websocket_api.websocket_command({vol.Required("type"): WS_TYPE_SNAPSHOT})
+@callback
+def websocket_snapshot(hass, connection, msg):
+    """Return the state of every controller, machine and zone."""
+    connection.send_result(msg["id"], {"controllers": get_building_state(hass).async_snapshot()})
+
+
+@websocket_api.websocket_command({vol.Required("type"): WS_TYPE_SUBSCRIBE})
+@callback
+def websocket_subscribe(hass, connection, msg):
+    """Send the snapshot, then one message of changes per refresh."""
+    building = get_building_state(hass)
+
+    @callback
+    def send(message):
+        connection.send_message(websocket_api.event_message(msg["id"], message))
+
+    connection.subscriptions[msg["id"]] = building.async_subscribe((connection, msg["id"]), send)
+    connection.send_result(msg["id"])
+    send({"controllers": building.async_snapshot()})
+
+
+@callback
+def async_setup_websocket(hass):
+    """Register the websocket commands."""
+    building = get_building_state(hass)
+    async_dispatcher_connect(hass, SIGNAL_REFRESHED, building.async_refreshed)
+    websocket_api.async_register_command(hass, websocket_snapshot)
+    websocket_api.async_register_command(hass, websocket_subscribe)
@@ -0,0 +1,200 @@
+"""Modbus TCP transport running in a worker subprocess.
+
+The integration side is WorkerModbusClient, a client with the interface of
+the pymodbus one whose requests are sent to the worker over its stdin and
+answered on its stdout, one JSON line each. The worker owns the socket to
+the gateway, so a misbehaving gateway only costs the worker process. Run as
+a script this module is the worker, it only needs pymodbus.
+"""
+from collections import namedtuple
+import json
+import logging
+import select
+import subprocess
+import sys
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds allowed to the worker on top of the timeouts of a request before
+# it is considered hung and killed, and between two starts of the worker.
+WORKER_GRACE = 2
+WORKER_RESTART_DELAY = 10
+
+WorkerResponse = namedtuple('WorkerResponse', ['registers'])
+
+
+class WorkerError(Exception):
+    """Raised when the worker or the gateway behind it fails a request."""
+
+
+class WorkerModbusClient:
+    """Modbus client whose transport runs in a supervised subprocess.
+
+    The worker is started on connect and started again, at most every
+    WORKER_RESTART_DELAY seconds, when it exits or stops answering. Reads
+    given to prefetch() are sent in a single request and served from its
+    answer until clear_prefetch(), so a refresh pass crosses the process
+    boundary once.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._process = None
+        self._started = None
+        self._lock = threading.Lock()
+        self._prefetched = {}
+        self.exchanges = 0
+        self.restarts = 0
+
+    def connect(self):
+        with self._lock:
+            self._start()
+        return True
+
+    def _start(self):
+        if self._process is not None and self._process.poll() is None:
+            return
+        if self._started is not None:
+            if time.monotonic() - self._started < WORKER_RESTART_DELAY:
+                raise WorkerError("Worker for " + str(self) + " is restarting")
+            self.restarts += 1
+            _LOGGER.warning("Airzone restarting the worker of " + str(self))
+        self._started = time.monotonic()
+        self._process = subprocess.Popen(
+            [sys.executable, __file__, self.host, str(self.port), str(self.timeout)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def _exchange(self, request, deadline):
+        """Send a request to the worker and return its answer."""
+        with self._lock:
+            self._start()
+            self.exchanges += 1
+            try:
+                self._process.stdin.write(json.dumps(request) + "\n")
+                self._process.stdin.flush()
+                ready, _, _ = select.select([self._process.stdout], [], [], deadline)
+                line = self._process.stdout.readline() if ready else ""
+            except OSError:
+                line = ""
+            if not line:
+                # Dead or hung, the next request starts a new one
+                self._stop()
+                raise WorkerError("No answer from the worker of " + str(self))
+        answer = json.loads(line)
+        if "error" in answer:
+            raise WorkerError(answer["error"])
+        return answer
+
+    def read_many(self, reads, max_failures=None):
+        """Read the (unit, address, count) input register blocks at once.
+
+        Returns the registers of each block, None for a failed read. After
+        max_failures failed reads in a row the rest are not sent and left
+        out of the result.
+        """
+        answer = self._exchange(
+            {"op": "read", "reads": [list(read) for read in reads], "max_failures": max_failures},
+            self.timeout * len(reads) + WORKER_GRACE)
+        return answer["values"]
+
+    def prefetch(self, reads, max_failures=None):
+        """Read blocks at once for the next reads, see read_many."""
+        self._prefetched = {}
+        if reads:
+            values = self.read_many(reads, max_failures)
+            self._prefetched = dict(zip((tuple(read) for read in reads), values))
+
+    def clear_prefetch(self):
+        self._prefetched = {}
+
+    def read_input_registers(self, address, count=1, device_id=1):
+        key = (device_id, address, count)
+        if key in self._prefetched:
+            registers = self._prefetched.pop(key)
+        else:
+            registers = self.read_many([key])[0]
+        if registers is None:
+            raise WorkerError("No answer from device " + str(device_id))
+        return WorkerResponse(registers)
+
+    def write_register(self, address, value, device_id=1):
+        self._exchange(
+            {"op": "write", "unit": device_id, "address": address, "value": value},
+            self.timeout + WORKER_GRACE)
+        return WorkerResponse([value])
+
+    def set_timeout(self, timeout):
+        if timeout != self.timeout:
+            self.timeout = timeout
+            # Given to the worker when it starts
+            with self._lock:
+                self._stop()
+                self._started = None
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def __str__(self):
+        # The library builds the unique ids of the entities from it, they
+        # stay the ones of the plain pymodbus client
+        return f"ModbusTcpClient {self.host}:{self.port}"
+
+
+def _read(client, reads, max_failures):
+    values = []
+    failed = 0
+    for unit, address, count in reads:
+        if max_failures and failed >= max_failures:
+            break
+        try:
+            if not client.connected:
+                client.connect()
+            response = client.read_input_registers(address, count=count, device_id=unit)
+            registers = None if response.isError() else list(response.registers)
+        except Exception:
+            registers = None
+        values.append(registers)
+        failed = failed + 1 if registers is None else 0
+    return values
+
+
+def serve(host, port, timeout, requests=sys.stdin, answers=sys.stdout):
+    """Answer the requests of the integration until its side is closed."""
+    from pymodbus.client import ModbusTcpClient
+
+    client = ModbusTcpClient(host, port=port, timeout=timeout, retries=0)
+    for line in requests:
+        request = json.loads(line)
+        try:
+            if request["op"] == "read":
+                answer = {"values": _read(client, request["reads"], request["max_failures"])}
+            else:
+                if not client.connected:
+                    client.connect()
+                response = client.write_register(
+                    request["address"], request["value"], device_id=request["unit"])
+                if response.isError():
+                    raise WorkerError(str(response))
+                answer = {}
+        except Exception as err:
+            answer = {"error": str(err) or type(err).__name__}
+        answers.write(json.dumps(answer) + "\n")
+        answers.flush()
+    client.close()
+
+
+if __name__ == "__main__":
+    # Run as a script, the integration modules must not shadow the libraries
+    del sys.path[0]
+    serve(sys.argv[1], int(sys.argv[2]), float(sys.argv[3]))
@@ -0,0 +1,350 @@
+"""Simulated controllers and a fault injecting proxy to test the transports."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import select
+import socket
+import socketserver
+import struct
+import termios
+import threading
+import time
+import tty
+
+from custom_components.airzone.rtu import crc16, frame
+
+
+class RtuSlave:
+    """Answer the RTU requests written to the pty slave end.
+
+    Requests are ignored when the port is not set to baudrate, as a device on
+    a bus at another speed would only see garbage.
+    """
+
+    def __init__(self, registers=None, device_id=1, baudrate=19200):
+        self.registers = dict(registers or {})
+        self.device_id = device_id
+        self.baudrate = baudrate
+        self.requests = []
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        os.write(self._stop_w, b'x')
+        self._thread.join()
+        for fd in (self._master, self._slave, self._stop_r, self._stop_w):
+            os.close(fd)
+
+    def _speed_matches(self):
+        speed = termios.tcgetattr(self._slave)[4]
+        return speed == getattr(termios, 'B' + str(self.baudrate))
+
+    def _serve(self):
+        buffer = b''
+        while True:
+            ready, _, _ = select.select([self._master, self._stop_r], [], [])
+            if self._stop_r in ready:
+                return
+            buffer += os.read(self._master, 256)
+            # Every request used is a fixed 8 bytes frame
+            while len(buffer) >= 8:
+                request, buffer = buffer[:8], buffer[8:]
+                self.requests.append((time.monotonic(), request))
+                response = self._answer(request)
+                if response is not None:
+                    os.write(self._master, response)
+
+    def _answer(self, request):
+        if not self._speed_matches() or request[0] != self.device_id:
+            return None
+        if crc16(request[:-2]) != struct.unpack('<H', request[-2:])[0]:
+            return None
+        function, address, value = struct.unpack('>BHH', request[1:6])
+        if function in (3, 4):
+            addresses = range(address, address + value)
+            if any(a not in self.registers for a in addresses):
+                return frame(self.device_id, bytes([function | 0x80, 2]))
+            values = [self.registers[a] for a in addresses]
+            return frame(self.device_id, struct.pack(
+                '>BB%dH' % value, function, 2 * value, *values))
+        if function == 6:
+            self.registers[address] = value
+            return frame(self.device_id, request[1:6])
+        return frame(self.device_id, bytes([function | 0x80, 1]))
+
+
+class TcpSlave(socketserver.ThreadingTCPServer):
+    """Modbus TCP gateway on localhost, unknown registers read as 0.
+
+    Every unit of device_ids answers from the same registers, the other ids
+    get the gateway target failed to respond exception.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, registers=None, device_ids=(1,)):
+        super().__init__(('127.0.0.1', 0), _ModbusTcpHandler)
+        self.registers = dict(registers or {})
+        self.device_ids = set(device_ids)
+        self.requests = 0
+        self.unit_requests = {}
+        self.connections = 0
+        self.port = self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def answer(self, unit, pdu):
+        function, address, value = struct.unpack('>BHH', pdu[:5])
+        if unit not in self.device_ids:
+            return bytes([function | 0x80, 0x0B])
+        self.unit_requests[unit] = self.unit_requests.get(unit, 0) + 1
+        if function in (3, 4):
+            values = [self.registers.get(a, 0) for a in range(address, address + value)]
+            return struct.pack('>BB%dH' % value, function, 2 * value, *values)
+        if function == 6:
+            self.registers[address] = value
+            return pdu[:5]
+        return bytes([function | 0x80, 1])
+
+
+class _ModbusTcpHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        self.server.connections += 1
+        buffer = b''
+        while True:
+            frames, buffer = modbus_frames(buffer)
+            for request in frames:
+                self.server.requests += 1
+                transaction, _, _, unit = struct.unpack('>HHHB', request[:7])
+                pdu = self.server.answer(unit, request[7:])
+                self.request.sendall(
+                    struct.pack('>HHHB', transaction, 0, len(pdu) + 1, unit) + pdu)
+            try:
+                data = self.request.recv(1024)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+
+
+class LocalApiServer(ThreadingHTTPServer):
+    """LocalAPI controller on localhost answering the state of its zones."""
+
+    daemon_threads = True
+
+    def __init__(self, zones):
+        super().__init__(('127.0.0.1', 0), _LocalApiHandler)
+        self.zones = zones
+        self.requests = 0
+        self.port = self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class _LocalApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _answer(self, data):
+        self.server.requests += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self._answer({'data': self.server.zones})
+
+    def do_PUT(self):
+        self._answer({})
+
+    def log_message(self, *args):
+        pass
+
+
+def modbus_frames(buffer):
+    """Split the complete Modbus TCP frames off buffer."""
+    frames = []
+    while len(buffer) >= 6:
+        size = 6 + struct.unpack('>H', buffer[4:6])[0]
+        if len(buffer) < size:
+            break
+        frames.append(buffer[:size])
+        buffer = buffer[size:]
+    return frames, buffer
+
+
+def http_frames(buffer):
+    """Split the complete HTTP requests off buffer."""
+    frames = []
+    while b'\r\n\r\n' in buffer:
+        head, rest = buffer.split(b'\r\n\r\n', 1)
+        length = 0
+        for line in head.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        if len(rest) < length:
+            break
+        frames.append(head + b'\r\n\r\n' + rest[:length])
+        buffer = rest[length:]
+    return frames, buffer
+
+
+TIMEOUT = 'timeout'
+RESET = 'reset'
+GARBAGE = 'garbage'
+OUTAGE = 'outage'
+FAULTS = [TIMEOUT, RESET, GARBAGE, OUTAGE]
+
+
+class FaultProxy:
+    """TCP proxy between the integration and a simulated controller.
+
+    Every request going through is counted, split with framing, and while
+    fault is set the proxy misbehaves like a failing gateway:
+    timeout swallows the requests, reset aborts the connection on a request,
+    garbage answers random bytes in place of the response and outage stops
+    listening, refusing every connection.
+    """
+
+    def __init__(self, target_port, framing=modbus_frames):
+        self.target_port = target_port
+        self.framing = framing
+        self.requests = 0
+        self._fault = None
+        self._lock = threading.Lock()
+        self._connections = []
+        self._listener = None
+        self.port = None
+
+    @property
+    def fault(self):
+        return self._fault
+
+    @fault.setter
+    def fault(self, fault):
+        with self._lock:
+            self._fault = fault
+            if fault == OUTAGE:
+                self._close_listener()
+                for connection in self._connections:
+                    _abort(connection)
+                self._connections = []
+            elif self._listener is None:
+                self._listen()
+
+    def __enter__(self):
+        with self._lock:
+            self._listen()
+        return self
+
+    def __exit__(self, *args):
+        with self._lock:
+            self._close_listener()
+            for connection in self._connections:
+                _abort(connection)
+
+    def _listen(self):
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', self.port or 0))
+        listener.listen()
+        self.port = listener.getsockname()[1]
+        self._listener = listener
+        threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+
+    def _close_listener(self):
+        if self._listener is not None:
+            # Wakes the accept() blocked in its thread
+            self._listener.shutdown(socket.SHUT_RDWR)
+            self._listener.close()
+            self._listener = None
+
+    def _accept(self, listener):
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            with self._lock:
+                self._connections += [client, upstream]
+            threading.Thread(target=self._requests, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._responses, args=(upstream, client), daemon=True).start()
+
+    def _requests(self, client, upstream):
+        buffer = b''
+        while True:
+            try:
+                data = client.recv(4096)
+            except OSError:
+                data = b''
+            if not data:
+                _abort(upstream)
+                return
+            frames, buffer = self.framing(buffer + data)
+            for request in frames:
+                self.requests += 1
+                if self._fault == TIMEOUT:
+                    continue
+                if self._fault == RESET:
+                    _abort(client)
+                    _abort(upstream)
+                    return
+                try:
+                    upstream.sendall(request)
+                except OSError:
+                    return
+
+    def _responses(self, upstream, client):
+        while True:
+            try:
+                data = upstream.recv(4096)
+            except OSError:
+                data = b''
+            if not data:
+                _abort(client)
+                return
+            if self._fault == GARBAGE:
+                data = bytes(random.getrandbits(8) for _ in data)
+            try:
+                client.sendall(data)
+            except OSError:
+                return
+
+
+def _abort(connection):
+    """Close a connection with a reset rather than an orderly shutdown."""
+    try:
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        # Wakes the recv() blocked in the other thread of the connection
+        connection.shutdown(socket.SHUT_RD)
+    except OSError:
+        pass
+    connection.close()
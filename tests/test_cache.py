@@ -0,0 +1,84 @@
+"""Tests for the controller snapshot cache."""
+import threading
+
+from custom_components.airzone.cache import SnapshotCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_snapshot_reused_while_fresh():
+    """Test the controller is only fetched again after the ttl."""
+    clock = FakeClock()
+    calls = []
+    cache = SnapshotCache(lambda: calls.append(1) or len(calls), ttl=2, clock=clock)
+
+    assert cache.get() == 1
+    clock.now = 1
+    assert cache.get() == 1
+    assert cache.get(force=True) == 2
+    clock.now = 4
+    assert cache.get() == 3
+    assert cache.fetches == 3
+
+
+def test_concurrent_reads_collapse():
+    """Test readers get the last snapshot while a fetch is in flight."""
+    clock = FakeClock()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 2:
+            started.set()
+            release.wait()
+        return len(calls)
+
+    cache = SnapshotCache(fetch, ttl=2, clock=clock)
+    assert cache.get() == 1
+    clock.now = 5
+    slow = threading.Thread(target=cache.get)
+    slow.start()
+    started.wait()
+
+    # Stale, but the fetch in flight is not repeated
+    assert cache.get() == 1
+    assert cache.collapsed == 1
+
+    release.set()
+    slow.join()
+    assert cache.get() == 2
+    assert len(calls) == 2
+
+
+def test_forced_read_waits_for_fetch_in_flight():
+    """Test a forced read fetches after the fetch in flight finishes."""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait()
+        return len(calls)
+
+    cache = SnapshotCache(fetch)
+    first = threading.Thread(target=cache.get)
+    first.start()
+    started.wait()
+    result = []
+    forced = threading.Thread(target=lambda: result.append(cache.get(force=True)))
+    forced.start()
+    release.set()
+    first.join()
+    forced.join()
+    assert result == [2]
@@ -2,10 +2,12 @@
 from unittest import mock
 
 from homeassistant.const import CONF_DEVICE_CLASS, CONF_DEVICE_ID, CONF_HOST, CONF_PORT
+import pytest
 from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+import voluptuous as vol
 
 from custom_components.airzone import config_flow
-from custom_components.airzone.const import CONF_SPEED_PERCENTAGE, DOMAIN
+from custom_components.airzone.const import CONF_ENDPOINTS, CONF_SPEED_PERCENTAGE, DOMAIN
 
 
 async def test_flow_user_init(hass):
@@ -25,7 +27,7 @@ async def test_flow_user_init(hass):
     assert expected == result
 
 
-@patch("custom_components.airzone.climate.airzone_factory")
+@patch("custom_components.airzone.aidoo.airzone_factory")
 async def test_add_airzone(m_airzone_factory, hass):
     """Test config flow options."""
     m_instance = mock.MagicMock()
@@ -50,3 +52,56 @@ async def test_add_airzone(m_airzone_factory, hass):
     config_entry.add_to_hass(hass)
     assert await hass.config_entries.async_setup(config_entry.entry_id)
     await hass.async_block_till_done()
+
+
+async def test_flow_aborts_on_duplicated_controller(hass):
+    """Test a second entry for the same controller is rejected."""
+    config = {
+        CONF_HOST: "192.168.1.10",
+        CONF_PORT: 5020,
+        CONF_DEVICE_ID: 1,
+        CONF_DEVICE_CLASS: "innobus",
+        CONF_SPEED_PERCENTAGE: False,
+    }
+    MockConfigEntry(
+        domain=DOMAIN, unique_id="192.168.1.10:5020:1", data=config
+    ).add_to_hass(hass)
+
+    result = await hass.config_entries.flow.async_init(
+        config_flow.DOMAIN, context={"source": "user"}, data=config
+    )
+    assert result["type"] == "abort"
+    assert result["reason"] == "already_configured"
+
+
+async def test_flow_rejects_invalid_endpoints(hass):
+    """Test a malformed endpoint is rejected by the form."""
+    result = await hass.config_entries.flow.async_init(
+        config_flow.DOMAIN, context={"source": "user"}
+    )
+    with pytest.raises(vol.Invalid):
+        await hass.config_entries.flow.async_configure(result["flow_id"], {
+            CONF_HOST: "192.168.1.10",
+            CONF_PORT: 5020,
+            CONF_ENDPOINTS: "192.168.1.11:gateway",
+        })
+
+
+@patch("custom_components.airzone.aidoo.airzone_factory")
+async def test_flow_closes_validation_connection(m_airzone_factory, hass):
+    """Test the connection built to validate the input is closed."""
+    machine = mock.MagicMock()
+    m_airzone_factory.return_value = machine
+    config = {
+        CONF_HOST: "192.168.1.10",
+        CONF_PORT: 5020,
+        CONF_DEVICE_ID: 1,
+        CONF_DEVICE_CLASS: "aidoo",
+        CONF_SPEED_PERCENTAGE: False,
+    }
+    with patch("custom_components.airzone.async_setup_entry", return_value=True):
+        result = await hass.config_entries.flow.async_init(
+            config_flow.DOMAIN, context={"source": "user"}, data=config
+        )
+    assert result["type"] == "create_entry"
+    machine._gateway.client.close.assert_called_once()
@@ -0,0 +1,101 @@
+"""Tests for the register block decoding."""
+from enum import Enum
+import random
+import struct
+from unittest import mock
+
+from airzone.innobus import Zone
+from airzone.localapi import Machine
+import pytest
+
+from custom_components.airzone.const import AVAILABLE_ATTRIBUTES_ZONE
+from custom_components.airzone.decode import INNOBUS_ZONE_LAYOUT, LOCALAPI_ZONE_LAYOUT
+from custom_components.airzone.localapi import LocalAPIMachine, LocalAPIOneZone, LocalAPIZone
+
+
+def _library_attributes(state):
+    machine = mock.MagicMock()
+    machine.read_registers.return_value = state
+    zone = Zone(machine, 1)
+    values = {}
+    for key, attribute in AVAILABLE_ATTRIBUTES_ZONE.items():
+        value = getattr(zone, attribute)()
+        values[key] = value.value if isinstance(value, Enum) else value
+    return values
+
+
+def test_zone_record_matches_library():
+    """Test the decoded zone attributes are the ones of the library."""
+    rand = random.Random(4)
+    for _ in range(50):
+        state = [rand.randrange(0x10000) for _ in range(13)]
+        record = INNOBUS_ZONE_LAYOUT.decode(state)._asdict()
+        expected = _library_attributes(state)
+        assert record == pytest.approx(expected)
+
+
+def test_zone_record_from_buffer():
+    """Test a raw response buffer decodes like its registers."""
+    state = list(range(100, 113))
+    buffer = memoryview(struct.pack('>13H', *state))
+    assert INNOBUS_ZONE_LAYOUT.decode(buffer) == INNOBUS_ZONE_LAYOUT.decode(state)
+    assert INNOBUS_ZONE_LAYOUT.decode(None) is None
+
+
+def test_localapi_record_matches_library():
+    """Test the decoded LocalAPI zone fields are the ones of the library."""
+    state = [
+        {'systemID': 1, 'zoneID': zone_id, 'name': f"Zone {zone_id}", 'on': 1,
+         'setpoint': 21.5, 'roomTemp': 20.1, 'maxTemp': 30, 'minTemp': 15,
+         'mode': 2, 'units': 1, 'humidity': 40, 'air_demand': 1,
+         'floor_demand': 0, 'speed': 3}
+        for zone_id in (1, 2)]
+    api = mock.MagicMock()
+    api.retrieve_state.side_effect = lambda system_id, zone_id: \
+        state if not zone_id else [z for z in state if z['zoneID'] == zone_id]
+    machine = Machine(api, 1)
+    record = LOCALAPI_ZONE_LAYOUT.decode(state[0])
+    assert record.mode == machine.operation_mode.value
+    assert record.speed == machine.speed.value
+    assert record.units == machine.units.value
+    for zone in machine.zones:
+        record = LOCALAPI_ZONE_LAYOUT.decode(zone.zone_state)
+        assert (record.name, record.on, record.setpoint, record.room_temp, record.max_temp,
+                record.min_temp, record.humidity, record.air_demand, record.floor_demand) == (
+            zone.name, zone.is_on(), zone.signal_temperature_value, zone.local_temperature,
+            zone.max_temp, zone.min_temp, zone.room_humidity, zone.air_demand,
+            zone.floor_demand)
+
+
+def test_localapi_record_missing_and_unknown_fields():
+    """Test older and newer firmwares decode with the defaults."""
+    record = LOCALAPI_ZONE_LAYOUT.decode(
+        {'zoneID': 3, 'on': 1, 'roomTemp': None, 'speed': None, 'antifreeze': 1})
+    assert record.zone_id == 3
+    assert record.on == 1
+    assert record.room_temp is None
+    assert record.name is None
+    assert record.speed == 0
+    assert record.mode == 1
+    assert not hasattr(record, 'antifreeze')
+    assert LOCALAPI_ZONE_LAYOUT.decode(None) is None
+
+
+def test_localapi_entities_without_record():
+    """Test the entities render before the first decode or once a zone is gone."""
+    api = mock.MagicMock(records={}, system_record=None)
+    zone = mock.MagicMock(_api=api, _zone_id=1)
+    zone.name = "Zone 1"
+    machine = mock.MagicMock(_api=api, _machine_id=1, zones=[zone])
+    for entity in (LocalAPIZone(zone, cache=mock.MagicMock()),
+                   LocalAPIOneZone(machine, cache=mock.MagicMock())):
+        assert entity.hvac_mode is None
+        assert entity.hvac_action is None
+        assert entity.current_temperature is None
+        assert entity.target_temperature is None
+        assert entity.current_humidity is None
+        assert entity.min_temp == 7
+        assert entity.max_temp == 35
+    entity = LocalAPIMachine(machine, cache=mock.MagicMock())
+    assert entity.hvac_mode is None
+    assert entity.fan_mode is None
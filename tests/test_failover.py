@@ -0,0 +1,154 @@
+"""Tests for the failover between the endpoints of a controller."""
+from homeassistant.const import (
+    CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TIMEOUT,
+)
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_ENDPOINTS,
+    CONF_MAX_STALENESS,
+    CONF_SPEED_PERCENTAGE,
+    DOMAIN,
+    ENDPOINT_COOLDOWN,
+    ENDPOINT_PROBE_INTERVAL,
+)
+from custom_components.airzone.aidoo import _connect
+from custom_components.airzone.failover import EndpointRouter, parse_endpoints
+from custom_components.airzone.session import _client, get_session
+
+from .simulator import OUTAGE, FaultProxy, TcpSlave, modbus_frames
+
+
+def test_parse_endpoints():
+    """Test the port of the entry is the default one."""
+    assert parse_endpoints("10.0.0.2, 10.0.0.3:503,", 502) == [("10.0.0.2", 502), ("10.0.0.3", 503)]
+    assert parse_endpoints(None, 502) == []
+
+
+def test_router_prefers_fastest_healthy():
+    """Test the requests go to the fastest endpoint and fail over on errors."""
+    now = [0.0]
+    latencies = {0: 0.5, 1: 0.1}
+    down = set()
+
+    def request(index):
+        if index in down:
+            now[0] += 1
+            raise ConnectionError("down")
+        now[0] += latencies[index]
+        return index
+
+    router = EndpointRouter(["a", "b"], clock=lambda: now[0])
+    # Each endpoint is measured once, then the fastest wins
+    assert [router.run(request) for _ in range(4)] == [0, 1, 1, 1]
+    assert router.endpoints[1].latency == pytest.approx(0.1)
+
+    down.add(1)
+    assert router.run(request) == 0
+    assert router.failovers == 1
+    assert router.run(request) == 0
+    assert router.endpoints[1].requests == 4
+
+    # Back after its cooldown, probed again
+    down.clear()
+    now[0] += ENDPOINT_COOLDOWN
+    assert router.run(request) == 1
+
+    # Not used for a while, both are measured again
+    now[0] += ENDPOINT_PROBE_INTERVAL
+    assert [router.run(request) for _ in range(3)] == [0, 1, 1]
+
+
+def test_router_all_down():
+    """Test the first endpoint back is tried alone when all are down."""
+    now = [0.0]
+    router = EndpointRouter(["a", "b"], clock=lambda: now[0])
+    tried = []
+
+    def request(index):
+        tried.append(index)
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        router.run(request)
+    assert tried == [0, 1]
+    with pytest.raises(ConnectionError):
+        router.run(request)
+    assert tried == [0, 1, 0]
+
+
+async def test_failover_between_gateways(hass, socket_enabled):
+    """Test the entities stay available through the second gateway."""
+    registers = {4: 1, 9: 0b11, 256 + 10: 215}
+    with TcpSlave(registers) as first, TcpSlave(registers) as second, \
+            FaultProxy(first.port, modbus_frames) as proxy:
+        config = {
+            CONF_HOST: '127.0.0.1',
+            CONF_PORT: proxy.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: 'innobus',
+            CONF_SPEED_PERCENTAGE: False,
+            CONF_ENDPOINTS: f"127.0.0.1:{second.port}",
+        }
+        entry = MockConfigEntry(
+            domain=DOMAIN, data=config, options={CONF_TIMEOUT: 0.3, CONF_MAX_STALENESS: 0})
+        entry.add_to_hass(hass)
+        with patch('airzone.protocol.time.sleep'):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        session._unregister_poll()
+        router = _client(session.machine).router
+        zone = session.devices[1]
+
+        async def refresh():
+            for device in session.devices:
+                device._snapshot.invalidate()
+            await session.async_refresh()
+
+        await refresh()
+        assert all(device.available for device in session.devices)
+        assert all(endpoint.latency is not None for endpoint in router.endpoints)
+
+        # The second gateway is the standby one
+        router.endpoints[1].latency = 1
+        proxy.fault = OUTAGE
+        requests = second.requests
+        await refresh()
+        assert all(device.available for device in session.devices)
+        assert hass.states.get(zone.entity_id).attributes['current_temperature'] == 21.5
+        assert second.requests > requests
+        assert session.diagnostics()["endpoints"]["endpoints"][0]["healthy"] is False
+
+        # Back, the first gateway still sits out its cooldown
+        proxy.fault = None
+        sent = proxy.requests
+        await refresh()
+        assert proxy.requests == sent
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+
+def test_endpoints_keep_unique_ids(socket_enabled):
+    """Test adding endpoints does not change the unique ids of the entities."""
+    with TcpSlave({1: 220, 2: 215}) as first, TcpSlave({1: 220, 2: 215}) as second:
+        config = {
+            CONF_HOST: '127.0.0.1',
+            CONF_PORT: first.port,
+            CONF_DEVICE_ID: 1,
+            CONF_SPEED_PERCENTAGE: False,
+        }
+        with patch('airzone.protocol.time.sleep'):
+            plain = _connect(config)
+            failover = _connect({**config, CONF_ENDPOINTS: f"127.0.0.1:{second.port}"})
+        try:
+            assert failover.unique_id() == plain.unique_id()
+        finally:
+            _client(plain).close()
+            _client(failover).close()
@@ -0,0 +1,261 @@
+"""Fault injection between the integration and simulated controllers.
+
+Each backend is set up against a simulated controller behind a FaultProxy.
+While a fault is injected the tests measure how long the entities take to be
+marked unavailable and the requests every refresh pass sends, then how long
+they take to recover once the fault is cleared. A retry storm, or a timeout
+that leaves the entities available, fails these tests.
+"""
+import struct
+import time
+from unittest import mock
+
+from homeassistant.const import (
+    CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TIMEOUT,
+)
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_MAX_STALENESS,
+    CONF_RETRIES,
+    CONF_SPEED_PERCENTAGE,
+    DOMAIN,
+    OUTAGE_THRESHOLD,
+)
+from custom_components.airzone.session import get_session
+
+from .simulator import (
+    FAULTS,
+    OUTAGE,
+    FaultProxy,
+    LocalApiServer,
+    TcpSlave,
+    http_frames,
+    modbus_frames,
+)
+
+TIMEOUT = 0.3
+FAULT_PASSES = 3
+# Refresh passes allowed to mark every entity unavailable and to recover
+MAX_PASSES_UNAVAILABLE = 1
+MAX_PASSES_RECOVERY = 2
+# Wall time allowed on top of the timeouts of the requests sent in a pass
+SLACK = 1.0
+
+
+def _zone(zone_id):
+    return {
+        'systemID': 1, 'zoneID': zone_id, 'name': f"Zone {zone_id}", 'on': 1,
+        'setpoint': 21, 'roomTemp': 20.5, 'maxTemp': 30, 'minTemp': 15,
+        'mode': 3, 'units': 0, 'humidity': 40, 'air_demand': 0,
+        'floor_demand': 0, 'speed': 0, 'modes': [1, 2, 3, 4, 5],
+    }
+
+
+def _innobus():
+    # Zones 1 and 2 configured, the clock already set
+    return TcpSlave({4: 1, 9: 0b11}), modbus_frames
+
+
+def _aidoo():
+    return TcpSlave({1: 22, 2: 21}), modbus_frames
+
+
+def _localapi():
+    return LocalApiServer([_zone(1), _zone(2)]), http_frames
+
+
+CONTROLLERS = {
+    'innobus': _innobus,
+    'aidoo': _aidoo,
+    'localapi': _localapi,
+}
+
+
+def _expire_snapshots(session):
+    # Passes are a scan interval apart, longer than the snapshot ttl
+    for device in session.devices:
+        device._snapshot.invalidate()
+        cache = getattr(device, '_cache', None)
+        if cache is not None:
+            cache.invalidate()
+
+
+async def _refresh_until(session, predicate, max_passes):
+    """Refresh until predicate holds, return the passes and seconds taken."""
+    start = time.monotonic()
+    for passes in range(1, max_passes + 1):
+        _expire_snapshots(session)
+        await session.async_refresh()
+        if predicate():
+            return passes, time.monotonic() - start
+    return None, time.monotonic() - start
+
+
+def _all_available(session):
+    return lambda: all(device.available for device in session.devices)
+
+
+def _none_available(session):
+    return lambda: not any(device.available for device in session.devices)
+
+
+@pytest.mark.parametrize('fault', FAULTS)
+@pytest.mark.parametrize('device_class', list(CONTROLLERS))
+async def test_fault_recovery(hass, socket_enabled, device_class, fault):
+    """Test a controller fault is detected and recovered in bounded passes."""
+    controller, framing = CONTROLLERS[device_class]()
+    with controller, FaultProxy(controller.port, framing) as proxy:
+        config = {
+            CONF_HOST: '127.0.0.1',
+            CONF_PORT: proxy.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: device_class,
+            CONF_SPEED_PERCENTAGE: False,
+        }
+        entry = MockConfigEntry(
+            domain=DOMAIN, data=config,
+            options={CONF_TIMEOUT: TIMEOUT, CONF_RETRIES: 0})
+        entry.add_to_hass(hass)
+        # The TCP gateway settling delay of the library
+        with patch('airzone.protocol.time.sleep'):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        # The test drives the refresh passes itself
+        session._unregister_poll()
+        assert len(session.devices) > 1 or device_class == 'aidoo'
+
+        passes, _ = await _refresh_until(session, _all_available(session), 1)
+        assert passes == 1
+
+        proxy.fault = fault
+        sent = proxy.requests
+        passes, elapsed = await _refresh_until(
+            session, _none_available(session), MAX_PASSES_UNAVAILABLE)
+        assert passes is not None, f"{fault}: entities still available"
+        # At most OUTAGE_THRESHOLD entities time out before the rest are skipped
+        assert elapsed < OUTAGE_THRESHOLD * TIMEOUT + SLACK
+
+        for _ in range(FAULT_PASSES - 1):
+            await _refresh_until(session, lambda: True, 1)
+        amplification = (proxy.requests - sent) / FAULT_PASSES
+        assert amplification <= OUTAGE_THRESHOLD, \
+            f"{fault}: {amplification} requests per refresh pass"
+        if fault == OUTAGE:
+            assert proxy.requests == sent
+
+        proxy.fault = None
+        passes, elapsed = await _refresh_until(
+            session, _all_available(session), MAX_PASSES_RECOVERY)
+        assert passes is not None, f"{fault}: entities did not recover"
+        assert elapsed < MAX_PASSES_RECOVERY * (OUTAGE_THRESHOLD * TIMEOUT + SLACK)
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+
+class _FlakySlave(TcpSlave):
+    """Innobus gateway failing the reads from an address a number of times."""
+
+    def __init__(self, registers, address, failures):
+        super().__init__(registers)
+        self.address = address
+        self.failures = failures
+        self.addresses = []
+
+    def answer(self, unit, pdu):
+        function, address, _ = struct.unpack('>BHH', pdu[:5])
+        self.addresses.append(address)
+        if function == 4 and address >= self.address and self.failures:
+            self.failures -= 1
+            return bytes([function | 0x80, 0x0B])
+        return super().answer(unit, pdu)
+
+
+async def test_flaky_zone_retried_alone(hass, socket_enabled):
+    """Test only the failed zone is read again, the others publish."""
+    # Zone 2 registers start at 512
+    with _FlakySlave({4: 1, 9: 0b11}, 512, 0) as slave:
+        config = {
+            CONF_HOST: '127.0.0.1',
+            CONF_PORT: slave.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: 'innobus',
+            CONF_SPEED_PERCENTAGE: False,
+        }
+        entry = MockConfigEntry(
+            domain=DOMAIN, data=config,
+            options={CONF_TIMEOUT: TIMEOUT, CONF_RETRIES: 2, CONF_MAX_STALENESS: 0})
+        entry.add_to_hass(hass)
+        with patch('airzone.protocol.time.sleep'):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        session._unregister_poll()
+        machine, zone_1, zone_2 = session.devices
+        await _refresh_until(session, _all_available(session), 1)
+
+        with patch('custom_components.airzone.session.RETRY_BACKOFF', 0):
+            # Recovered by the first retry
+            slave.failures = 1
+            slave.addresses = []
+            await _refresh_until(session, lambda: True, 1)
+            assert _all_available(session)()
+            assert session.retried == 1
+            assert slave.addresses == [0, 256 + 9, 512 + 9, 512 + 9]
+
+            # Still failing after the retries, the rest of the system is fresh
+            slave.failures = 3
+            slave.addresses = []
+            await _refresh_until(session, lambda: True, 1)
+            assert machine.available and zone_1.available and not zone_2.available
+            assert slave.addresses == [0, 256 + 9] + [512 + 9] * 3
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+
+async def test_schedule_reapplied_after_outage(hass, socket_enabled):
+    """Test the schedule is written again once a lost controller is back."""
+    controller, framing = _innobus()
+    with controller, FaultProxy(controller.port, framing) as proxy:
+        config = {
+            CONF_HOST: '127.0.0.1',
+            CONF_PORT: proxy.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: 'innobus',
+            CONF_SPEED_PERCENTAGE: False,
+        }
+        entry = MockConfigEntry(
+            domain=DOMAIN, data=config,
+            options={CONF_TIMEOUT: TIMEOUT, CONF_RETRIES: 0})
+        entry.add_to_hass(hass)
+        with patch('airzone.protocol.time.sleep'):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        session._unregister_poll()
+
+        engine = mock.MagicMock(async_reapply=mock.AsyncMock())
+        with patch('custom_components.airzone.session.get_schedule_engine', return_value=engine):
+            await _refresh_until(session, _all_available(session), 1)
+            assert engine.async_reapply.await_count == 1
+
+            proxy.fault = OUTAGE
+            await _refresh_until(session, lambda: True, 2)
+            assert engine.async_reapply.await_count == 1
+
+            proxy.fault = None
+            await _refresh_until(session, _all_available(session), MAX_PASSES_RECOVERY)
+            assert engine.async_reapply.await_count == 2
+            await _refresh_until(session, lambda: True, 1)
+            assert engine.async_reapply.await_count == 2
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
@@ -0,0 +1,48 @@
+"""Tests for the reporting filters."""
+from custom_components.airzone.filters import ReportFilter
+
+
+class FakeClock:
+    """Monotonic clock moved by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_jitter_below_deadband_is_held():
+    """Sensor jitter does not change the reported value."""
+    report = ReportFilter(deadband=0.2, step=0.1, clock=FakeClock())
+    assert report.update(21.04) == 21.0
+    assert report.update(21.12) == 21.0
+    assert report.update(20.93) == 21.0
+    assert report.update(21.0) == 21.0
+
+
+def test_changes_accumulate_past_deadband():
+    """A slow drift is reported once it adds up to the deadband."""
+    report = ReportFilter(deadband=0.2, step=0.1, clock=FakeClock())
+    report.update(21.0)
+    assert report.update(21.1) == 21.0
+    assert report.update(21.2) == 21.2
+    assert report.update(21.2) == 21.2
+
+
+def test_held_change_is_reported_after_max_age():
+    """A small change is not held forever."""
+    clock = FakeClock()
+    report = ReportFilter(deadband=2, step=1, max_age=60, clock=clock)
+    assert report.update(45.2) == 45
+    assert report.update(45.6) == 45
+    clock.now = 61
+    assert report.update(45.6) == 46
+    assert report.update(None) is None
+
+
+def test_without_deadband_values_pass_through():
+    """A zero deadband and step report the raw value."""
+    report = ReportFilter(clock=FakeClock())
+    assert report.update(21.04) == 21.04
+    assert report.update(21.05) == 21.05
@@ -0,0 +1,91 @@
+"""Tests for the Aidoo fleets."""
+from unittest import mock
+
+from homeassistant.const import CONF_DEVICE_CLASS, CONF_DEVICE_ID, CONF_HOST, CONF_PORT
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_LAST_DEVICE_ID,
+    CONF_POLL_BUDGET,
+    CONF_SPEED_PERCENTAGE,
+    DISCOVERY_TIMEOUT,
+    DOMAIN,
+    FLEET_PROBE_TIMEOUT,
+)
+from custom_components.airzone.aidoo import _scan
+from custom_components.airzone.session import (
+    AirzoneSession,
+    _Discovery,
+    get_session,
+    poll_budget,
+    session_key,
+)
+
+from .simulator import TcpSlave
+
+CONFIG = {
+    CONF_HOST: "127.0.0.1",
+    CONF_DEVICE_ID: 1,
+    CONF_DEVICE_CLASS: "aidoo",
+    CONF_SPEED_PERCENTAGE: False,
+}
+
+
+def test_fleet_session_key():
+    """Test a fleet is a controller of its own, apart from its first unit."""
+    config = {**CONFIG, CONF_PORT: 5020}
+    fleet = {**config, CONF_LAST_DEVICE_ID: 40}
+    assert session_key(fleet) == "127.0.0.1:5020:1-40"
+    assert session_key(fleet) != session_key(config)
+    assert poll_budget(config) == 0
+    assert poll_budget(fleet) == 10
+    assert poll_budget({**fleet, CONF_POLL_BUDGET: 0}) == 0
+
+
+async def test_fleet_polls_units_round_robin(hass, socket_enabled):
+    """Test the units found share a connection and the poll budget."""
+    with TcpSlave({1: 220, 2: 215}, device_ids=(3, 5, 8)) as slave:
+        config = {**CONFIG, CONF_PORT: slave.port, CONF_LAST_DEVICE_ID: 10}
+        entry = MockConfigEntry(domain=DOMAIN, data=config, options={CONF_POLL_BUDGET: 2})
+        entry.add_to_hass(hass)
+        with patch("airzone.protocol.time.sleep"):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        session._unregister_poll()
+
+        assert [device.name for device in session.devices] == ["Aidoo 3", "Aidoo 5", "Aidoo 8"]
+        # The scan probes over the shared connection
+        assert slave.connections == 1
+
+        slave.unit_requests = {}
+        for _ in range(3):
+            for device in session.devices:
+                device._snapshot.invalidate()
+            await session.async_refresh()
+        assert slave.unit_requests == {3: 2, 5: 2, 8: 2}
+        assert slave.connections == 1
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+
+async def test_scan_stops_when_abandoned(hass):
+    """Test a fleet scan gets time for its probes and stops once given up on."""
+    config = {**CONFIG, CONF_PORT: 5020, CONF_LAST_DEVICE_ID: 247}
+    timeout = AirzoneSession(hass, config).discovery_timeout
+    assert timeout >= DISCOVERY_TIMEOUT + 247 * FLEET_PROBE_TIMEOUT
+
+    client = mock.MagicMock(spec=["read_input_registers"])
+    discovery = _Discovery(lambda config: _scan(config, mock.MagicMock(client=client)), config)
+
+    def read(**kwargs):
+        if client.read_input_registers.call_count == 3:
+            discovery.abandon()
+        return mock.MagicMock(**{"isError.return_value": False})
+
+    client.read_input_registers.side_effect = read
+    with pytest.raises(TimeoutError):
+        discovery.run()
+    assert client.read_input_registers.call_count == 3
@@ -0,0 +1,99 @@
+"""Tests for the change indicator read before refreshing the entities."""
+from homeassistant.const import (
+    CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+)
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_MAX_STALENESS,
+    CONF_SPEED_PERCENTAGE,
+    DOMAIN,
+)
+from custom_components.airzone.session import get_session
+
+from .simulator import LocalApiServer, TcpSlave
+
+
+async def _setup(hass, device_class, port):
+    config = {
+        CONF_HOST: '127.0.0.1',
+        CONF_PORT: port,
+        CONF_DEVICE_ID: 1,
+        CONF_DEVICE_CLASS: device_class,
+        CONF_SPEED_PERCENTAGE: False,
+    }
+    entry = MockConfigEntry(domain=DOMAIN, data=config, options={CONF_MAX_STALENESS: 3600})
+    entry.add_to_hass(hass)
+    with patch('airzone.protocol.time.sleep'):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    session = get_session(hass, {**config, **entry.options})
+    session._unregister_poll()
+    return entry, session
+
+
+async def _requests(controller, session):
+    """Refresh once, return the requests sent."""
+    for device in session.devices:
+        device._snapshot.invalidate()
+        cache = getattr(device, '_cache', None)
+        if cache is not None:
+            cache.invalidate()
+    sent = controller.requests
+    await session.async_refresh()
+    return controller.requests - sent
+
+
+async def test_innobus_reads_zones_on_change(hass, socket_enabled):
+    """Test the zones are only read when the machine summary changes."""
+    with TcpSlave({4: 1, 9: 0b11}) as slave:
+        entry, session = await _setup(hass, 'innobus', slave.port)
+        full = await _requests(slave, session)
+        assert full > 1
+
+        # Steady state, the indicator only
+        assert await _requests(slave, session) == 1
+        # The clock is not part of it
+        slave.registers[4] = 2
+        assert await _requests(slave, session) == 1
+        assert session.skipped == 2
+
+        # A zone starts demanding
+        slave.registers[13] = 1
+        assert await _requests(slave, session) == full
+        assert await _requests(slave, session) == 1
+
+        # Past max staleness
+        session._refreshed_at -= 3600
+        assert await _requests(slave, session) == full
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+
+async def test_localapi_one_request_per_refresh(hass, socket_enabled):
+    """Test the entities of a system share its state, read on every refresh."""
+    zones = [
+        {'systemID': 1, 'zoneID': zone_id, 'name': f"Zone {zone_id}", 'on': 1,
+         'setpoint': 21, 'roomTemp': 20.5, 'maxTemp': 30, 'minTemp': 15,
+         'mode': 3, 'units': 0, 'humidity': 40, 'air_demand': 0,
+         'floor_demand': 0, 'speed': 0, 'modes': [1, 2, 3, 4, 5]}
+        for zone_id in (1, 2)]
+    with LocalApiServer(zones) as server:
+        entry, session = await _setup(hass, 'localapi', server.port)
+        zone = session.devices[1]
+        await _requests(server, session)
+
+        # No indicator, the system request is the cheapest there is
+        assert await _requests(server, session) == 1
+        assert session.skipped == 0
+
+        zones[0]['roomTemp'] = 23
+        assert await _requests(server, session) == 1
+        assert hass.states.get(zone.entity_id).attributes['current_temperature'] == 23
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
@@ -0,0 +1,58 @@
+"""Tests for the staggered refresh scheduling."""
+import asyncio
+from unittest import mock
+
+from custom_components.airzone.poller import PollScheduler
+
+
+async def test_phases_spread_over_interval(hass):
+    """Test controllers get evenly spaced and stable phases."""
+    poller = PollScheduler(hass)
+    keys = ["10.0.0.%d:502:1" % i for i in range(4)]
+    unregisters = [poller.async_register(key, mock.AsyncMock(), 10) for key in keys]
+
+    phases = sorted(poller.phase(key) for key in keys)
+    assert phases == [0, 2.5, 5, 7.5]
+
+    again = PollScheduler(hass)
+    for key in reversed(keys):
+        again.async_register(key, mock.AsyncMock(), 10)
+    assert {key: again.phase(key) for key in keys} == {
+        key: poller.phase(key) for key in keys}
+
+    unregisters[0]()
+    assert sorted(poller.phase(key) for key in keys[1:]) == [0, 10 / 3, 20 / 3]
+    for unregister in unregisters[1:]:
+        unregister()
+    for key in keys:
+        again._async_unregister(key)
+
+
+async def test_concurrent_refreshes_capped(hass):
+    """Test no more than max_concurrent refreshes run at once."""
+    poller = PollScheduler(hass, max_concurrent=2)
+    running = []
+    peak = []
+    release = asyncio.Event()
+
+    async def refresh():
+        running.append(1)
+        peak.append(len(running))
+        await release.wait()
+        running.pop()
+
+    keys = ["controller_%d" % i for i in range(5)]
+    for key in keys:
+        poller.async_register(key, refresh, 10)
+    tasks = [hass.async_create_task(poller._async_fire(key)) for key in keys]
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert max(peak) == 2
+
+    # A refresh still running is skipped instead of queued again
+    await poller._async_fire(keys[0])
+    release.set()
+    await asyncio.gather(*tasks)
+    assert len(peak) == 5
+    for key in keys:
+        poller._async_unregister(key)
@@ -0,0 +1,82 @@
+"""Tests for the profile service."""
+import asyncio
+import os
+import pstats
+import sys
+from unittest import mock
+
+from homeassistant.const import CONF_DEVICE_CLASS, CONF_DEVICE_ID, CONF_HOST, CONF_PORT
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import CONF_MAX_STALENESS, CONF_SPEED_PERCENTAGE, DOMAIN
+from custom_components.airzone.profiler import Profiler, SampleStats, collapsed
+from custom_components.airzone.session import get_session
+
+from .simulator import TcpSlave
+
+
+class _Device:
+    def update(self, profiler):
+        return profiler.stack(sys._getframe())
+
+
+def test_stack_labels_integration_frames():
+    """Test only the stacks running the integration are kept and labeled."""
+    profiler = Profiler()
+    assert _Device().update(profiler) is None
+    # Run as if it was a module of the integration
+    with mock.patch("custom_components.airzone.profiler.PACKAGE_DIR", os.path.dirname(__file__)):
+        stack = _Device().update(profiler)
+    assert stack[-2] == ("~", 0, "[update]")
+    assert stack[-1][2] == "update"
+
+
+def test_sample_formats():
+    """Test the samples convert to collapsed stacks and pstats."""
+    root, update, leaf = ("a.py", 1, "refresh"), ("~", 0, "[update]"), ("b.py", 5, "read")
+    samples = {(root, update, leaf): 3, (root,): 1}
+    assert collapsed(samples) == "refresh (a.py:1) 1\nrefresh (a.py:1);[update];read (b.py:5) 3\n"
+    stats = pstats.Stats(SampleStats(samples, 0.01)).stats
+    assert stats[root][:4] == (4, 4, 0.01, 0.04)
+    assert stats[leaf][:4] == (3, 3, 0.03, 0.03)
+    assert stats[leaf][4] == {update: (3, 3, 0.03, 0.03)}
+
+
+async def test_profile_service(hass, socket_enabled, tmp_path):
+    """Test the service profiles the next refreshes of an entry."""
+    hass.config.config_dir = str(tmp_path)
+    with TcpSlave({4: 1, 9: 0b11}) as slave:
+        config = {
+            CONF_HOST: "127.0.0.1",
+            CONF_PORT: slave.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: "innobus",
+            CONF_SPEED_PERCENTAGE: False,
+        }
+        entry = MockConfigEntry(domain=DOMAIN, data=config, options={CONF_MAX_STALENESS: 0})
+        entry.add_to_hass(hass)
+        with patch("airzone.protocol.time.sleep"):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        session._unregister_poll()
+
+        with patch("custom_components.airzone.profiler.PROFILE_INTERVAL", 0.0005):
+            call = hass.async_create_task(hass.services.async_call(
+                DOMAIN, "profile", {"config_entry": entry.entry_id, "cycles": 3, "format": "pstats"},
+                blocking=True, return_response=True))
+            await asyncio.sleep(0)
+            for _ in range(3):
+                assert not call.done()
+                for device in session.devices:
+                    device._snapshot.invalidate()
+                await session.async_refresh()
+            response = await call
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+    assert response["path"].startswith(str(tmp_path / "airzone_profiles"))
+    assert response["samples"] > 0
+    stats = pstats.Stats(response["path"]).stats
+    assert ("~", 0, "[update]") in stats
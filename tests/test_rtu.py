@@ -0,0 +1,58 @@
+"""Tests for the Modbus RTU serial transport."""
+import pytest
+
+from custom_components.airzone.rtu import (
+    ModbusRtuError,
+    SerialModbusClient,
+    crc16,
+    frame_timing,
+)
+
+from .simulator import RtuSlave
+
+
+def test_crc():
+    """Test the CRC matches the spec example."""
+    assert crc16(bytes.fromhex("01030000000a")) == 0xCDC5
+
+
+def test_frame_timing():
+    """Test the inter frame silence follows the baud rate up to 19200."""
+    assert frame_timing(9600)[1] == pytest.approx(3.5 * 11 / 9600)
+    assert frame_timing(115200) == (0.00075, 0.00175)
+
+
+def test_read_and_write_registers():
+    """Test registers are read and written through the pty slave."""
+    with RtuSlave({0: 3, 1: 210, 2: 1}, device_id=2) as slave:
+        client = SerialModbusClient(slave.port, 19200, probe_id=2)
+        client.connect()
+        assert client.read_input_registers(0, 3, device_id=2).registers == [3, 210, 1]
+        assert client.write_register(1, 225, device_id=2).registers == [225]
+        assert slave.registers[1] == 225
+        with pytest.raises(ModbusRtuError):
+            client.read_input_registers(5, 1, device_id=2)
+        client.close()
+
+
+def test_detect_baudrate():
+    """Test the baud rate of the bus is found by probing the device."""
+    with RtuSlave({0: 1}, baudrate=38400) as slave:
+        client = SerialModbusClient(slave.port, timeout=0.05)
+        client.connect()
+        assert client.baudrate == 38400
+        assert client.read_input_registers(0, 1, device_id=1).registers == [1]
+        client.close()
+
+
+def test_inter_frame_silence():
+    """Test back to back requests keep the 3.5 character silence."""
+    with RtuSlave({0: 1, 1: 2}, baudrate=9600) as slave:
+        client = SerialModbusClient(slave.port, 9600)
+        client.connect()
+        for _ in range(5):
+            client.read_input_registers(0, 2, device_id=1)
+        client.close()
+        times = [t for t, _ in slave.requests]
+        _, silence = frame_timing(9600)
+        assert min(b - a for a, b in zip(times, times[1:])) >= silence
@@ -0,0 +1,77 @@
+"""Tests for the runtime accounting."""
+from unittest import mock
+
+from homeassistant.components.climate import HVACAction
+import pytest
+
+from custom_components.airzone.runtime import RuntimeAccumulator, RuntimeTracker
+
+
+def test_runtime_credits_previous_action():
+    """Test the time between samples goes to the action seen first."""
+    acc = RuntimeAccumulator(window=100, max_gap=60)
+    acc.sample(HVACAction.HEATING, 0)
+    acc.sample(HVACAction.COOLING, 10)
+    acc.sample(HVACAction.IDLE, 30)
+    acc.sample(HVACAction.HEATING, 40)
+    # A gap over max_gap is not credited
+    acc.sample(HVACAction.HEATING, 200)
+    assert acc.runtime == {HVACAction.HEATING: 10, HVACAction.COOLING: 20}
+
+
+def test_duty_cycle_tracks_active_share():
+    """Test the duty cycle converges to the active share of the time."""
+    acc = RuntimeAccumulator(window=100, max_gap=60)
+    for second in range(0, 2000, 10):
+        acc.sample(HVACAction.HEATING if second % 20 else HVACAction.IDLE, second)
+    assert acc.duty_cycle == pytest.approx(50, abs=5)
+
+
+def _device(unique_id, action):
+    return mock.MagicMock(unique_id=unique_id, hvac_action=action)
+
+
+async def test_tracker_restores_and_saves(hass, hass_storage):
+    """Test the totals survive a restart of the tracker."""
+    clock = mock.MagicMock(return_value=0)
+    tracker = RuntimeTracker(hass, "10.0.0.1:502:1", clock)
+    await tracker.async_load()
+    devices = [_device("zone_1", HVACAction.HEATING), _device("zone_2", HVACAction.IDLE)]
+    listener = mock.MagicMock()
+    tracker.async_add_listener(listener)
+
+    tracker.async_sample(devices)
+    clock.return_value = 10
+    tracker.async_sample(devices)
+
+    assert tracker.get("zone_1").runtime[HVACAction.HEATING] == 10
+    assert tracker.get("zone_2").runtime[HVACAction.HEATING] == 0
+    assert tracker.get(tracker.machine_key).runtime[HVACAction.HEATING] == 10
+    assert listener.call_count == 2
+
+    await tracker.async_save()
+    restored = RuntimeTracker(hass, "10.0.0.1:502:1", clock)
+    await restored.async_load()
+    assert restored.get("zone_1").runtime[HVACAction.HEATING] == 10
+
+
+async def test_tracker_skips_unavailable(hass, hass_storage):
+    """Test an outage is not credited to the last known action."""
+    clock = mock.MagicMock(return_value=0)
+    tracker = RuntimeTracker(hass, "10.0.0.1:502:1", clock)
+    await tracker.async_load()
+    zone = _device("zone_1", HVACAction.HEATING)
+
+    tracker.async_sample([zone])
+    zone.available = False
+    for second in (10, 20):
+        clock.return_value = second
+        tracker.async_sample([zone])
+    zone.available = True
+    clock.return_value = 30
+    tracker.async_sample([zone])
+    clock.return_value = 40
+    tracker.async_sample([zone])
+
+    assert tracker.get("zone_1").runtime[HVACAction.HEATING] == 10
+    assert tracker.get(tracker.machine_key).runtime[HVACAction.HEATING] == 10
@@ -0,0 +1,104 @@
+"""Tests for the zone schedules."""
+from datetime import datetime
+import time
+from unittest import mock
+
+from homeassistant.components.climate import HVACMode
+from homeassistant.const import ATTR_TEMPERATURE
+import homeassistant.util.dt as dt_util
+
+from custom_components.airzone.const import DATA_SESSIONS, DOMAIN
+from custom_components.airzone.schedule import (
+    ScheduleEngine,
+    _apply,
+    next_occurrence,
+    previous_occurrence,
+    transition_from_dict,
+)
+from custom_components.airzone.ratelimit import TokenBucket
+from custom_components.airzone.scheduler import PRIORITY_COMMAND, RequestScheduler
+
+WEEKDAYS_ONLY = ["mon", "tue", "wed", "thu", "fri"]
+
+
+def _transition(at, temperature=None, weekdays=WEEKDAYS_ONLY, hvac_mode=None):
+    data = {"at": at, "weekdays": weekdays, ATTR_TEMPERATURE: temperature}
+    if hvac_mode is not None:
+        data["hvac_mode"] = hvac_mode
+    return transition_from_dict(data)
+
+
+def test_occurrences_follow_weekdays():
+    """Test the next and previous occurrences skip the other days."""
+    transition = _transition("07:00", 21)
+    friday_evening = datetime(2024, 3, 8, 20, 0)
+    assert next_occurrence(transition, friday_evening) == datetime(2024, 3, 11, 7, 0)
+    assert previous_occurrence(transition, friday_evening) == datetime(2024, 3, 8, 7, 0)
+    sunday = datetime(2024, 3, 10, 12, 0)
+    assert previous_occurrence(transition, sunday) == datetime(2024, 3, 8, 7, 0)
+
+
+def _session(key, *entity_ids):
+    session = mock.MagicMock(key=key, scheduler=RequestScheduler(key))
+    session.devices = [mock.MagicMock(entity_id=entity_id) for entity_id in entity_ids]
+    return session
+
+
+async def test_due_transitions_batched_per_controller(hass):
+    """Test the transitions of the same moment are written in one batch per controller."""
+    first = _session("first", "climate.zone_1", "climate.zone_2")
+    second = _session("second", "climate.zone_3")
+    hass.data.setdefault(DOMAIN, {})[DATA_SESSIONS] = {"first": first, "second": second}
+    engine = ScheduleEngine(hass)
+
+    now = dt_util.now().replace(second=0, microsecond=0)
+    at = now.strftime("%H:%M")
+    every_day = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+    engine.schedules = {
+        "climate.zone_1": [_transition(at, 21, every_day)],
+        "climate.zone_2": [_transition(at, 22, every_day, HVACMode.HEAT)],
+        "climate.zone_3": [_transition(at, 23, every_day)],
+    }
+    with mock.patch("custom_components.airzone.schedule._apply") as m_apply:
+        await engine.async_reapply(first)
+        await engine.async_reapply(second)
+
+    assert m_apply.call_count == 2
+    batch = m_apply.call_args_list[0].args[0]
+    assert [device.entity_id for device, _ in batch] == ["climate.zone_1", "climate.zone_2"]
+    _apply(batch)
+    first.devices[0].set_temperature.assert_called_once_with(temperature=21)
+    first.devices[1].set_hvac_mode.assert_called_once_with(HVACMode.HEAT)
+
+
+def test_nested_runs_join_the_transaction():
+    """Test commands sent from inside a transaction do not wait for it."""
+    scheduler = RequestScheduler()
+    assert scheduler.run(0, lambda: scheduler.run(0, lambda: 42)) == 42
+
+
+def test_failing_zone_does_not_stop_the_batch():
+    """Test the other zones of a batch are written when one fails."""
+    failing, other = mock.MagicMock(), mock.MagicMock()
+    failing.set_temperature.side_effect = ConnectionError
+    transition = _transition("07:00", 21)
+    _apply([(failing, transition), (other, transition)])
+    other.set_temperature.assert_called_once_with(temperature=21)
+
+
+async def test_batch_respects_the_frame_gap(hass):
+    """Test every write of a batch waits the frame gap like a user command."""
+    session = _session("first", *(f"climate.zone_{index}" for index in range(4)))
+    session.scheduler.limiter = TokenBucket(min_gap=0.05)
+    hass.data.setdefault(DOMAIN, {})[DATA_SESSIONS] = {"first": session}
+    sent = []
+    for device in session.devices:
+        device.set_temperature.side_effect = lambda **kwargs: session.scheduler.run(
+            PRIORITY_COMMAND, lambda: sent.append(time.monotonic()))
+
+    transition = _transition("07:00", 21)
+    await ScheduleEngine(hass)._async_write(
+        {device.entity_id: transition for device in session.devices})
+    assert len(sent) == 4
+    assert all(later - earlier >= 0.045 for earlier, later in zip(sent, sent[1:]))
+    assert session.scheduler.throttled == 3
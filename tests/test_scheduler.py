@@ -0,0 +1,126 @@
+"""Tests for the request scheduler."""
+import threading
+import time
+
+from custom_components.airzone.ratelimit import TokenBucket
+from custom_components.airzone.scheduler import (
+    PRIORITY_COMMAND,
+    PRIORITY_METADATA,
+    PRIORITY_POLL,
+    RequestScheduler,
+    throttle,
+)
+
+
+def _wait_for_depth(scheduler, depth):
+    deadline = time.monotonic() + 2
+    while scheduler.queue_depth < depth and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_command_preempts_queued_polls():
+    """A command waits only for the transaction in flight."""
+    scheduler = RequestScheduler()
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def block():
+        started.set()
+        release.wait()
+
+    in_flight = threading.Thread(target=scheduler.run, args=(PRIORITY_POLL, block))
+    in_flight.start()
+    started.wait(2)
+
+    threads = []
+    for priority, name in [(PRIORITY_METADATA, "metadata"),
+                           (PRIORITY_POLL, "poll"),
+                           (PRIORITY_COMMAND, "command")]:
+        thread = threading.Thread(
+            target=scheduler.run, args=(priority, order.append, name))
+        thread.start()
+        threads.append(thread)
+        _wait_for_depth(scheduler, len(threads))
+
+    assert scheduler.queue_depth == 3
+    release.set()
+    for thread in [in_flight] + threads:
+        thread.join(2)
+
+    assert order == ["command", "poll", "metadata"]
+    assert scheduler.queue_depth == 0
+
+
+def test_run_returns_result_and_propagates_errors():
+    """Run behaves like a direct call."""
+    scheduler = RequestScheduler()
+    assert scheduler.run(PRIORITY_POLL, lambda a, b: a + b, 1, b=2) == 3
+
+    def fail():
+        raise ValueError
+
+    try:
+        scheduler.run(PRIORITY_COMMAND, fail)
+    except ValueError:
+        pass
+    assert scheduler.run(PRIORITY_POLL, lambda: "free") == "free"
+
+
+class FakeClock:
+    """Monotonic clock moved by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_rate():
+    """The burst is served at once, then one token per 1/rate seconds."""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    for _ in range(3):
+        assert bucket.delay() == 0
+        bucket.consume()
+    assert bucket.delay() == 0.5
+    clock.now += 0.5
+    assert bucket.delay() == 0
+
+
+def test_token_bucket_enforces_frame_gap():
+    """Consecutive transactions are at least the gap apart."""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0, min_gap=0.02, clock=clock)
+    bucket.consume()
+    assert bucket.delay() == 0.02
+    clock.now += 0.05
+    assert bucket.delay() == 0
+
+
+def test_throttled_requests_are_queued():
+    """Requests over the limit wait for their turn instead of failing."""
+    scheduler = RequestScheduler(limiter=TokenBucket(rate=100, burst=1))
+    results = [scheduler.run(PRIORITY_POLL, lambda i=i: i) for i in range(3)]
+    assert results == [0, 1, 2]
+    assert scheduler.throttled >= 1
+    assert scheduler.diagnostics()["queue_depth"] == 0
+
+
+def test_throttle_counts_requests_of_the_transaction():
+    """Each extra request of a transaction waits for the rate limit."""
+    scheduler = RequestScheduler(limiter=TokenBucket(rate=20, burst=1))
+
+    def probes():
+        for _ in range(3):
+            throttle()
+
+    start = time.monotonic()
+    scheduler.run(PRIORITY_METADATA, probes)
+    # The transaction and its three requests, 20 per second
+    assert time.monotonic() - start >= 0.14
+    assert scheduler.throttled == 3
+    # Outside of a transaction it does nothing
+    throttle()
+    assert scheduler.throttled == 3
@@ -0,0 +1,171 @@
+"""Tests for the shared controller sessions."""
+import asyncio
+import time
+from unittest import mock
+
+from homeassistant.const import (
+    CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_SCAN_INTERVAL,
+    CONF_TIMEOUT,
+)
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_MAX_STALENESS,
+    CONF_RETRIES,
+    CONF_SPEED_PERCENTAGE,
+    DATA_SESSIONS,
+    DOMAIN,
+)
+from custom_components.airzone.session import (
+    async_acquire_session,
+    async_release_session,
+    get_session,
+)
+
+from .simulator import TcpSlave
+
+CONFIG = {
+    CONF_HOST: "192.168.1.10",
+    CONF_PORT: 5020,
+    CONF_DEVICE_ID: 1,
+    CONF_DEVICE_CLASS: "aidoo",
+    CONF_SPEED_PERCENTAGE: False,
+}
+
+
+@patch("custom_components.airzone.aidoo.airzone_factory")
+async def test_owners_share_one_session(m_airzone_factory, hass):
+    """Test several owners of a controller share one connection."""
+    m_airzone_factory.return_value = mock.MagicMock()
+
+    first = await async_acquire_session(hass, CONFIG, "entry_1")
+    second = await async_acquire_session(hass, dict(CONFIG), "yaml")
+
+    assert first is second
+    assert m_airzone_factory.call_count == 1
+    assert first.owners == {"entry_1", "yaml"}
+
+    await async_release_session(hass, CONFIG, "entry_1")
+    assert hass.data[DOMAIN][DATA_SESSIONS]
+    m_airzone_factory.return_value._gateway.client.close.assert_not_called()
+
+    await async_release_session(hass, CONFIG, "yaml")
+    assert not hass.data[DOMAIN][DATA_SESSIONS]
+    m_airzone_factory.return_value._gateway.client.close.assert_called_once()
+
+
+@patch("custom_components.airzone.aidoo.airzone_factory")
+async def test_other_device_gets_its_own_session(m_airzone_factory, hass):
+    """Test different slaves on one gateway share only the scheduler."""
+    m_airzone_factory.side_effect = [mock.MagicMock(), mock.MagicMock()]
+
+    first = await async_acquire_session(hass, CONFIG, "entry_1")
+    second = await async_acquire_session(hass, {**CONFIG, CONF_DEVICE_ID: 2}, "entry_2")
+
+    assert first is not second
+    assert first.scheduler is second.scheduler
+
+    await async_release_session(hass, CONFIG, "entry_1")
+    await async_release_session(hass, {**CONFIG, CONF_DEVICE_ID: 2}, "entry_2")
+
+
+@patch("custom_components.airzone.aidoo.airzone_factory")
+async def test_options_apply_without_reconnecting(m_airzone_factory, hass):
+    """Test changed options reach the running session and gateway."""
+    machine = mock.MagicMock()
+    machine._gateway.client = mock.MagicMock(spec=["set_timeout", "close"])
+    m_airzone_factory.return_value = machine
+    session = await async_acquire_session(hass, CONFIG, "entry_1")
+    device = mock.MagicMock()
+    session.devices = [device]
+
+    options = {**CONFIG, CONF_SCAN_INTERVAL: 30, CONF_TIMEOUT: 1.5, CONF_RETRIES: 2}
+    await session.async_apply_options(options)
+
+    assert m_airzone_factory.call_count == 1
+    assert session.scan_interval == 30
+    machine._gateway.client.set_timeout.assert_called_once_with(1.5)
+    device.configure_refresh.assert_called_once_with(options)
+
+    await async_release_session(hass, CONFIG, "entry_1")
+
+
+async def test_controllers_discovered_concurrently(hass):
+    """Test startup takes the slowest discovery, a dead one fails alone."""
+    def factory(config):
+        time.sleep(2 if config[CONF_HOST] == "dead" else 0.3)
+        return mock.MagicMock()
+
+    configs = [{**CONFIG, CONF_HOST: f"192.168.1.{n}"} for n in range(4)]
+    with patch("custom_components.airzone.aidoo.airzone_factory") as m_airzone_factory, \
+            patch("custom_components.airzone.session.DISCOVERY_TIMEOUT", 1):
+        m_airzone_factory.side_effect = lambda host, *args, **kwargs: factory({CONF_HOST: host})
+        start = time.monotonic()
+        results = await asyncio.gather(
+            async_acquire_session(hass, {**CONFIG, CONF_HOST: "dead"}, "dead"),
+            *[async_acquire_session(hass, config, str(n)) for n, config in enumerate(configs)],
+            return_exceptions=True)
+        elapsed = time.monotonic() - start
+
+    assert isinstance(results[0], TimeoutError)
+    assert len(hass.data[DOMAIN][DATA_SESSIONS]) == len(configs)
+    # Set by the dead controller timing out, not by the sum of the others
+    assert elapsed == pytest.approx(1, abs=0.5)
+
+    for n, config in enumerate(configs):
+        await async_release_session(hass, config, str(n))
+
+
+async def test_late_discovery_closed(hass):
+    """Test a machine built after its discovery timed out is closed."""
+    machine = mock.MagicMock()
+
+    def factory(*args, **kwargs):
+        time.sleep(0.3)
+        return machine
+
+    with patch("custom_components.airzone.aidoo.airzone_factory", side_effect=factory), \
+            patch("custom_components.airzone.session.DISCOVERY_TIMEOUT", 0.1):
+        with pytest.raises(TimeoutError):
+            await async_acquire_session(hass, CONFIG, "entry_1")
+        await asyncio.sleep(0.5)
+        await hass.async_block_till_done()
+
+    machine._gateway.client.close.assert_called_once()
+    assert not hass.data[DOMAIN][DATA_SESSIONS]
+
+
+async def test_entries_sharing_a_session_add_entities_once(hass, socket_enabled, caplog):
+    """Test a second entry of the controller creates no duplicated entities."""
+    with TcpSlave({4: 1, 9: 0b11}) as slave:
+        config = {
+            CONF_HOST: "127.0.0.1",
+            CONF_PORT: slave.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: "innobus",
+            CONF_SPEED_PERCENTAGE: False,
+        }
+        entries = [
+            MockConfigEntry(domain=DOMAIN, data=config, options={CONF_MAX_STALENESS: 0})
+            for _ in range(2)]
+        with patch("airzone.protocol.time.sleep"):
+            for entry in entries:
+                entry.add_to_hass(hass)
+                assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entries[0].options})
+        session._unregister_poll()
+
+        assert session.devices_owner == entries[0].entry_id
+        assert hass.states.async_entity_ids("sensor")
+        assert "does not generate unique IDs" not in caplog.text
+        assert len(hass.states.async_entity_ids("climate")) == len(session.devices)
+
+        for entry in entries:
+            assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
@@ -0,0 +1,82 @@
+"""Tests for the columnar zone store."""
+from unittest import mock
+
+from homeassistant.components.climate import HVACAction
+from homeassistant.const import UnitOfTemperature
+import pytest
+
+from custom_components.airzone.const import BUILDING
+from custom_components.airzone.store import ZoneStore
+
+
+def test_aggregates_follow_updates():
+    """Test floor and building aggregates are kept on every update."""
+    store = ZoneStore()
+    store.set("zone_1", "ground", 20.0, True)
+    store.set("zone_2", "ground", 22.0, False)
+    store.set("zone_3", "first", 25.0, True)
+
+    assert store.average_temperature("ground") == pytest.approx(21)
+    assert store.average_temperature() == pytest.approx(67 / 3)
+    assert store.demanding() == 2
+
+    store.set("zone_1", "ground", 21.0, False)
+    store.set("zone_3", "first", None, True)
+    assert store.average_temperature("ground") == pytest.approx(21.5)
+    assert store.average_temperature("first") is None
+    assert store.demanding(BUILDING) == 1
+    assert store.zones("first") == 1
+
+    store.remove("zone_3")
+    assert store.zones() == 2
+    assert store.zones("first") == 0
+    # The free row is reused
+    store.set("zone_4", "first", 19.0, False)
+    assert len(store.temperature) == 3
+
+
+def test_update_from_devices():
+    """Test only the devices reporting an hvac action are stored."""
+    store = ZoneStore()
+    listener = mock.MagicMock()
+    store.async_add_listener(listener)
+    devices = [
+        mock.MagicMock(unique_id="zone_1", hvac_action=HVACAction.HEATING, current_temperature=20),
+        mock.MagicMock(unique_id="machine", hvac_action=None),
+    ]
+    store.async_update("ground", devices)
+    assert store.zones() == 1
+    assert store.demanding("ground") == 1
+    listener.assert_called_once_with({BUILDING, "ground"})
+
+
+def test_unavailable_zone_left_out():
+    """Test a zone not reporting is left out until it reports again."""
+    store = ZoneStore()
+    zone = mock.MagicMock(unique_id="zone_1", hvac_action=HVACAction.HEATING, current_temperature=20)
+    other = mock.MagicMock(unique_id="zone_2", hvac_action=HVACAction.IDLE, current_temperature=24)
+    store.async_update("ground", [zone, other])
+    assert store.average_temperature("ground") == pytest.approx(22)
+
+    zone.available = False
+    store.async_update("ground", [zone, other])
+    assert store.average_temperature("ground") == pytest.approx(24)
+    assert store.demanding() == 0
+    assert store.zones("ground") == 1
+
+    zone.available = True
+    store.async_update("ground", [zone, other])
+    assert store.average_temperature("ground") == pytest.approx(22)
+    assert store.demanding() == 1
+    assert store.zones("ground") == 2
+
+
+def test_fahrenheit_zones_converted():
+    """Test the zones reporting in Fahrenheit are averaged in Celsius."""
+    store = ZoneStore()
+    celsius = mock.MagicMock(unique_id="zone_1", hvac_action=HVACAction.IDLE,
+                             current_temperature=20, temperature_unit=UnitOfTemperature.CELSIUS)
+    fahrenheit = mock.MagicMock(unique_id="zone_2", hvac_action=HVACAction.IDLE,
+                                current_temperature=75.2, temperature_unit=UnitOfTemperature.FAHRENHEIT)
+    store.async_update("ground", [celsius, fahrenheit])
+    assert store.average_temperature("ground") == pytest.approx(22)
@@ -0,0 +1,102 @@
+"""Tests for the telemetry log."""
+import os
+
+from homeassistant.const import CONF_DEVICE_CLASS, CONF_DEVICE_ID, CONF_HOST, CONF_PORT
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_LAST_DEVICE_ID,
+    CONF_SPEED_PERCENTAGE,
+    CONF_TELEMETRY,
+    CONF_TEMPERATURE_DEADBAND,
+    DOMAIN,
+)
+from custom_components.airzone.session import get_session
+from custom_components.airzone.telemetry import TelemetryLog, decode
+
+from .simulator import TcpSlave
+
+
+def _read(log):
+    records = []
+    for path in log.files():
+        with open(path, encoding="utf-8") as file:
+            records.extend(decode(file))
+    return records
+
+
+def test_log_round_trip(tmp_path):
+    """Test the deltas decode back to the snapshots written."""
+    log = TelemetryLog(str(tmp_path), max_size=10 ** 6, max_age=3600, clock=lambda: 0)
+    records = [
+        (1.0, {"1": {"temperature": 21.0, "hvac_mode": "cool"}}),
+        (2.0, {"1": {"temperature": 21.0, "hvac_mode": "cool"}}),
+        (3.0, {"1": {"temperature": 21.5}, "2": {"temperature": 19.0}}),
+    ]
+    log.write(records)
+    log.close()
+    assert _read(log) == records
+
+    with open(log.files()[0], encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    # Only the keyframe carries the unchanged fields
+    assert lines[1] == '{"t":2.0,"e":{}}'
+    assert lines[2] == '{"t":3.0,"e":{"1":{"temperature":21.5,"hvac_mode":null},"2":{"temperature":19.0}}}'
+
+
+def test_log_rotation_and_retention(tmp_path):
+    """Test rotated files decode on their own and the oldest are pruned."""
+    now = [0.0]
+    log = TelemetryLog(
+        str(tmp_path), max_size=400, max_age=3600, file_size=100, clock=lambda: now[0])
+    for when in range(1, 21):
+        log.write([(float(when), {"1": {"temperature": 20.0 + when}})])
+    log.close()
+    files = log.files()
+    assert len(files) > 1
+    assert sum(os.path.getsize(path) for path in files) <= 400 + 100
+    records = _read(log)
+    assert records[-1] == (20.0, {"1": {"temperature": 40.0}})
+    assert [when for when, _ in records] == sorted(when for when, _ in records)
+
+    # Everything older than max_age goes on the next rotation
+    now[0] = os.path.getmtime(files[-1]) + 3601
+    log.write([(100.0, {"1": {"temperature": 20.0}})])
+    log.close()
+    assert _read(log) == [(100.0, {"1": {"temperature": 20.0}})]
+
+
+async def test_session_records_refreshes(hass, socket_enabled, tmp_path):
+    """Test the raw values of every refresh end up in the log."""
+    hass.config.config_dir = str(tmp_path)
+    with TcpSlave({0: 1, 1: 220, 2: 210, 3: 2}, device_ids=(3,)) as slave:
+        config = {
+            CONF_HOST: "127.0.0.1",
+            CONF_PORT: slave.port,
+            CONF_DEVICE_ID: 3,
+            CONF_DEVICE_CLASS: "aidoo",
+            CONF_SPEED_PERCENTAGE: False,
+            CONF_LAST_DEVICE_ID: 3,
+        }
+        entry = MockConfigEntry(
+            domain=DOMAIN, data=config,
+            options={CONF_TELEMETRY: True, CONF_TEMPERATURE_DEADBAND: 0.5})
+        entry.add_to_hass(hass)
+        with patch("airzone.protocol.time.sleep"):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        session._unregister_poll()
+        for temperature in (210, 212):
+            slave.registers[2] = temperature
+            session.devices[0]._snapshot.invalidate()
+            await session.async_refresh()
+        log = session.telemetry.log
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+    temperatures = [
+        next(iter(snapshot.values())).get("temperature") for _, snapshot in _read(log)]
+    # Raw, the deadband would have held back the 0.2 change
+    assert temperatures[-2:] == [21.0, 21.2]
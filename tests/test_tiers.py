@@ -0,0 +1,43 @@
+"""Tests for the tiered refresh tracker."""
+from custom_components.airzone.const import (
+    INNOBUS_ZONE_BLOCKS,
+    TIER_FAST,
+    TIER_MEDIUM,
+    TIER_SLOW,
+)
+from custom_components.airzone.tiers import TierTracker, merge_block
+
+
+def test_first_plan_reads_the_whole_map():
+    """Nothing has been read yet, so the slow block covers every tier."""
+    tracker = TierTracker(INNOBUS_ZONE_BLOCKS)
+    tiers, blocks = tracker.plan(now=0)
+    assert tiers == [TIER_FAST, TIER_MEDIUM, TIER_SLOW]
+    assert blocks == [(0, 13)]
+
+
+def test_only_due_tiers_are_read():
+    """Each tier is read on its own interval."""
+    tracker = TierTracker(
+        INNOBUS_ZONE_BLOCKS, {TIER_FAST: 0, TIER_MEDIUM: 60, TIER_SLOW: 3600})
+    tracker.mark_done(*tracker.plan(now=0)[:1], now=0)
+
+    assert tracker.plan(now=10) == ([TIER_FAST], [(9, 2)])
+    assert tracker.plan(now=60) == ([TIER_FAST, TIER_MEDIUM], [(9, 2), (0, 4)])
+    assert tracker.plan(now=3600)[1] == [(0, 13)]
+
+
+def test_invalidate_forces_a_read():
+    """A command makes its tiers due again."""
+    tracker = TierTracker(INNOBUS_ZONE_BLOCKS)
+    tracker.mark_done([TIER_FAST, TIER_MEDIUM, TIER_SLOW], now=0)
+    tracker.invalidate(TIER_MEDIUM)
+    assert tracker.plan(now=1) == ([TIER_FAST, TIER_MEDIUM], [(9, 2), (0, 4)])
+
+
+def test_merge_block():
+    """Blocks are merged into a copy of the state."""
+    state = [0] * 4
+    assert merge_block(state, 1, [5, 6]) == [0, 5, 6, 0]
+    assert state == [0] * 4
+    assert merge_block(None, 2, [1]) == [0, 0, 1]
@@ -0,0 +1,78 @@
+"""Tests for the websocket snapshot and subscription."""
+from homeassistant.const import CONF_DEVICE_CLASS, CONF_DEVICE_ID, CONF_HOST, CONF_PORT
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_LAST_DEVICE_ID,
+    CONF_SPEED_PERCENTAGE,
+    DOMAIN,
+    WS_TYPE_SNAPSHOT,
+    WS_TYPE_SUBSCRIBE,
+)
+from custom_components.airzone.session import get_session
+from custom_components.airzone.websocket import state_delta
+
+from .simulator import TcpSlave
+
+
+def test_state_delta():
+    """Test only the changed and removed fields are in the delta."""
+    old = {"state": "cool", "current_temperature": 21.0, "fan_mode": "2"}
+    new = {"state": "cool", "current_temperature": 21.5}
+    assert state_delta(old, new) == {"current_temperature": 21.5, "fan_mode": None}
+    assert state_delta(old, old) == {}
+    assert state_delta(None, new) == new
+
+
+async def _refresh(session):
+    for device in session.devices:
+        device._snapshot.invalidate()
+    await session.async_refresh()
+
+
+async def test_snapshot_and_deltas(hass, hass_ws_client, socket_enabled):
+    """Test the snapshot has every unit and a refresh sends one delta."""
+    with TcpSlave({0: 1, 1: 220, 2: 210, 3: 2}, device_ids=(3, 5)) as slave:
+        config = {
+            CONF_HOST: "127.0.0.1",
+            CONF_PORT: slave.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: "aidoo",
+            CONF_SPEED_PERCENTAGE: False,
+            CONF_LAST_DEVICE_ID: 5,
+        }
+        entry = MockConfigEntry(domain=DOMAIN, data=config)
+        entry.add_to_hass(hass)
+        with patch("airzone.protocol.time.sleep"):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, config)
+        session._unregister_poll()
+        await _refresh(session)
+        entity_ids = [device.entity_id for device in session.devices]
+
+        client = await hass_ws_client(hass)
+        await client.send_json({"id": 1, "type": WS_TYPE_SNAPSHOT})
+        result = await client.receive_json()
+        assert result["success"]
+        controller = result["result"]["controllers"][session.key]
+        assert list(controller["entities"]) == entity_ids
+        assert controller["entities"][entity_ids[0]]["current_temperature"] == 21
+
+        await client.send_json({"id": 2, "type": WS_TYPE_SUBSCRIBE})
+        assert (await client.receive_json())["success"]
+        event = await client.receive_json()
+        assert event["event"]["controllers"][session.key] == controller
+
+        # Nothing changed, nothing is sent
+        await _refresh(session)
+        slave.registers[2] = 235
+        await _refresh(session)
+        event = await client.receive_json()
+        assert event["event"] == {
+            "controller": session.key,
+            "changed": {entity_id: {"current_temperature": 23.5} for entity_id in entity_ids},
+        }
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
@@ -0,0 +1,93 @@
+"""Tests for the Modbus transport running in a worker subprocess."""
+from homeassistant.const import (
+    CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TIMEOUT,
+)
+from pytest_homeassistant_custom_component.common import MockConfigEntry, patch
+
+from custom_components.airzone.const import (
+    CONF_MAX_STALENESS,
+    CONF_SPEED_PERCENTAGE,
+    CONF_WORKER,
+    DOMAIN,
+)
+from custom_components.airzone.aidoo import _connect
+from custom_components.airzone.session import _client, get_session
+from custom_components.airzone.worker import WorkerModbusClient
+
+from .simulator import TcpSlave
+
+
+async def _refresh(session):
+    for device in session.devices:
+        device._snapshot.invalidate()
+    await session.async_refresh()
+
+
+async def test_worker_pass_in_one_exchange(hass, socket_enabled):
+    """Test a refresh pass reads every block in one exchange with the worker."""
+    with TcpSlave({4: 1, 9: 0b11, 256 + 10: 215}) as slave:
+        config = {
+            CONF_HOST: '127.0.0.1',
+            CONF_PORT: slave.port,
+            CONF_DEVICE_ID: 1,
+            CONF_DEVICE_CLASS: 'innobus',
+            CONF_SPEED_PERCENTAGE: False,
+            CONF_WORKER: True,
+        }
+        entry = MockConfigEntry(
+            domain=DOMAIN, data=config, options={CONF_TIMEOUT: 0.5, CONF_MAX_STALENESS: 0})
+        entry.add_to_hass(hass)
+        with patch('airzone.protocol.time.sleep'):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        session = get_session(hass, {**config, **entry.options})
+        session._unregister_poll()
+        client = _client(session.machine)
+        assert isinstance(client, WorkerModbusClient)
+        zone = session.devices[1]
+
+        exchanges, requests = client.exchanges, slave.requests
+        await _refresh(session)
+        assert client.exchanges == exchanges + 1
+        # Machine and both zones, each its fast block
+        assert slave.requests == requests + 3
+        assert all(device.available for device in session.devices)
+        assert hass.states.get(zone.entity_id).attributes['current_temperature'] == 21.5
+
+        # A crashed worker makes the entities unavailable until it is back
+        client._process.kill()
+        client._process.wait()
+        await _refresh(session)
+        assert not any(device.available for device in session.devices)
+        # Started again once the restart delay passed
+        with patch('custom_components.airzone.worker.WORKER_RESTART_DELAY', 0):
+            await _refresh(session)
+        assert client.restarts == 1
+        assert all(device.available for device in session.devices)
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+        assert client._process is None
+
+
+def test_worker_keeps_unique_ids(socket_enabled):
+    """Test enabling the worker does not change the unique ids of the entities."""
+    with TcpSlave({1: 220, 2: 215}) as slave:
+        config = {
+            CONF_HOST: '127.0.0.1',
+            CONF_PORT: slave.port,
+            CONF_DEVICE_ID: 1,
+            CONF_SPEED_PERCENTAGE: False,
+        }
+        with patch('airzone.protocol.time.sleep'):
+            plain = _connect(config)
+            worker = _connect({**config, CONF_WORKER: True})
+        try:
+            assert worker.unique_id() == plain.unique_id()
+        finally:
+            _client(plain).close()
+            _client(worker).close()